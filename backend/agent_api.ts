@@ -21,6 +21,9 @@ export class AgentAPIClient {
   private appName = 'Emergensee';
   private userId: string;
   private sessionId: string | null = null;
+  // Last session fetched, kept up to date with state deltas
+  private session: any = null;
+  private stateVersion: number | null = null;
 
   constructor(userId: string) {
     this.userId = userId;
@@ -59,6 +62,8 @@ export class AgentAPIClient {
 
       const data = await response.json();
       this.sessionId = data.session_id;
+      this.session = null;
+      this.stateVersion = null;
       return data;
     } catch (error) {
       console.error('Error creating session:', error);
@@ -114,26 +119,90 @@ export class AgentAPIClient {
     }
   }
 
-  // Get session state
+  private sessionUrl() {
+    return `${ADK_API_URL}/apps/${this.appName}/users/${this.userId}/sessions/${this.sessionId}`;
+  }
+
+  // Apply changes from the state sync API (top-level keys replace)
+  private applyStateDelta(version: number, delta: Record<string, any>) {
+    Object.assign(this.session.state, delta);
+    this.stateVersion = version;
+  }
+
+  // Get session state; after the first call only the changes since the
+  // last version are fetched (nothing at all when unchanged)
   async getSessionState() {
     if (!this.sessionId) {
       throw new Error('No active session');
     }
 
     try {
-      const response = await fetch(`${ADK_API_URL}/apps/${this.appName}/users/${this.userId}/sessions/${this.sessionId}`);
+      if (this.session && this.stateVersion !== null) {
+        const changes = await fetch(`${this.sessionUrl()}/state?since=${this.stateVersion}`, {
+          headers: { 'If-None-Match': `W/"${this.stateVersion}"` }
+        });
+
+        if (changes.status === 304) {
+          return this.session;
+        }
+        if (changes.ok) {
+          const { version, delta } = await changes.json();
+          this.applyStateDelta(version, delta);
+          return this.session;
+        }
+        // 410: the changes are no longer known, fetch the whole session
+      }
+
+      const response = await fetch(this.sessionUrl());
       
       if (!response.ok) {
         throw new Error('Failed to get session state');
       }
 
-      return await response.json();
+      this.session = await response.json();
+      this.stateVersion = this.session.state?.state_version ?? 0;
+      return this.session;
     } catch (error) {
       console.error('Error getting session state:', error);
       throw error;
     }
   }
 
+  // Push instead of polling: onChange gets the session whenever its state
+  // changes. Returns a function that stops the updates
+  async subscribeSessionState(onChange: (session: any) => void): Promise<() => void> {
+    await this.getSessionState();
+    let source: EventSource;
+
+    const open = () => {
+      source = new EventSource(`${this.sessionUrl()}/state/stream?since=${this.stateVersion}`);
+      source.addEventListener('delta', (event) => {
+        const { version, delta } = JSON.parse((event as MessageEvent).data);
+        this.applyStateDelta(version, delta);
+        onChange(this.session);
+      });
+      source.addEventListener('resync', async () => {
+        source.close();
+        this.session = null;
+        try {
+          onChange(await this.getSessionState());
+          open();
+        } catch (error) {
+          console.error('Error resyncing session state:', error);
+        }
+      });
+    };
+
+    open();
+    return () => source.close();
+  }
+
+  // Get token and cost totals (overall, by agent, by stage, by model)
+  async getSessionUsage() {
+    const session = await this.getSessionState();
+    return session.state?.usage ?? null;
+  }
+
   // Get patient information based on scenario
   private getPatientInfo(moduleId: string, scenarioId: number) {
     if (moduleId === 'emergency-triage' && scenarioId === 1) {
@@ -0,0 +1,211 @@
+"""
+Browser-facing server for the emergency room agents.
+
+Run with:
+    uvicorn agent_server:app --port 8001
+"""
+import asyncio
+import itertools
+import os
+from contextlib import asynccontextmanager
+from datetime import date
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from emergency_room_agent import analytics
+from emergency_room_agent.resources import default_resources
+from emergency_room_agent.sub_agents.stt_agent import AudioIngestHub
+from emergency_room_agent.sub_agents.tts_agent import (
+    NETWORK_ENCODINGS,
+    TTSAgent,
+    negotiate_audio_encoding,
+)
+
+load_dotenv()
+
+# Voices /sessions/{session_id}/speech accepts besides the default one,
+# e.g. ER_TTS_VOICES=en-US-Neural2-D,en-US-Neural2-F
+DEFAULT_VOICES = ("en-US-Neural2-D", "en-US-Neural2-F")
+
+
+class SpeechRequest(BaseModel):
+    text: str
+    voice_name: str = None
+
+
+def _log_warm_up_error(task: asyncio.Task):
+    """Report a failed warm-up (e.g. missing default credentials) instead of dropping it"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error warming up Google clients: {task.exception()}")
+
+
+def create_app(ingest_hub: AudioIngestHub = None,
+               tts_agent: TTSAgent = None,
+               event_store: analytics.EventStore = None,
+               voices: list = None) -> FastAPI:
+    """Build the FastAPI app around shared, process-wide services."""
+    hub = ingest_hub or AudioIngestHub()
+    if event_store is None and os.getenv("ER_ANALYTICS_DIR"):
+        event_store = analytics.EventStore(os.getenv("ER_ANALYTICS_DIR"))
+    if voices is None:
+        configured = os.getenv("ER_TTS_VOICES")
+        voices = [voice.strip() for voice in configured.split(",")] if configured else list(DEFAULT_VOICES)
+    # One TTSAgent per allowed voice, created on first use
+    allowed_voices = {None, os.getenv("ER_VOICE_NAME"), *voices}
+    tts_agents = {}
+    if tts_agent:
+        allowed_voices.add(tts_agent.voice_name)
+        tts_agents[tts_agent.voice_name] = tts_agent
+    # session id -> id of the reply currently streaming to it
+    replies = {}
+    reply_ids = itertools.count(1)
+
+    async def reply_audio(session_id: str, reply_id: int, chunks):
+        """Stream a reply until it ends or a newer one for the session starts"""
+        try:
+            async for chunk in chunks:
+                if replies.get(session_id) != reply_id:
+                    break
+                yield chunk
+        finally:
+            await chunks.aclose()
+            if replies.get(session_id) == reply_id:
+                del replies[session_id]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Open the shared gRPC channels in the background so the first
+        # trainee doesn't pay for the TLS handshake
+        warm_up = asyncio.create_task(asyncio.to_thread(default_resources.warm_up))
+        warm_up.add_done_callback(_log_warm_up_error)
+        yield
+        warm_up.cancel()
+        await hub.shutdown()
+        await default_resources.release_loop()
+        default_resources.shutdown()
+
+    app = FastAPI(title="Emergency Room Agent Server", lifespan=lifespan)
+    app.state.ingest_hub = hub
+
+    @app.websocket("/ws/audio/{session_id}")
+    async def audio_ingest(
+        websocket: WebSocket,
+        session_id: str,
+        encoding: str = "linear16",
+        sample_rate: int = 16000,
+        channels: int = 1,
+    ):
+        """Stream trainee audio in (binary frames), transcripts out (JSON)."""
+        await websocket.accept()
+
+        async def on_transcript(transcript):
+            await websocket.send_json(
+                {"type": "transcript", "is_final": False, "transcript": transcript}
+            )
+
+        async def on_final(transcript):
+            await websocket.send_json(
+                {"type": "transcript", "is_final": True, "transcript": transcript}
+            )
+
+        async def on_speech_start():
+            # Lets the browser cut its own playback when the trainee barges in
+            await websocket.send_json({"type": "speech_start"})
+
+        try:
+            session = await hub.open_session(
+                session_id,
+                on_transcript,
+                on_final,
+                encoding=encoding,
+                sample_rate=sample_rate,
+                on_speech_start=on_speech_start,
+                channels=channels,
+            )
+        except (ValueError, RuntimeError) as e:
+            await websocket.close(code=1013, reason=str(e))
+            return
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await session.feed(message["bytes"])
+                elif message.get("text") == "stop":
+                    break
+        except RuntimeError as e:
+            # Recognition stream died; tell the client instead of hanging
+            print(f"Error in speech recognition for session {session_id}: {e}")
+            await websocket.close(code=1011, reason="Speech recognition failed")
+        finally:
+            try:
+                await hub.close_session(session_id)
+            except Exception as e:
+                print(f"Error in speech recognition for session {session_id}: {e}")
+
+    @app.post("/sessions/{session_id}/speech")
+    async def speech(session_id: str, body: SpeechRequest, request: Request):
+        """
+        Stream a reply as compressed audio (Ogg Opus or MP3 per the Accept
+        header, or ?encoding=ogg_opus|mp3) for playback in the browser.
+        A newer reply for the same session ends this one's stream.
+        """
+        encoding = request.query_params.get("encoding") or negotiate_audio_encoding(
+            request.headers.get("accept")
+        )
+        if encoding not in NETWORK_ENCODINGS:
+            raise HTTPException(
+                status_code=406,
+                detail=f"Supported audio types: {[t for _, t in NETWORK_ENCODINGS.values()]}",
+            )
+
+        if body.voice_name not in allowed_voices:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown voice '{body.voice_name}'. Use one of {sorted(filter(None, allowed_voices))}",
+            )
+        if body.voice_name not in tts_agents:
+            tts_agents[body.voice_name] = TTSAgent(voice_name=body.voice_name)
+        agent = tts_agents[body.voice_name]
+
+        reply_id = replies[session_id] = next(reply_ids)
+        return StreamingResponse(
+            reply_audio(session_id, reply_id, agent.stream_for_network(body.text, encoding)),
+            media_type=NETWORK_ENCODINGS[encoding][1],
+            headers={"Vary": "Accept", "Cache-Control": "no-store"},
+        )
+
+    @app.get("/ingest/stats")
+    async def ingest_stats():
+        return hub.get_stats()
+
+    def analytics_store() -> analytics.EventStore:
+        if event_store is None:
+            raise HTTPException(status_code=503, detail="Analytics disabled, set ER_ANALYTICS_DIR")
+        return event_store
+
+    @app.get("/analytics/time-to-ecg")
+    async def time_to_ecg(since: date = None):
+        """Median seconds until the ECG was ordered, per cohort"""
+        return await asyncio.to_thread(analytics.median_time_to_ecg, analytics_store(), since)
+
+    @app.get("/analytics/sbar-attempts")
+    async def sbar_attempts(cohort: str = None, since: date = None):
+        """Distribution of doctor turns needed for an approved SBAR"""
+        return await asyncio.to_thread(
+            analytics.sbar_attempt_distribution, analytics_store(), cohort, since
+        )
+
+    @app.get("/analytics/usage")
+    async def usage(since: date = None):
+        return await asyncio.to_thread(analytics.usage_by_agent, analytics_store(), since)
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,126 @@
+"""
+ADK API server (the /apps/.../sessions and /run endpoints agent_api.ts uses)
+plus incremental session state sync.
+
+Run with:
+    uvicorn api_server:app --port 8000
+
+Instead of `adk api_server`: sessions use the hibernating session service
+(ER_SESSION_SERVICE_URI), which versions session state and logs the deltas
+served by the /state routes (see emergency_room_agent/state_sync.py).
+"""
+import json
+import os
+import re
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.adk.cli.fast_api import get_fast_api_app
+
+from emergency_room_agent.state_sync import StateLog, default_state_log
+
+load_dotenv()
+
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_PATH = "/apps/{app_name}/users/{user_id}/sessions/{session_id}"
+
+
+def _etag(version: int) -> str:
+    return f'W/"{version}"'
+
+
+def _header_version(header: str) -> int:
+    """Version from an If-None-Match / Last-Event-ID header"""
+    match = re.search(r"\d+", header or "")
+    return int(match.group()) if match else None
+
+
+def _sse(kind: str, data: dict, event_id: int = None) -> str:
+    lines = [f"event: {kind}", f"data: {json.dumps(data, default=str)}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    return "\n".join(lines) + "\n\n"
+
+
+def create_app(state_log: StateLog = None, keepalive: float = 15.0) -> FastAPI:
+    """
+    Build the ADK API app with the state sync routes
+
+    Args:
+        state_log: Log filled by the session service (defaults to the
+            process-wide one)
+        keepalive: Seconds between keep-alive comments on idle streams
+    """
+    state_log = state_log or default_state_log
+    origins = os.getenv("ER_ALLOW_ORIGINS")
+    app = get_fast_api_app(
+        agents_dir=AGENTS_DIR,
+        session_service_uri=os.getenv("ER_SESSION_SERVICE_URI", "hibernate://.sessions"),
+        allow_origins=origins.split(",") if origins else None,
+        web=False,
+    )
+
+    @app.get(SESSION_PATH + "/state")
+    async def state_changes(app_name: str, user_id: str, session_id: str, request: Request, since: int = None):
+        """
+        Changes to the session state since a version (ETag / 304 aware);
+        410 when the client has to GET the full session again
+        """
+        key = (app_name, user_id, session_id)
+        # ?since= is what the client holds; If-None-Match may come from the
+        # browser cache of this URL, whose body is the delta since ?since=
+        if since is None:
+            since = _header_version(request.headers.get("if-none-match"))
+        version, delta = state_log.changes_since(key, since) if since is not None else (state_log.version(key), None)
+        if delta is None:
+            return JSONResponse(
+                status_code=410,
+                content={"detail": "State changes not available, fetch the session", "version": version},
+            )
+        headers = {"ETag": _etag(version), "Cache-Control": "no-cache"}
+        if not delta:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content={"version": version, "delta": delta}, headers=headers)
+
+    @app.get(SESSION_PATH + "/state/stream")
+    async def state_stream(app_name: str, user_id: str, session_id: str, request: Request, since: int = None):
+        """
+        Push state changes as server-sent events: a "delta" event per change
+        (id = version, so EventSource resumes from Last-Event-ID), or one
+        "resync" event when the client has to GET the full session again
+        """
+        key = (app_name, user_id, session_id)
+        # EventSource reconnects to the same URL (the original ?since=) with
+        # the id of the last event it got, which is newer
+        resumed = _header_version(request.headers.get("last-event-id"))
+        if resumed is not None:
+            since = resumed
+
+        async def events():
+            version = since
+            while not await request.is_disconnected():
+                current, delta = state_log.changes_since(key, version) if version is not None else (None, None)
+                if delta is None:
+                    yield _sse("resync", {"version": current})
+                    return
+                if delta:
+                    version = current
+                    yield _sse("delta", {"version": current, "delta": delta}, event_id=current)
+                elif not await state_log.wait_for_change(key, version, keepalive):
+                    yield ": keepalive\n\n"
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/state-sync/stats")
+    async def state_sync_stats():
+        return state_log.get_stats()
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,87 @@
+"""
+Audio conversion throughput in seconds of audio per CPU-second.
+
+Runs AudioConverter on the conversions the backend actually does:
+  - browser capture: 48 kHz stereo float32 -> 16 kHz mono LINEAR16
+  - 44.1 kHz mono float32 -> 16 kHz (devices/browsers at CD rate)
+  - TTS playback: 24 kHz LINEAR16 -> 48 kHz output device
+streamed in 20 ms frames (as it arrives over the WebSocket) and as one
+buffer, next to a per-sample pure Python baseline on the first case.
+
+    python benchmarks/audio_conversion.py [--seconds 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emergency_room_agent.audio import AudioConverter
+
+CASES = [
+    ("48k stereo float32 -> 16k", 48000, 2, "float32", 16000),
+    ("44.1k mono float32 -> 16k", 44100, 1, "float32", 16000),
+    ("24k LINEAR16 -> 48k (playback)", 24000, 1, "int16", 48000),
+]
+
+
+def make_input(rate, channels, sample_format, seconds):
+    t = np.arange(int(rate * seconds)) / rate
+    signal = 0.6 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    frames = np.repeat(signal[:, None], channels, axis=1).reshape(-1)
+    if sample_format == "int16":
+        return (frames * 32767).astype(np.int16).tobytes()
+    return frames.astype(np.float32).tobytes()
+
+
+def throughput(convert, chunks, seconds):
+    started = time.process_time()
+    for chunk in chunks:
+        convert(chunk)
+    return seconds / max(time.process_time() - started, 1e-9)
+
+
+def python_baseline(payload, rate, channels, out_rate):
+    """Per-sample downmix, linear-interpolation resample and int16 clip"""
+    floats = memoryview(payload).cast("f")
+    mono = [sum(floats[i:i + channels]) / channels for i in range(0, len(floats), channels)]
+    step = rate / out_rate
+    out = []
+    position = 0.0
+    while position < len(mono) - 1:
+        i = int(position)
+        frac = position - i
+        value = mono[i] * (1 - frac) + mono[i + 1] * frac
+        out.append(max(-32768, min(32767, int(round(value * 32767)))))
+        position += step
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=30.0, help="Audio length per case")
+    args = parser.parse_args()
+
+    print(f"{'conversion':<32} {'20 ms frames':>14} {'one buffer':>14}   (x realtime per CPU core)")
+    for label, rate, channels, sample_format, out_rate in CASES:
+        payload = make_input(rate, channels, sample_format, args.seconds)
+        frame_bytes = rate * 20 // 1000 * channels * np.dtype(sample_format).itemsize
+        frames = [payload[i:i + frame_bytes] for i in range(0, len(payload), frame_bytes)]
+
+        streamed = throughput(AudioConverter(rate, channels, sample_format, out_rate).convert, frames, args.seconds)
+        whole = throughput(AudioConverter(rate, channels, sample_format, out_rate).convert, [payload], args.seconds)
+        print(f"{label:<32} {streamed:13.0f}x {whole:13.0f}x")
+
+    # The pure Python version is slow enough that a few seconds suffice
+    baseline_seconds = min(args.seconds, 3.0)
+    label, rate, channels, sample_format, out_rate = CASES[0]
+    payload = make_input(rate, channels, sample_format, baseline_seconds)
+    baseline = throughput(lambda chunk: python_baseline(chunk, rate, channels, out_rate), [payload], baseline_seconds)
+    print(f"{'per-sample Python (first case)':<32} {'':>14} {baseline:13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+First-response latency of model calls with and without request hedging.
+
+Runs the same calls against a stub model that answers in about --latency
+seconds but stalls for --straggler-delay on a --straggler-rate fraction of
+requests, once directly and once through HedgedLlm, and reports percentiles,
+hedge rate and the tail latency saved. No credentials needed.
+
+    python benchmarks/model_hedging.py [--calls 400] [--budget 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from emergency_room_agent.hedging import RequestHedger, _percentile
+
+
+class StragglerLlm(BaseLlm):
+    """Stub model: lognormal latency plus occasional multi-second stalls"""
+    latency: float = 0.2
+    straggler_rate: float = 0.03
+    straggler_delay: float = 3.0
+    seed: int = 0
+    requests: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        self.requests += 1
+        rng = random.Random(f"{self.seed}:{self.requests}")
+        delay = self.latency * rng.lognormvariate(0, 0.25)
+        if rng.random() < self.straggler_rate:
+            delay += self.straggler_delay
+        await asyncio.sleep(delay)
+        yield LlmResponse(content=types.Content(
+            role="model", parts=[types.Part(text=f"Vitals coming up ({llm_request.model})")]
+        ))
+
+
+async def measure(model: BaseLlm, calls: int, concurrency: int) -> list:
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(i):
+        request = LlmRequest(model=model.model, contents=[
+            types.Content(role="user", parts=[types.Part(text=f"Check his vitals ({i})")])
+        ])
+        async with slots:
+            started = time.perf_counter()
+            async for _ in model.generate_content_async(request):
+                latencies.append((time.perf_counter() - started) * 1000)
+                break
+
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    return latencies
+
+
+def report(label: str, latencies: list):
+    print(f"{label:<10} p50 {_percentile(latencies, 0.5):7.1f} ms  p95 {_percentile(latencies, 0.95):7.1f} ms  "
+          f"p99 {_percentile(latencies, 0.99):7.1f} ms  max {max(latencies):7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Typical first-response latency (s)")
+    parser.add_argument("--straggler-rate", type=float, default=0.03)
+    parser.add_argument("--straggler-delay", type=float, default=3.0, help="Extra seconds a straggler takes")
+    parser.add_argument("--budget", type=float, default=0.1, help="Fraction of calls that may be hedged")
+    parser.add_argument("--percentile", type=float, default=0.95, help="Hedge after this latency percentile")
+    args = parser.parse_args()
+
+    def stub():
+        return StragglerLlm(model="gemini-2.0-flash", latency=args.latency,
+                            straggler_rate=args.straggler_rate, straggler_delay=args.straggler_delay)
+
+    unhedged = await measure(stub(), args.calls, args.concurrency)
+    hedger = RequestHedger(budget=args.budget, percentile=args.percentile, initial_delay=args.latency * 5)
+    hedged = await measure(hedger.wrap(stub()), args.calls, args.concurrency)
+
+    report("unhedged", unhedged)
+    report("hedged", hedged)
+    for p in (0.95, 0.99):
+        saved = _percentile(unhedged, p) - _percentile(hedged, p)
+        print(f"p{int(p * 100)} saved: {saved:.1f} ms")
+    print(json.dumps(hedger.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
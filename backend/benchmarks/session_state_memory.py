@@ -0,0 +1,110 @@
+"""
+Memory per session for 10k concurrent sessions, dict state vs. compact state.
+
+Compares:
+  - the old approach: a deep copy of the nested initial_state dict per session
+  - SessionState objects (shared patient record, only mutable parts per session)
+  - the ADK dict form produced by SessionState.to_adk_dict() (shared static parts)
+  - both dict forms as stored by InMemorySessionService and
+    HibernatingSessionService (what the server actually keeps per session;
+    Session objects included)
+
+    python benchmarks/session_state_memory.py [--sessions 10000]
+"""
+import argparse
+import asyncio
+import copy
+import os
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.sessions import InMemorySessionService
+
+from emergency_room_agent.hibernation import HibernatingSessionService
+from emergency_room_agent.state import SCENARIOS, SessionState, Stage, build_initial_state
+from emergency_room_agent.state_sync import StateLog
+
+
+def measure(label, build, sessions):
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    states = [build(session_id) for session_id in session_ids]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{label:<38} {used / sessions:8.0f} bytes/session  {used / 1024 / 1024:7.2f} MiB total")
+    return states
+
+
+def measure_service(label, service, build, sessions):
+    """Memory held by service after creating sessions with build(session_id) as state"""
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+
+    async def create_all():
+        for session_id in session_ids:
+            await service.create_session(app_name="bench", user_id="trainee", session_id=session_id,
+                                         state=build(session_id))
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    asyncio.run(create_all())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{label:<38} {used / sessions:8.0f} bytes/session  {used / 1024 / 1024:7.2f} MiB total")
+
+    # The stored states must still be intact and equal to a fresh one
+    stored = service.sessions["bench"]["trainee"][session_ids[0]].state
+    assert SessionState.from_adk_dict(stored).to_adk_dict() == build_initial_state(session_ids[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=10000)
+    args = parser.parse_args()
+
+    template = build_initial_state()
+    template = copy.deepcopy(template)  # detach from the shared static parts
+
+    def dict_state(session_id):
+        state = copy.deepcopy(template)
+        state["session_id"] = session_id
+        return state
+
+    def compact_state(session_id):
+        state = SessionState(patient=SCENARIOS["stemi"], session_id=session_id)
+        state.stage = Stage.S2_CRITICAL_CONSULTATION
+        state.flags.protocol_asa_given = True
+        return state
+
+    print(f"{args.sessions} sessions (session id strings included in every row)")
+    measure("nested dict (deep copy per session)", dict_state, args.sessions)
+    compact = measure("SessionState", compact_state, args.sessions)
+    measure("SessionState.to_adk_dict()", lambda session_id: build_initial_state(session_id), args.sessions)
+
+    # Stored sessions: the services keep the state dict they were given
+    # (copied at the top level only); deep copies are made for callers of
+    # get_session, not for what stays in memory
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make_service in (
+            ("InMemorySessionService", InMemorySessionService),
+            ("HibernatingSessionService", lambda: HibernatingSessionService(
+                directory, sweep_interval=0, max_resident=args.sessions, state_log=StateLog())),
+        ):
+            print(name)
+            measure_service("  nested dict (deep copy per session)", make_service(), dict_state, args.sessions)
+            measure_service("  SessionState.to_adk_dict()", make_service(), build_initial_state, args.sessions)
+
+    # Round trip check
+    for state in compact[:100]:
+        assert SessionState.from_adk_dict(state.to_adk_dict()) == state
+    print("round trip: ok")
+
+
+if __name__ == "__main__":
+    main()
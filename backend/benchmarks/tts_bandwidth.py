@@ -0,0 +1,65 @@
+"""
+Compare per-reply audio bandwidth of the TTS encodings.
+
+Synthesizes typical agent replies as LINEAR16 (local playback) and as the
+network encodings, and reports bytes, bitrate and size relative to LINEAR16.
+Needs Google Cloud credentials.
+
+    python benchmarks/tts_bandwidth.py [--credentials ./google-cloud-credentials.json]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emergency_room_agent.sub_agents.tts_agent import NETWORK_ENCODINGS, TTSAgent
+
+REPLIES = [
+    "Alright doc, aspirin three twenty-four milligrams chewed, coming right up.",
+    "Got it. Twelve-lead is running now. Hmm, I'm seeing ST-segment elevation in leads V1 and V2.",
+    "Mm-hmm, classic presentation. His pressure is one eighteen over seventy-five, heart rate one oh five, "
+    "and he's still rating the pain an eight out of ten. What do you want to give him next?",
+]
+
+
+def wav_duration(audio: bytes) -> float:
+    with wave.open(io.BytesIO(audio), "rb") as wf:
+        return wf.getnframes() / wf.getframerate()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--credentials", default=None, help="Service account JSON")
+    parser.add_argument("--voice", default="en-US-Neural2-F")
+    args = parser.parse_args()
+
+    tts = TTSAgent(credentials_path=args.credentials, voice_name=args.voice)
+    encodings = ["linear16", *NETWORK_ENCODINGS]
+    totals = {encoding: 0 for encoding in encodings}
+    seconds = 0.0
+
+    for text in REPLIES:
+        for encoding in encodings:
+            started = time.perf_counter()
+            audio = await tts.synthesize_audio(text, encoding)
+            elapsed = (time.perf_counter() - started) * 1000
+            totals[encoding] += len(audio)
+            if encoding == "linear16":
+                seconds += wav_duration(audio)
+            print(f"{encoding:>9}  {len(audio):>8} bytes  {elapsed:7.1f} ms  '{text[:40]}...'")
+
+    print(f"\n{seconds:.1f} s of speech")
+    baseline = totals["linear16"]
+    for encoding in encodings:
+        kbps = totals[encoding] * 8 / seconds / 1000
+        print(f"{encoding:>9}  {totals[encoding]:>9} bytes  {kbps:7.1f} kbit/s  "
+              f"{baseline / totals[encoding]:5.1f}x smaller than linear16")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,268 @@
+"""
+Global LLM admission control with fair-share queuing across sessions.
+
+Every model call made by any agent passes through AdmissionPlugin before it
+reaches the provider. Calls are admitted against a token bucket per model;
+when a bucket is empty they wait in a bounded queue served round-robin per
+session (so one chatty trainee can't starve the others), and when the wait
+would be too long they are rejected immediately with a retry-after hint
+instead of piling onto the provider's rate limit.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+
+
+class AdmissionRejected(Exception):
+    """A model call was refused; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = round(retry_after, 1)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """
+    Parse 'model=requests_per_minute' pairs
+
+    Example: 'gemini-2.0-flash=60,gemini-2.5-flash=30'
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, rpm = item.partition("=")
+        limits[model.strip()] = float(rpm)
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 6))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_available(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+@dataclass
+class ModelStats:
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    queue_wait_ms: List[float] = field(default_factory=list)
+    model_ms: List[float] = field(default_factory=list)
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+
+class AdmissionController:
+    def __init__(self,
+                 limits: Dict[str, float],
+                 default_rpm: float = None,
+                 max_queue: int = 100,
+                 max_wait: float = 10.0,
+                 samples: int = 1024):
+        """
+        Rate-limit model calls per model with fair queuing per session
+
+        Args:
+            limits: Requests per minute per model name
+            default_rpm: Limit for models not in limits (None = unlimited)
+            max_queue: Calls allowed to wait per model before rejecting
+            max_wait: Longest a call may wait (expected or actual) in seconds
+            samples: Recent timings kept per model for percentiles
+        """
+        self.buckets = {model: TokenBucket(rpm) for model, rpm in limits.items()}
+        self.default_rpm = default_rpm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.samples = samples
+        self.stats: Dict[str, ModelStats] = {}
+        # model -> session id -> waiting futures, rotated for round-robin
+        self._waiters: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+
+    def _bucket(self, model: str) -> Optional[TokenBucket]:
+        if model not in self.buckets and self.default_rpm:
+            self.buckets[model] = TokenBucket(self.default_rpm)
+        return self.buckets.get(model)
+
+    def _record(self, samples: List[float], value: float):
+        samples.append(value)
+        del samples[:-self.samples]
+
+    def queue_depth(self, model: str) -> int:
+        return sum(len(waiting) for waiting in self._waiters.get(model, {}).values())
+
+    async def acquire(self, model: str, session_id: str) -> float:
+        """
+        Wait for permission to call model on behalf of session_id
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            AdmissionRejected: Queue full or wait would exceed max_wait
+        """
+        stats = self.stats.setdefault(model, ModelStats())
+        bucket = self._bucket(model)
+        if bucket is None:
+            stats.admitted += 1
+            return 0.0
+
+        depth = self.queue_depth(model)
+        if depth == 0 and bucket.try_take():
+            stats.admitted += 1
+            self._record(stats.queue_wait_ms, 0.0)
+            return 0.0
+
+        expected_wait = bucket.seconds_until_available() + depth / bucket.rate
+        if depth >= self.max_queue or expected_wait > self.max_wait:
+            stats.rejected += 1
+            raise AdmissionRejected(f"Model {model} is busy", retry_after=expected_wait)
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        sessions = self._waiters.setdefault(model, OrderedDict())
+        sessions.setdefault(session_id, deque()).append(waiter)
+        stats.queued += 1
+        if model not in self._dispatchers or self._dispatchers[model].done():
+            self._dispatchers[model] = asyncio.create_task(self._dispatch(model))
+
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.CancelledError:
+            self._withdraw(model, session_id, waiter)
+            raise
+        except asyncio.TimeoutError:
+            self._withdraw(model, session_id, waiter)
+            stats.rejected += 1
+            raise AdmissionRejected(
+                f"Model {model} is busy",
+                retry_after=bucket.seconds_until_available() + self.queue_depth(model) / bucket.rate,
+            )
+
+        waited = time.perf_counter() - started
+        stats.admitted += 1
+        self._record(stats.queue_wait_ms, waited * 1000)
+        return waited
+
+    def _withdraw(self, model: str, session_id: str, waiter: asyncio.Future):
+        """Take a timed-out or cancelled call out of the queue right away"""
+        sessions = self._waiters.get(model, {})
+        waiting = sessions.get(session_id)
+        if waiting is not None and waiter in waiting:
+            waiting.remove(waiter)
+            if not waiting:
+                del sessions[session_id]
+        elif waiter.done() and not waiter.cancelled():
+            # Admitted just as it gave up, give the token back
+            bucket = self.buckets[model]
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    async def _dispatch(self, model: str):
+        """Hand out tokens to waiting sessions in round-robin order"""
+        bucket = self.buckets[model]
+        sessions = self._waiters[model]
+        while sessions:
+            if not bucket.try_take():
+                await asyncio.sleep(bucket.seconds_until_available())
+                continue
+
+            session_id, waiting = next(iter(sessions.items()))
+            waiter = waiting.popleft()
+            if waiting:
+                sessions.move_to_end(session_id)
+            else:
+                del sessions[session_id]
+
+            if waiter.done():
+                # Timed out or cancelled while queued, give the token back
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+                continue
+            waiter.set_result(None)
+
+    def record_model_time(self, model: str, seconds: float):
+        self._record(self.stats.setdefault(model, ModelStats()).model_ms, seconds * 1000)
+
+    def get_stats(self) -> dict:
+        """Per-model admission counts with queue wait vs. model time"""
+        return {
+            model: {
+                "admitted": stats.admitted,
+                "queued": stats.queued,
+                "rejected": stats.rejected,
+                "queue_depth": self.queue_depth(model),
+                "queue_wait_ms_p50": _percentile(stats.queue_wait_ms, 0.5),
+                "queue_wait_ms_p95": _percentile(stats.queue_wait_ms, 0.95),
+                "model_ms_p50": _percentile(stats.model_ms, 0.5),
+                "model_ms_p95": _percentile(stats.model_ms, 0.95),
+            }
+            for model, stats in self.stats.items()
+        }
+
+
+# (model, perf_counter at admission) of the model call this task is making;
+# before and after the model call run in the same task, parallel calls
+# (even by the same agent) in their own
+_call_started: ContextVar[Optional[Tuple[str, float]]] = ContextVar("admission_call_started", default=None)
+
+
+class AdmissionPlugin(BasePlugin):
+    """Runs every agent's model calls through an AdmissionController"""
+
+    def __init__(self, controller: AdmissionController, name: str = "admission_control"):
+        super().__init__(name=name)
+        self.controller = controller
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        await self.controller.acquire(llm_request.model, callback_context.session.id)
+        _call_started.set((llm_request.model, time.perf_counter()))
+        return None
+
+    def _finish(self, callback_context: CallbackContext):
+        started = _call_started.get()
+        if started:
+            _call_started.set(None)
+            model, at = started
+            self.controller.record_model_time(model, time.perf_counter() - at)
+
+    async def after_model_callback(
+        self, *, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> Optional[LlmResponse]:
+        self._finish(callback_context)
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> Optional[LlmResponse]:
+        self._finish(callback_context)
+        return None
@@ -0,0 +1,4 @@
+from .store import EventStore
+from .recorder import TurnRecorderPlugin
+from .queries import median_time_to_ecg, sbar_attempt_distribution, usage_by_agent
+__all__ = ['EventStore', 'TurnRecorderPlugin', 'median_time_to_ecg', 'sbar_attempt_distribution', 'usage_by_agent']
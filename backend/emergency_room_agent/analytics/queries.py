@@ -0,0 +1,114 @@
+"""
+Cohort-wide aggregates computed from EventStore columns.
+
+Each query reads only the columns it needs and lets the date partitions and
+Parquet statistics skip everything else; no session is replayed.
+"""
+import statistics
+from datetime import date
+from typing import Dict, Optional
+
+from .store import EventStore, ds
+
+try:
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None
+
+
+def _since(since: Optional[date]):
+    return ds.field("date") >= since.isoformat() if since else None
+
+
+def median_time_to_flag(store: EventStore,
+                        flag: str,
+                        since: Optional[date] = None) -> Dict[str, dict]:
+    """
+    Median seconds from session start until flag first turned true, per cohort
+
+    Returns:
+        {cohort: {"median_s": ..., "sessions": ...}}
+    """
+    table = store.table(["cohort", "session_id", "session_elapsed_s", "flag_changes"], _since(since))
+    if table.num_rows == 0:
+        return {}
+
+    changes = table.column("flag_changes")
+    flat = pc.list_flatten(changes)
+    rows = pc.list_parent_indices(changes)
+    hits = table.take(pc.filter(rows, pc.equal(flat, flag)))
+
+    first = hits.group_by(["cohort", "session_id"]).aggregate([("session_elapsed_s", "min")])
+    per_cohort = first.group_by("cohort").aggregate([("session_elapsed_s_min", "list")])
+    return {
+        cohort: {"median_s": round(statistics.median(times), 1), "sessions": len(times)}
+        for cohort, times in zip(
+            per_cohort.column("cohort").to_pylist(),
+            per_cohort.column("session_elapsed_s_min_list").to_pylist(),
+        )
+    }
+
+
+def median_time_to_ecg(store: EventStore, since: Optional[date] = None) -> Dict[str, dict]:
+    return median_time_to_flag(store, "protocol_ecg_ordered", since)
+
+
+def sbar_attempt_distribution(store: EventStore,
+                              cohort: Optional[str] = None,
+                              since: Optional[date] = None) -> dict:
+    """
+    How many doctor turns trainees needed until their SBAR was approved
+
+    Returns:
+        {"attempts": {attempts: sessions}, "approved": n, "not_approved": n}
+    """
+    condition = ds.field("agent") == "doctor_agent"
+    if cohort:
+        condition = condition & (ds.field("cohort") == cohort)
+    if since:
+        condition = condition & _since(since)
+    table = store.table(["session_id", "ts", "sbar_approved"], condition)
+    if table.num_rows == 0:
+        return {"attempts": {}, "approved": 0, "not_approved": 0}
+
+    approvals = (table.filter(pc.field("sbar_approved"))
+                 .group_by("session_id")
+                 .aggregate([("ts", "min")])
+                 .rename_columns(["session_id", "approved_at"]))
+    joined = table.join(approvals, "session_id", join_type="inner")
+    attempts = (joined.filter(pc.field("ts") <= pc.field("approved_at"))
+                .group_by("session_id")
+                .aggregate([("ts", "count")]))
+    distribution = attempts.group_by("ts_count").aggregate([("session_id", "count")])
+
+    sessions = pc.count_distinct(table.column("session_id")).as_py()
+    return {
+        "attempts": dict(sorted(zip(
+            distribution.column("ts_count").to_pylist(),
+            distribution.column("session_id_count").to_pylist(),
+        ))),
+        "approved": approvals.num_rows,
+        "not_approved": sessions - approvals.num_rows,
+    }
+
+
+def usage_by_agent(store: EventStore, since: Optional[date] = None) -> Dict[str, dict]:
+    """Turns, token counts and median model time per agent"""
+    table = store.table(["agent", "prompt_tokens", "output_tokens", "model_ms"], _since(since))
+    if table.num_rows == 0:
+        return {}
+    summary = table.filter(pc.is_valid(table.column("agent"))).group_by("agent").aggregate([
+        ("agent", "count"),
+        ("prompt_tokens", "sum"),
+        ("output_tokens", "sum"),
+        ("model_ms", "approximate_median"),
+    ])
+    return {
+        row["agent"]: {
+            "turns": row["agent_count"],
+            "prompt_tokens": row["prompt_tokens_sum"],
+            "output_tokens": row["output_tokens_sum"],
+            "model_ms_p50": round(row["model_ms_approximate_median"] or 0.0, 1),
+        }
+        for row in summary.to_pylist()
+    }
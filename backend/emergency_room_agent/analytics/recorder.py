@@ -0,0 +1,175 @@
+"""
+Plugin that appends one analytics row per agent turn to an EventStore.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.sessions import Session
+from google.adk.tools import BaseTool, ToolContext
+
+from ..preparation import sbar_approved
+from .store import EventStore
+
+
+class _Turn:
+    def __init__(self, stage: int, flags: dict):
+        self.started = time.perf_counter()
+        self.stage = stage
+        self.flags = flags
+        self.agent = None
+        self.sbar_approved = False
+        self.tool_calls = []
+        self.model_started: Optional[float] = None
+        self.model_ms = 0.0
+        self.model_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+
+class TurnRecorderPlugin(BasePlugin):
+    def __init__(self, store: EventStore, name: str = "turn_recorder"):
+        """
+        Record every turn (one runner invocation) as a row in store
+
+        The cohort column comes from state["cohort"] (set it when creating
+        the session); sessions without one are recorded as "default".
+        """
+        super().__init__(name=name)
+        self.store = store
+        self._turns: Dict[str, _Turn] = {}
+        # session id -> (stage, when the session was first seen in it),
+        # for the most recently active sessions only
+        self._stage_entered: "OrderedDict[str, tuple]" = OrderedDict()
+        self.max_tracked_sessions = 10000
+
+    @staticmethod
+    def _stage(state) -> int:
+        return (state.get("states") or {}).get("current_stage", 0)
+
+    async def before_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        state = invocation_context.session.state
+        self._turns[invocation_context.invocation_id] = _Turn(
+            self._stage(state), dict(state.get("session_flags") or {})
+        )
+        return None
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        turn = self._turns.get(callback_context.invocation_id)
+        if turn:
+            turn.model_started = time.perf_counter()
+        return None
+
+    async def after_model_callback(
+        self, *, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> Optional[LlmResponse]:
+        turn = self._turns.get(callback_context.invocation_id)
+        if turn is None or llm_response.partial:
+            return None
+        if turn.model_started is not None:
+            turn.model_ms += (time.perf_counter() - turn.model_started) * 1000
+            turn.model_started = None
+        turn.model_calls += 1
+        usage = llm_response.usage_metadata
+        if usage:
+            turn.prompt_tokens += usage.prompt_token_count or 0
+            turn.output_tokens += usage.candidates_token_count or 0
+        return None
+
+    async def after_tool_callback(
+        self, *, tool: BaseTool, tool_args: dict, tool_context: ToolContext, result: dict
+    ) -> Optional[dict]:
+        turn = self._turns.get(tool_context.invocation_id)
+        if turn:
+            turn.tool_calls.append(tool.name)
+        return None
+
+    async def on_event_callback(
+        self, *, invocation_context: InvocationContext, event: Event
+    ) -> Optional[Event]:
+        turn = self._turns.get(invocation_context.invocation_id)
+        if turn and event.author != "user" and event.is_final_response():
+            turn.agent = event.author
+            turn.sbar_approved = turn.sbar_approved or sbar_approved(event)
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        turn = self._turns.pop(invocation_context.invocation_id, None)
+        if turn is None:
+            return
+        await self._record(invocation_context.session, invocation_context.invocation_id, turn,
+                           (time.perf_counter() - turn.started) * 1000)
+
+    async def record_turn(self, session: Session, events: List[Event], state_before: dict, turn_ms: float):
+        """
+        Record a turn whose events were appended to session without running
+        through this plugin (a committed speculation, see speculation.py)
+
+        Args:
+            session: The session after the events were appended
+            events: The turn's events
+            state_before: Session state before the turn
+            turn_ms: How long the turn took to run; its model time is unknown
+        """
+        turn = _Turn(self._stage(state_before), dict(state_before.get("session_flags") or {}))
+        for event in events:
+            if event.author == "user":
+                continue
+            if event.usage_metadata:
+                turn.model_calls += 1
+                turn.prompt_tokens += event.usage_metadata.prompt_token_count or 0
+                turn.output_tokens += event.usage_metadata.candidates_token_count or 0
+            turn.tool_calls.extend(call.name for call in event.get_function_calls())
+            if event.is_final_response():
+                turn.agent = event.author
+                turn.sbar_approved = turn.sbar_approved or sbar_approved(event)
+        if events:
+            await self._record(session, events[-1].invocation_id, turn, turn_ms)
+
+    async def _record(self, session: Session, invocation_id: str, turn: _Turn, turn_ms: float):
+        state = session.state
+        now = time.time()
+
+        stage = self._stage(state)
+        entered = self._stage_entered.get(session.id)
+        if entered is None or entered[0] != stage:
+            entered = self._stage_entered[session.id] = (stage, now)
+        self._stage_entered.move_to_end(session.id)
+        if len(self._stage_entered) > self.max_tracked_sessions:
+            self._stage_entered.popitem(last=False)
+
+        flags = state.get("session_flags") or {}
+        first_event = session.events[0].timestamp if session.events else now
+        self.store.append({
+            "ts": datetime.fromtimestamp(now, timezone.utc),
+            "cohort": state.get("cohort", "default"),
+            "user_id": session.user_id,
+            "session_id": session.id,
+            "invocation_id": invocation_id,
+            "stage": turn.stage,
+            "agent": turn.agent,
+            "tool_calls": turn.tool_calls,
+            "flag_changes": [flag for flag, value in flags.items() if value and not turn.flags.get(flag)],
+            "sbar_approved": turn.sbar_approved,
+            "session_elapsed_s": now - first_event,
+            "stage_elapsed_s": now - entered[1],
+            "turn_ms": turn_ms,
+            "model_ms": turn.model_ms,
+            "model_calls": turn.model_calls,
+            "prompt_tokens": turn.prompt_tokens,
+            "output_tokens": turn.output_tokens,
+        })
+        if self.store.due():
+            try:
+                await asyncio.to_thread(self.store.flush)
+            except Exception as e:
+                print(f"Error writing analytics: {e}")
@@ -0,0 +1,234 @@
+"""
+Partitioned Parquet store of simulation turns.
+
+Every agent turn becomes one row (see turn_schema()). Rows are buffered in
+memory and flushed as small Parquet files under <root>/date=YYYY-MM-DD/;
+partitions that collect too many small files are compacted into one, sorted
+by cohort and session so per-session scans read contiguous row groups.
+
+Readers may run in another process (agent_server's /analytics routes), so
+compaction never deletes files out from under them: the compacted file
+lists the files it replaces in a .sources file next to it, readers skip
+those, and they are deleted only after `retire_after` seconds.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # analytics is optional, the simulation runs without it
+    pa = ds = pq = None
+
+
+def turn_schema() -> "pa.Schema":
+    """Columns of one turn row (the date partition column is implied)"""
+    return pa.schema([
+        ("ts", pa.timestamp("ms", tz="UTC")),
+        ("cohort", pa.string()),
+        ("user_id", pa.string()),
+        ("session_id", pa.string()),
+        ("invocation_id", pa.string()),
+        ("stage", pa.int8()),
+        ("agent", pa.string()),
+        ("tool_calls", pa.list_(pa.string())),
+        # Protocol flags that turned true during the turn
+        ("flag_changes", pa.list_(pa.string())),
+        ("sbar_approved", pa.bool_()),
+        ("session_elapsed_s", pa.float64()),
+        ("stage_elapsed_s", pa.float64()),
+        ("turn_ms", pa.float64()),
+        ("model_ms", pa.float64()),
+        ("model_calls", pa.int16()),
+        ("prompt_tokens", pa.int32()),
+        ("output_tokens", pa.int32()),
+    ])
+
+
+class EventStore:
+    def __init__(self,
+                 root: str = "analytics",
+                 flush_rows: int = 500,
+                 flush_interval: float = 30.0,
+                 compact_files: int = 16,
+                 retire_after: float = 300.0):
+        """
+        Append-only columnar store of turn rows
+
+        Args:
+            root: Directory holding the date partitions
+            flush_rows: Buffered rows that trigger a flush
+            flush_interval: Seconds after which buffered rows are flushed
+            compact_files: Files in one partition that trigger compaction
+            retire_after: Seconds files replaced by a compaction are kept
+                for readers that listed them before it
+        """
+        if pa is None:
+            raise RuntimeError("Analytics requires pyarrow: pip install pyarrow")
+        self.root = root
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.compact_files = compact_files
+        self.retire_after = retire_after
+        self.schema = turn_schema()
+        self.partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.rows_written = 0
+        self.files_written = 0
+        self.compactions = 0
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, row: dict):
+        """Buffer one row; row["ts"] must be a timezone-aware datetime"""
+        with self._lock:
+            self._buffer.append(row)
+
+    def due(self) -> bool:
+        return bool(self._buffer) and (
+            len(self._buffer) >= self.flush_rows
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def _partition(self, row: dict) -> str:
+        return row["ts"].strftime("%Y-%m-%d")
+
+    def flush(self):
+        """Write buffered rows, one new file per date partition"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+
+        by_date = {}
+        for row in rows:
+            by_date.setdefault(self._partition(row), []).append(row)
+        for date, date_rows in by_date.items():
+            directory = os.path.join(self.root, f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pylist(date_rows, schema=self.schema)
+            self._write(table, directory)
+            self.rows_written += len(date_rows)
+            if len(self._files(directory)) >= self.compact_files:
+                self.compact_partition(directory)
+
+    def _write(self, table: "pa.Table", directory: str, name: str = None):
+        # Dot-prefixed files are ignored by readers until renamed
+        name = name or f"part-{uuid.uuid4().hex}.parquet"
+        temp_path = os.path.join(directory, f".{name}")
+        pq.write_table(table, temp_path, compression="zstd")
+        os.replace(temp_path, os.path.join(directory, name))
+        self.files_written += 1
+
+    @staticmethod
+    def _sources_path(directory: str, compacted: str) -> str:
+        return os.path.join(directory, compacted[:-len(".parquet")] + ".sources")
+
+    def _files(self, directory: str) -> List[str]:
+        """The partition's current files: without those a compaction replaced"""
+        names = os.listdir(directory)
+        retired = set()
+        for name in names:
+            if name.startswith("compact-") and name.endswith(".parquet"):
+                try:
+                    with open(self._sources_path(directory, name)) as f:
+                        retired.update(json.load(f))
+                except FileNotFoundError:
+                    pass  # its sources are deleted already
+        return [os.path.join(directory, name) for name in names
+                if name.endswith(".parquet") and not name.startswith(".") and name not in retired]
+
+    def compact_partition(self, directory: str):
+        """Merge a partition's files into one, sorted by cohort and session"""
+        files = self._files(directory)
+        if len(files) >= 2:
+            table = pa.concat_tables(pq.read_table(path, schema=self.schema) for path in files)
+            table = table.sort_by([("cohort", "ascending"), ("session_id", "ascending"), ("ts", "ascending")])
+            name = f"compact-{uuid.uuid4().hex}.parquet"
+            # The sources list goes first: a reader that sees the compacted
+            # file must also see which files it replaces
+            sources_path = self._sources_path(directory, name)
+            with open(f"{sources_path}.tmp", "w") as f:
+                json.dump([os.path.basename(path) for path in files], f)
+            os.replace(f"{sources_path}.tmp", sources_path)
+            self._write(table, directory, name)
+            self.compactions += 1
+        self._delete_retired(directory)
+
+    def _delete_retired(self, directory: str):
+        """
+        Delete replaced files once no reader can still be using them; their
+        .sources list goes one retire_after later, so a reader that still
+        lists a replaced file also finds the list that excludes it
+        """
+        now = time.time()
+        for name in os.listdir(directory):
+            if not name.endswith(".sources"):
+                continue
+            sources_path = os.path.join(directory, name)
+            age = now - os.path.getmtime(sources_path)
+            if age < self.retire_after:
+                continue
+            with open(sources_path) as f:
+                retired = json.load(f)
+            for source in retired:
+                try:
+                    os.unlink(os.path.join(directory, source))
+                except FileNotFoundError:
+                    pass
+            if age >= 2 * self.retire_after:
+                os.unlink(sources_path)
+
+    def compact(self):
+        """Flush, then compact every partition with more than one file"""
+        self.flush()
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if name.startswith("date=") and os.path.isdir(directory):
+                self.compact_partition(directory)
+
+    def dataset(self) -> "ds.Dataset":
+        """The current files of every partition (see compact_partition)"""
+        files = []
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if name.startswith("date=") and os.path.isdir(directory):
+                files.extend(sorted(self._files(directory)))
+        return ds.dataset(files, format="parquet", schema=self.schema.append(
+            pa.field("date", pa.string())), partitioning=self.partitioning, partition_base_dir=self.root)
+
+    def table(self, columns: List[str], filter: Optional["ds.Expression"] = None) -> "pa.Table":
+        """
+        Read only the given columns, including rows not flushed yet
+
+        Args:
+            columns: Column names (may include the "date" partition column)
+            filter: Row filter, pushed down to partitions and row groups
+        """
+        table = self.dataset().to_table(columns=columns, filter=filter)
+        with self._lock:
+            rows = list(self._buffer)
+        if rows:
+            pending = pa.Table.from_pylist(rows, schema=self.schema)
+            pending = pending.append_column(
+                "date", pa.array([self._partition(row) for row in rows], pa.string())
+            )
+            if filter is not None:
+                pending = pending.filter(filter)
+            table = pa.concat_tables([table, pending.select(columns)])
+        return table
+
+    def get_stats(self) -> dict:
+        return {
+            "buffered_rows": len(self._buffer),
+            "rows_written": self.rows_written,
+            "files_written": self.files_written,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,142 @@
+"""
+Vectorized audio format conversion.
+
+STTAgent expects 16 kHz mono LINEAR16, but browsers capture 48 kHz float32,
+often stereo, and output devices don't always run at the TTS sample rate.
+AudioConverter downmixes, resamples (polyphase FIR) and converts to int16
+with clipping on whole buffers in NumPy. It is streaming: filter history is
+carried across calls, so 20 ms frames convert without clicks at the seams.
+"""
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_FORMATS = {"float32": np.float32, "int16": np.int16}
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """(frames, channels) -> (frames,) by averaging the channels"""
+    if samples.ndim == 1 or samples.shape[1] == 1:
+        return samples.reshape(-1)
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def float_to_int16(samples: np.ndarray) -> np.ndarray:
+    """[-1.0, 1.0] floats to int16, clipping anything out of range"""
+    return np.clip(np.rint(samples * 32767.0), -32768, 32767).astype(np.int16)
+
+
+def int16_to_float(samples: np.ndarray) -> np.ndarray:
+    return samples.astype(np.float32) / 32768.0
+
+
+def lowpass_phases(up: int, down: int, taps_per_phase: int = 16, beta: float = 8.0) -> np.ndarray:
+    """
+    Kaiser-windowed sinc for resampling by up/down, split into polyphase form
+
+    Returns:
+        (up, taps_per_phase) array; row p holds the taps applied for output
+        samples that fall on phase p of the upsampled grid, in reverse order
+        so they line up with a window of the most recent input samples
+    """
+    length = up * taps_per_phase
+    cutoff = 0.5 / max(up, down)  # cycles per upsampled sample
+    n = np.arange(length) - (length - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta) * up
+    phases = taps.reshape(taps_per_phase, up).T  # phases[p, j] = taps[p + j * up]
+    return np.ascontiguousarray(phases[:, ::-1], dtype=np.float32)
+
+
+class Resampler:
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 16):
+        """
+        Streaming polyphase resampler for mono float32 audio
+
+        Args:
+            in_rate: Input sample rate
+            out_rate: Output sample rate
+            taps_per_phase: Filter taps per output sample when upsampling,
+                scaled by the decimation factor when downsampling
+        """
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        # When decimating, the filter has to span proportionally more input
+        self.taps = taps_per_phase * -(-self.down // self.up)
+        self.phases = lowpass_phases(self.up, self.down, self.taps)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # input samples seen so far
+        self._produced = 0  # output samples emitted so far
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples.astype(np.float32, copy=False)
+
+        start = self._consumed
+        self._consumed += len(samples)
+        buffer = np.concatenate([self._history, samples.astype(np.float32, copy=False)])
+        self._history = buffer[len(buffer) - (self.taps - 1):]
+
+        # Every output sample whose newest input sample has arrived
+        end = -(-self._consumed * self.up // self.down)
+        n = np.arange(self._produced, end, dtype=np.int64)
+        self._produced = end
+        if not len(n):
+            return np.zeros(0, dtype=np.float32)
+
+        position = n * self.down
+        newest = position // self.up - start  # index into samples
+        windows = sliding_window_view(buffer, self.taps)
+        if self.up == 1:
+            # Integer decimation: one phase, evenly spaced windows (no copy)
+            return windows[newest[0]:newest[-1] + 1:self.down] @ self.phases[0]
+        return np.einsum("ij,ij->i", windows[newest], self.phases[position % self.up])
+
+
+class AudioConverter:
+    def __init__(self,
+                 in_rate: int,
+                 in_channels: int = 1,
+                 in_format: str = "float32",
+                 out_rate: int = 16000,
+                 taps_per_phase: int = 16):
+        """
+        Convert interleaved PCM buffers to mono LINEAR16 at out_rate
+
+        Args:
+            in_rate: Input sample rate
+            in_channels: Interleaved input channels (downmixed to mono)
+            in_format: "float32" (Web Audio) or "int16"
+            out_rate: Output sample rate
+            taps_per_phase: Resampling filter quality
+        """
+        if in_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format '{in_format}', expected one of {list(SAMPLE_FORMATS)}")
+        self.in_rate = in_rate
+        self.in_channels = in_channels
+        self.in_format = in_format
+        self.out_rate = out_rate
+        self.dtype = np.dtype(SAMPLE_FORMATS[in_format])
+        self.resampler = Resampler(in_rate, out_rate, taps_per_phase)
+
+    @property
+    def passthrough(self) -> bool:
+        return self.in_format == "int16" and self.in_channels == 1 and self.in_rate == self.out_rate
+
+    def convert_array(self, samples: np.ndarray) -> np.ndarray:
+        """Interleaved input samples -> mono int16 samples"""
+        if self.passthrough:
+            return samples.astype(np.int16, copy=False)
+        if len(samples) % self.in_channels:
+            raise ValueError(f"Buffer does not hold whole {self.in_channels}-channel frames")
+        frames = samples.reshape(-1, self.in_channels)
+        if self.in_format == "int16":
+            frames = int16_to_float(frames)
+        return float_to_int16(self.resampler.process(downmix(frames)))
+
+    def convert(self, payload: bytes) -> bytes:
+        """Interleaved input bytes -> mono LINEAR16 bytes"""
+        if len(payload) % self.dtype.itemsize:
+            raise ValueError(f"{self.in_format} buffers must contain whole samples")
+        return self.convert_array(np.frombuffer(payload, dtype=self.dtype)).tobytes()
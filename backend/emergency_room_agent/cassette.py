@@ -0,0 +1,179 @@
+"""
+Record/replay cassettes for model calls.
+
+In record mode CassettePlugin lets every model call through and appends the
+request key and final response to a gzip-compressed JSON-lines cassette. The
+response is taken from the event it becomes, so calls that a later plugin
+answers (response cache, stage preparation) are recorded too. In
+replay mode matching calls are answered from the cassette without touching
+the model (optionally with the recorded latency); unmatched calls still go to
+the model. Strict mode raises CassetteMiss instead, so a regression run can
+never silently reach the live API.
+
+    ER_CASSETTE=cassettes/stemi.jsonl.gz ER_CASSETTE_MODE=record python main.py
+    ER_CASSETTE=cassettes/stemi.jsonl.gz ER_CASSETTE_MODE=strict python main.py
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+
+from .response_cache import normalize_request
+
+MODES = ("record", "replay", "strict")
+
+
+class CassetteMiss(Exception):
+    """Strict replay found no recorded response for a model call"""
+
+
+@dataclass
+class CassetteStats:
+    recorded: int = 0
+    replayed: int = 0
+    misses: int = 0
+
+
+def request_key(agent_name: str, llm_request: LlmRequest) -> str:
+    """Stable key of a model call: agent, model and canonical request"""
+    digest = hashlib.sha256()
+    for piece in (agent_name, llm_request.model or "", normalize_request(llm_request)):
+        digest.update(piece.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CassettePlugin(BasePlugin):
+    def __init__(self,
+                 path: str,
+                 mode: str = "replay",
+                 latency_scale: float = 0.0,
+                 name: str = "cassette"):
+        """
+        Record model calls to, or replay them from, a cassette file
+
+        Args:
+            path: Cassette file (gzip JSON lines); record mode appends to it
+            mode: "record", "replay" or "strict" (replay, fail on misses)
+            latency_scale: Replayed responses wait this fraction of their
+                recorded latency (0 = memory speed, 1 = as recorded)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}. Use one of {MODES}")
+        super().__init__(name=name)
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.stats = CassetteStats()
+        # key -> recorded interactions, replayed in order (the same request
+        # can legitimately get different answers within one run)
+        self._tape: Dict[str, List[dict]] = {}
+        self._played: Dict[str, int] = {}
+        self._pending: Dict[tuple, tuple] = {}
+        self._write_lock = asyncio.Lock()
+        if mode != "record":
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            if self.mode == "strict":
+                raise FileNotFoundError(f"Cassette not found: {self.path}")
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._tape.setdefault(entry["key"], []).append(entry)
+
+    def _append(self, entry: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Each append adds a gzip member; gzip readers concatenate them
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._tape.values())
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        agent_name = callback_context.agent_name
+        key = request_key(agent_name, llm_request)
+
+        if self.mode == "record":
+            self._pending[(callback_context.invocation_id, agent_name)] = (key, time.perf_counter())
+            return None
+
+        entries = self._tape.get(key)
+        if not entries:
+            self.stats.misses += 1
+            if self.mode == "strict":
+                raise CassetteMiss(f"No recorded response for {agent_name} ({llm_request.model}), key {key[:12]}")
+            return None
+
+        played = self._played.get(key, 0)
+        self._played[key] = played + 1
+        entry = entries[min(played, len(entries) - 1)]
+        if self.latency_scale:
+            await asyncio.sleep(entry["latency_ms"] / 1000 * self.latency_scale)
+        self.stats.replayed += 1
+        return LlmResponse.model_validate(entry["response"])
+
+    async def on_event_callback(
+        self, *, invocation_context: InvocationContext, event: Event
+    ) -> Optional[Event]:
+        # after_model_callback is skipped when a later plugin answers the
+        # call itself, the event for the response never is
+        if event.partial or (event.content and event.content.role != "model"):
+            return None
+        pending = self._pending.pop((event.invocation_id, event.author), None)
+        if pending is None:
+            return None
+
+        key, started = pending
+        recorded = LlmResponse.model_validate(
+            event.model_dump(include=set(LlmResponse.model_fields), exclude_none=True)
+        )
+        for part in (recorded.content.parts if recorded.content else None) or []:
+            if part.function_call:
+                part.function_call.id = None  # reassigned per session by ADK
+        entry = {
+            "key": key,
+            "agent": event.author,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "response": recorded.model_dump(mode="json", exclude_none=True),
+        }
+        self._tape.setdefault(key, []).append(entry)
+        try:
+            async with self._write_lock:
+                await asyncio.to_thread(self._append, entry)
+            self.stats.recorded += 1
+        except OSError as e:
+            print(f"Error writing cassette {self.path}: {e}")
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> Optional[LlmResponse]:
+        self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        # Calls that never produced an event (e.g. rejected by admission)
+        for key in [key for key in self._pending if key[0] == invocation_context.invocation_id]:
+            del self._pending[key]
+
+    def get_stats(self) -> dict:
+        return {"mode": self.mode, "entries": len(self), **asdict(self.stats)}
@@ -0,0 +1,165 @@
+"""
+Playback-aware gating of microphone frames (echo suppression).
+
+Without headphones the microphone hears the nurse's own TTS reply, which is
+then transcribed and answered as if the trainee had said it. TTSAgent feeds
+every frame it plays into an EchoGate and STTAgent asks the gate before
+queuing each microphone frame for recognition:
+
+  - "half_duplex": while a reply plays (plus a short hangover) every frame
+    is dropped; talking over the nurse is not possible
+  - "correlation": each frame is cross-correlated (one FFT) with the recent
+    playback over the plausible speaker-to-mic delays. Frames the playback
+    explains (correlation >= echo_threshold) and near-silent frames are
+    dropped; frames with enough energy the playback does not explain -
+    the trainee talking - still go through, so barge-in keeps working
+
+This is a gate, not an echo canceller: frames that pass are not cleaned.
+"""
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from .audio import AudioConverter, int16_to_float
+
+MODES = ("half_duplex", "correlation")
+
+
+@dataclass
+class EchoGateStats:
+    frames: int = 0
+    passed: int = 0
+    # Passed while a reply was playing (trainee talking over the nurse)
+    passed_during_playback: int = 0
+    suppressed_half_duplex: int = 0
+    suppressed_echo: int = 0
+    suppressed_quiet: int = 0
+
+    @property
+    def suppressed(self) -> int:
+        return self.suppressed_half_duplex + self.suppressed_echo + self.suppressed_quiet
+
+
+class EchoGate:
+    def __init__(self,
+                 mode: str = "correlation",
+                 sample_rate: int = 16000,
+                 max_delay: float = 0.5,
+                 hangover: float = 0.3,
+                 echo_threshold: float = 0.7,
+                 silence_rms: float = 0.01):
+        """
+        Decide which microphone frames reach the recognizer during playback
+
+        Args:
+            mode: "half_duplex" or "correlation"
+            sample_rate: Microphone sample rate (16-bit mono frames)
+            max_delay: Longest speaker-to-microphone delay searched, in
+                seconds (output buffering plus room acoustics)
+            hangover: Seconds after the last played frame that still count
+                as playback (device buffer and reverb tail)
+            echo_threshold: Normalized correlation with the playback at or
+                above which a frame is treated as echo (0.7: the playback
+                explains about half of the frame's energy)
+            silence_rms: Frames quieter than this (full scale = 1.0) are
+                dropped during playback
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown echo gate mode: {mode}. Use one of {MODES}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_delay = max_delay
+        self.hangover = hangover
+        self.echo_threshold = echo_threshold
+        self.silence_rms = silence_rms
+        self.stats = EchoGateStats()
+        # Most recent playback at the microphone rate, newest sample last
+        # (plus room for one capture frame)
+        self._reference = np.zeros(int(max_delay * sample_rate) + 4096, dtype=np.float32)
+        self._converters = {}
+        self._last_played = float("-inf")
+        # Playback runs on the event loop, capture on the recording thread
+        self._lock = threading.Lock()
+
+    @property
+    def playing(self) -> bool:
+        return time.monotonic() - self._last_played < self.hangover
+
+    def playback(self, frames: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2):
+        """
+        Record frames handed to the output device
+
+        Args:
+            frames: Interleaved PCM as written to the output stream
+            sample_rate: Output sample rate
+            channels: Output channels
+            sample_width: Bytes per sample; only 16-bit audio is kept as a
+                reference, anything else just counts as playback
+        """
+        reference = None
+        if self.mode == "correlation" and sample_width == 2:
+            converter = self._converters.get((sample_rate, channels))
+            if converter is None:
+                converter = self._converters[(sample_rate, channels)] = AudioConverter(
+                    sample_rate, channels, "int16", out_rate=self.sample_rate
+                )
+            reference = int16_to_float(converter.convert_array(np.frombuffer(frames, dtype=np.int16)))
+        with self._lock:
+            self._last_played = time.monotonic()
+            if reference is not None and len(reference):
+                keep = len(self._reference)
+                self._reference = np.concatenate([self._reference, reference])[-keep:]
+
+    def admit(self, frame: bytes) -> bool:
+        """
+        Whether a 16-bit mono microphone frame should go to the recognizer
+        """
+        self.stats.frames += 1
+        if not self.playing:
+            self.stats.passed += 1
+            return True
+        if self.mode == "half_duplex":
+            self.stats.suppressed_half_duplex += 1
+            return False
+
+        mic = int16_to_float(np.frombuffer(frame, dtype=np.int16))
+        mic_energy = float(mic @ mic)
+        if not len(mic) or np.sqrt(mic_energy / len(mic)) < self.silence_rms:
+            self.stats.suppressed_quiet += 1
+            return False
+        with self._lock:
+            reference = self._reference
+        if self.echo_correlation(mic, mic_energy, reference) >= self.echo_threshold:
+            self.stats.suppressed_echo += 1
+            return False
+
+        self.stats.passed += 1
+        self.stats.passed_during_playback += 1
+        return True
+
+    @staticmethod
+    def echo_correlation(mic: np.ndarray, mic_energy: float, reference: np.ndarray) -> float:
+        """
+        Highest normalized correlation of mic with any same-length window of
+        reference (0 = unrelated, 1 = a scaled copy)
+        """
+        frame, window = len(mic), len(reference)
+        if window < frame:
+            return 0.0
+        size = 1 << (window + frame - 1).bit_length()
+        # correlation[k] = sum_i reference[k + i] * mic[i]
+        correlation = np.fft.irfft(np.fft.rfft(reference, size) * np.conj(np.fft.rfft(mic, size)), size)
+        correlation = correlation[:window - frame + 1]
+        squares = np.concatenate([[0.0], np.cumsum(reference.astype(np.float64) ** 2)])
+        reference_energy = squares[frame:] - squares[:-frame]
+        # Silent stretches of the reference explain nothing
+        audible = reference_energy > 1e-6 * frame
+        if not audible.any():
+            return 0.0
+        rho = np.abs(correlation[audible]) / np.sqrt(reference_energy[audible] * mic_energy)
+        return float(rho.max())
+
+    def get_stats(self) -> dict:
+        return {"mode": self.mode, "playing": self.playing, "suppressed": self.stats.suppressed, **asdict(self.stats)}
@@ -0,0 +1,307 @@
+"""
+Hedged model requests, to cut the tail latency of agent turns.
+
+A call that has not produced its first response within the hedge delay - the
+recent p95 first-response latency of its model - gets a duplicate request,
+optionally to another model tier. Whichever returns first is used and the
+other is cancelled. Hedges are paid for out of a budget shared by all
+wrapped agents, so at most `budget` (e.g. 10%) of calls are duplicated:
+
+    hedger = RequestHedger(budget=0.1, hedge_model="gemini-2.0-flash")
+    hedge_agents(root_agent, hedger, ["nurse_agent", "doctor_agent"])
+
+With streaming, "first response" is the first partial chunk; otherwise it is
+the whole reply. The loser is cancelled, so how long it would have taken is
+not known: get_stats() reports the latency the agents saw, and
+benchmarks/model_hedging.py measures the gain against unhedged calls.
+
+The loser is charged to the session's usage (see usage.py): with its own
+usage when it had answered, otherwise with the prompt it was sent.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from functools import partial
+from typing import AsyncGenerator, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+from pydantic import PrivateAttr
+
+from .usage import usage_charger
+
+
+def _percentile(samples: Iterable[float], p: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    # Calls past the hedge delay that the budget did not cover
+    budget_denied: int = 0
+    errors: int = 0
+    # Attempts that failed while the other one went on to answer
+    rescued_errors: int = 0
+
+
+class RequestHedger:
+    def __init__(self,
+                 budget: float = 0.1,
+                 burst: float = 5.0,
+                 percentile: float = 0.95,
+                 window: int = 200,
+                 min_samples: int = 20,
+                 initial_delay: float = 3.0,
+                 min_delay: float = 0.25,
+                 hedge_model: str = None):
+        """
+        Decide when to hedge and keep the shared budget and latency stats
+
+        Args:
+            budget: Fraction of calls that may be hedged; every call adds
+                this much credit and a hedge spends 1. Keep it above
+                1 - percentile, or ordinary slow calls use it all up
+            burst: Most credit saved up, i.e. hedges allowed back to back
+            percentile: Latency percentile used as the hedge delay
+            window: Recent first-response latencies kept per model
+            min_samples: Latencies needed before the percentile is used
+            initial_delay: Hedge delay in seconds until then
+            min_delay: Lowest hedge delay in seconds
+            hedge_model: Model for the duplicate request (None: same model)
+        """
+        self.budget = budget
+        self.burst = burst
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.hedge_model = hedge_model
+        self.stats = HedgeStats()
+        self._credit = min(1.0, burst)
+        # model -> recent first-response latencies (ms)
+        self._latencies: Dict[str, Deque[float]] = {}
+        # First-response latency seen by the agents (ms)
+        self._delivered_ms: Deque[float] = deque(maxlen=window * 5)
+
+    def delay(self, model: str) -> float:
+        """Seconds to wait for the first response before hedging"""
+        latencies = self._latencies.get(model)
+        if latencies is None or len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, _percentile(latencies, self.percentile) / 1000)
+
+    def deposit(self):
+        """Earn budget for one call"""
+        self.stats.calls += 1
+        self._credit = min(self.burst, self._credit + self.budget)
+
+    def take(self) -> bool:
+        """Spend budget on one hedge, if there is enough"""
+        if self._credit < 1.0:
+            self.stats.budget_denied += 1
+            return False
+        self._credit -= 1.0
+        self.stats.hedged += 1
+        return True
+
+    def record(self, model: str, latency: float, hedge_won: bool):
+        """
+        Record a call's first-response latency in seconds
+
+        When the hedge won, the primary's own latency is unknown (it was cut
+        off), so only the latency the agent saw is recorded; counting it as
+        the primary's would pull the hedge delay down.
+        """
+        self._delivered_ms.append(latency * 1000)
+        self.stats.hedge_wins += hedge_won
+        if hedge_won:
+            return
+        latencies = self._latencies.get(model)
+        if latencies is None:
+            latencies = self._latencies[model] = deque(maxlen=self.window)
+        latencies.append(latency * 1000)
+
+    def wrap(self, model: BaseLlm) -> "HedgedLlm":
+        if isinstance(model, HedgedLlm):
+            return model
+        return HedgedLlm(model=model.model, primary=model, hedger=self)
+
+    def get_stats(self) -> dict:
+        calls = self.stats.calls
+        return {
+            **asdict(self.stats),
+            "hedge_rate": round(self.stats.hedged / calls, 4) if calls else 0.0,
+            "hedge_win_rate": round(self.stats.hedge_wins / self.stats.hedged, 4) if self.stats.hedged else 0.0,
+            "first_response_ms": {
+                "p50": _percentile(self._delivered_ms, 0.5),
+                "p95": _percentile(self._delivered_ms, 0.95),
+                "p99": _percentile(self._delivered_ms, 0.99),
+            },
+            "hedge_delay_ms": {model: round(self.delay(model) * 1000, 1) for model in self._latencies},
+        }
+
+
+def _failed(attempt: asyncio.Task) -> bool:
+    """Done without an answer; exception() itself raises for cancelled tasks"""
+    return attempt.cancelled() or attempt.exception() is not None
+
+
+class HedgedLlm(BaseLlm):
+    """
+    Model wrapper that hedges slow calls to `primary` (see RequestHedger)
+
+    Stands in for the agent's model, so plugins see and adjust the request
+    (e.g. a budget fallback model) before it gets here.
+    """
+    primary: BaseLlm
+    hedger: RequestHedger
+
+    _tasks: set = PrivateAttr(default_factory=set)
+
+    @property
+    def api_client(self):
+        # Used to warm connections (StagePreparationPlugin)
+        return getattr(self.primary, "api_client", None)
+
+    def _hedge_request(self, llm_request: LlmRequest) -> LlmRequest:
+        """Copy of the request for the duplicate (models mutate requests)"""
+        update = {"contents": list(llm_request.contents)}
+        if llm_request.config is not None:
+            update["config"] = llm_request.config.model_copy(deep=True)
+        request = llm_request.model_copy(update=update)
+        hedge_model = self.hedger.hedge_model
+        if hedge_model and hedge_model != request.model:
+            request.model = hedge_model
+            # Thinking budgets are rejected by models without thinking
+            if request.config and request.config.thinking_config and "2.5" not in hedge_model:
+                request.config.thinking_config = None
+        return request
+
+    async def _first(self, llm_request: LlmRequest, stream: bool
+                     ) -> Tuple[AsyncGenerator[LlmResponse, None], Optional[LlmResponse], float]:
+        """Start a request and wait for its first response"""
+        responses = self.primary.generate_content_async(llm_request, stream=stream)
+        try:
+            first = await responses.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await responses.aclose()
+            raise
+        return responses, first, time.monotonic()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        hedger = self.hedger
+        model = llm_request.model or self.model
+        # Losing attempts are charged to the agent call this one serves
+        charge = usage_charger()
+        hedger.deposit()
+        # Copied before the primary request can touch it
+        hedge_request = self._hedge_request(llm_request)
+        started = time.monotonic()
+
+        primary = asyncio.create_task(self._first(llm_request, stream))
+        attempts: List[asyncio.Task] = [primary]
+        try:
+            await asyncio.wait([primary], timeout=hedger.delay(model))
+            if not primary.done() and hedger.take():
+                attempts.append(asyncio.create_task(self._first(hedge_request, stream)))
+            winner = await self._race(attempts)
+        except BaseException:
+            self._cancel(attempts)
+            raise
+
+        responses, first, answered = winner.result()
+        hedger.record(model, answered - started, hedge_won=winner is not primary)
+        if charge and len(attempts) > 1:
+            loser = attempts[1] if winner is primary else primary
+            loser_model = hedge_request.model if loser is not primary else model
+            prompt_tokens = first.usage_metadata.prompt_token_count if first and first.usage_metadata else None
+            loser.add_done_callback(partial(self._charge_loser, charge, loser_model, prompt_tokens))
+
+        try:
+            if first is not None:
+                yield first
+                async for response in responses:
+                    yield response
+        finally:
+            await responses.aclose()
+
+    async def _race(self, attempts: List[asyncio.Task]) -> asyncio.Task:
+        """First attempt to answer; the others are cancelled"""
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((attempt for attempt in attempts if attempt in done and not _failed(attempt)), None)
+            if winner is None:
+                continue
+            self.hedger.stats.rescued_errors += sum(1 for attempt in attempts if attempt.done() and _failed(attempt))
+            self._cancel([attempt for attempt in attempts if attempt is not winner])
+            return winner
+        self.hedger.stats.errors += 1
+        # All failed: report the primary's error, else the hedge's. A
+        # cancelled attempt was cut off underneath us (e.g. by its HTTP
+        # client); re-raising CancelledError would look like the agent's
+        # own task being cancelled.
+        errors = [attempt.exception() for attempt in attempts if not attempt.cancelled()]
+        if errors:
+            raise errors[0]
+        raise RuntimeError(f"Model call cancelled ({len(attempts)} attempts)")
+
+    def _cancel(self, attempts: List[asyncio.Task]):
+        for attempt in attempts:
+            attempt.cancel()
+            # An attempt that answered already still holds a request open
+            attempt.add_done_callback(self._close_loser)
+
+    @staticmethod
+    def _charge_loser(charge: Callable, model: str, prompt_tokens: Optional[int], attempt: asyncio.Task):
+        if attempt.cancelled():
+            # Cut off before it answered; its prompt was sent all the same
+            if prompt_tokens:
+                charge(model, types.GenerateContentResponseUsageMetadata(prompt_token_count=prompt_tokens))
+            return
+        if attempt.exception() is None:
+            first = attempt.result()[1]
+            if first is not None and first.usage_metadata:
+                charge(model, first.usage_metadata)
+
+    def _close_loser(self, attempt: asyncio.Task):
+        if _failed(attempt):
+            return
+        responses = attempt.result()[0]
+        task = asyncio.ensure_future(responses.aclose())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def hedge_agents(root_agent: LlmAgent, hedger: RequestHedger, agent_names: Iterable[str]) -> Dict[str, HedgedLlm]:
+    """
+    Route the named agents' model calls through hedger
+
+    Model names are resolved once to model instances, as StagePreparationPlugin
+    does; agents already hedged are left as they are.
+    """
+    hedged = {}
+    for name in agent_names:
+        agent = root_agent.find_agent(name)
+        if not isinstance(agent, LlmAgent):
+            raise ValueError(f"Unknown agent: {name}")
+        model = agent.canonical_model
+        if isinstance(agent.model, str) and agent.model:
+            model = LLMRegistry.new_llm(agent.model)
+        agent.model = hedger.wrap(model)
+        hedged[name] = agent.model
+    return hedged
@@ -0,0 +1,313 @@
+"""
+Idle-session eviction and hibernation for the in-memory session service.
+
+InMemorySessionService keeps every session (abandoned browser tabs included)
+until the process restarts. HibernatingSessionService serializes sessions
+that have been idle longer than a TTL, or that fall off the end of an LRU
+once too many are resident, to compressed files on local disk and drops them
+from memory. The next request for a hibernated session reloads it
+transparently, so callers never see the difference. Sessions hibernated by an
+earlier process are picked up from the directory on startup.
+
+`adk api_server` picks it up through services.py:
+
+    adk api_server --session_service_uri "hibernate://.sessions?idle_ttl=900&max_resident=1000"
+"""
+import asyncio
+import copy
+import hashlib
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+from .state_sync import VERSION_KEY, StateLog, default_state_log
+
+SessionKey = Tuple[str, str, str]
+
+
+class HibernatingSessionService(InMemorySessionService):
+    def __init__(self,
+                 directory: str = ".sessions",
+                 idle_ttl: float = 900.0,
+                 max_resident: int = 1000,
+                 sweep_interval: float = 60.0,
+                 compression_level: int = 6,
+                 state_log: StateLog = None):
+        """
+        In-memory session service with bounded resident sessions
+
+        Args:
+            directory: Where hibernated sessions are written
+            idle_ttl: Seconds without access before a session hibernates
+            max_resident: Sessions kept in memory; least recently used beyond
+                this hibernate even if not idle yet
+            sweep_interval: Seconds between idle checks (0 = only check
+                when sessions are created)
+            compression_level: zlib level for hibernated sessions
+            state_log: Where state versions and deltas are recorded for
+                incremental state sync (defaults to the process-wide one)
+        """
+        super().__init__()
+        self.directory = directory
+        self.idle_ttl = idle_ttl
+        self.max_resident = max_resident
+        self.sweep_interval = sweep_interval
+        self.compression_level = compression_level
+        self.state_log = state_log or default_state_log
+        os.makedirs(directory, exist_ok=True)
+
+        # Resident sessions in least- to most-recently used order
+        self._last_access: "OrderedDict[SessionKey, float]" = OrderedDict()
+        self._hibernated: Dict[SessionKey, str] = {}
+        # Reloads in progress; concurrent requests for the session wait on them
+        self._reloading: Dict[SessionKey, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hibernations = 0
+        self.reloads = 0
+        self.reload_ms: List[float] = []
+        self._load_index()
+
+    def _load_index(self):
+        """Index the sessions an earlier process left hibernated in the directory"""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".session.z.tmp"):
+                os.unlink(path)  # interrupted write
+                continue
+            if not name.endswith(".session.z"):
+                continue
+            try:
+                session = self._read(path)
+            except Exception as e:
+                print(f"Error reading hibernated session {path}, deleting it: {e}")
+                os.unlink(path)
+                continue
+            self._hibernated[(session.app_name, session.user_id, session.id)] = path
+
+    def _path(self, key: SessionKey) -> str:
+        digest = hashlib.sha1("\0".join(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.session.z")
+
+    def _touch(self, key: SessionKey):
+        self._last_access[key] = time.monotonic()
+        self._last_access.move_to_end(key)
+
+    def _write(self, path: str, payload: bytes):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(zlib.compress(payload, self.compression_level))
+        os.replace(temp_path, path)
+
+    def _read(self, path: str) -> Session:
+        with open(path, "rb") as f:
+            return Session.model_validate_json(zlib.decompress(f.read()))
+
+    async def hibernate(self, app_name: str, user_id: str, session_id: str) -> bool:
+        """Write one resident session to disk and drop it from memory"""
+        key = (app_name, user_id, session_id)
+        session = self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+        if session is None:
+            return False
+
+        accessed = self._last_access.get(key)
+        path = self._path(key)
+        payload = session.model_dump_json().encode()
+        await asyncio.to_thread(self._write, path, payload)
+
+        if self._last_access.get(key) != accessed:
+            # Used while we were writing; keep it resident
+            os.unlink(path)
+            return False
+
+        del self.sessions[app_name][user_id][session_id]
+        self._last_access.pop(key, None)
+        self._hibernated[key] = path
+        self.hibernations += 1
+        return True
+
+    async def _ensure_resident(self, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        reload = self._reloading.get(key)
+        if reload is None:
+            path = self._hibernated.get(key)
+            if path is None:
+                return
+            reload = self._reloading[key] = asyncio.create_task(self._reload(key, path))
+            reload.add_done_callback(lambda _: self._reloading.pop(key, None))
+        # A cancelled caller doesn't cancel the reload the others wait for
+        await asyncio.shield(reload)
+
+    async def _reload(self, key: SessionKey, path: str):
+        """Read a hibernated session back; it stays listed as hibernated
+        until it is resident"""
+        started = time.perf_counter()
+        session = await asyncio.to_thread(self._read, path)
+        if self._hibernated.get(key) != path:
+            return  # deleted meanwhile
+        app_name, user_id, session_id = key
+        self.sessions.setdefault(app_name, {}).setdefault(user_id, {})[session_id] = session
+        del self._hibernated[key]
+        self._touch(key)
+        os.unlink(path)
+        self.reloads += 1
+        self.reload_ms.append((time.perf_counter() - started) * 1000)
+        del self.reload_ms[:-1024]
+
+    async def evict_idle(self):
+        """Hibernate sessions past the idle TTL, then the LRU ones over the limit"""
+        now = time.monotonic()
+        for key, accessed in list(self._last_access.items()):
+            if now - accessed < self.idle_ttl:
+                break  # ordered by access time
+            await self.hibernate(*key)
+
+        while len(self._last_access) > self.max_resident:
+            key = next(iter(self._last_access))
+            if not await self.hibernate(*key):
+                break
+
+    def start_sweeper(self):
+        """Periodically evict idle sessions from a background task"""
+        async def sweep():
+            while True:
+                await asyncio.sleep(self.sweep_interval)
+                before = self.hibernations
+                try:
+                    await self.evict_idle()
+                except Exception as e:
+                    print(f"Error hibernating sessions: {e}")
+                if self.hibernations != before:
+                    stats = self.get_stats()
+                    print(f"Hibernated {self.hibernations - before} idle sessions "
+                          f"({stats['resident']} resident, {stats['hibernated']} on disk)")
+
+        if self.sweep_interval and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.create_task(sweep())
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        self.start_sweeper()
+        if session_id:
+            await self._ensure_resident(app_name, user_id, session_id)
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self._touch((app_name, user_id, session.id))
+        self.state_log.seed((app_name, user_id, session.id), session.state.get(VERSION_KEY, 0))
+        if len(self._last_access) > self.max_resident:
+            await self.evict_idle()
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        await self._ensure_resident(app_name, user_id, session_id)
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch((app_name, user_id, session_id))
+            self.state_log.seed((app_name, user_id, session_id), session.state.get(VERSION_KEY, 0))
+        return session
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        response = await super().list_sessions(app_name=app_name, user_id=user_id)
+        listed = {(session.user_id, session.id) for session in response.sessions}
+        for (app, user, session_id), path in list(self._hibernated.items()):
+            if app != app_name or (user_id is not None and user != user_id):
+                continue
+            try:
+                session = await asyncio.to_thread(self._read, path)
+            except FileNotFoundError:
+                # Reloaded (or deleted) while we were reading the others
+                resident = self.sessions.get(app, {}).get(user, {}).get(session_id)
+                if resident is None or (user, session_id) in listed:
+                    continue
+                session = copy.deepcopy(resident.model_copy(update={"events": []}))
+            session.events = []
+            listed.add((user, session_id))
+            response.sessions.append(session)
+        return response
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        reload = self._reloading.get(key)
+        if reload is not None:
+            # Let it finish, then delete the resident copy
+            await asyncio.wait([reload])
+        path = self._hibernated.pop(key, None)
+        if path:
+            os.unlink(path)
+        self._last_access.pop(key, None)
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        await self._ensure_resident(session.app_name, session.user_id, session.id)
+        key = (session.app_name, session.user_id, session.id)
+        delta = event.actions.state_delta if event.actions else None
+        version = None
+        if not event.partial and delta and any(not name.startswith("temp:") for name in delta):
+            # Stored with the event, so the version survives hibernation;
+            # the log also knows versions from other copies of the session
+            current = max(session.state.get(VERSION_KEY, 0), self.state_log.version(key) or 0)
+            version = delta[VERSION_KEY] = current + 1
+        event = await super().append_event(session=session, event=event)
+        if not event.partial:
+            self._touch(key)
+            if version is not None:
+                self.state_log.record(key, version, event.actions.state_delta)
+        return event
+
+    def get_stats(self) -> dict:
+        samples = sorted(self.reload_ms)
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2) if samples else 0.0
+
+        return {
+            "resident": len(self._last_access),
+            "hibernated": len(self._hibernated),
+            "max_resident": self.max_resident,
+            "idle_ttl": self.idle_ttl,
+            "hibernations": self.hibernations,
+            "reloads": self.reloads,
+            "reload_ms_p50": percentile(0.5),
+            "reload_ms_p95": percentile(0.95),
+            "reload_ms_max": round(samples[-1], 2) if samples else 0.0,
+        }
+
+
+def from_uri(uri: str, **kwargs) -> HibernatingSessionService:
+    """
+    Build a service from 'hibernate://<directory>?idle_ttl=..&max_resident=..'
+
+    Extra keyword arguments passed by the ADK service registry are ignored.
+    """
+    parsed = urlparse(uri)
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    return HibernatingSessionService(
+        directory=(parsed.netloc + parsed.path) or ".sessions",
+        idle_ttl=float(options.get("idle_ttl", 900)),
+        max_resident=int(options.get("max_resident", 1000)),
+        sweep_interval=float(options.get("sweep_interval", 60)),
+    )
@@ -0,0 +1,316 @@
+"""
+Speculative preparation of the next stage's agent.
+
+The nurse -> doctor (S2 -> S3) and doctor -> evaluator (S3 -> S4) handovers
+used to start cold: the next agent's client and connection were only set up
+after the transfer, and the evaluator's debrief (the longest generation in
+the simulation) only started then. StagePreparationPlugin watches for the
+events that mean a stage is about to end (medication ordered in S2, SBAR
+approved in S3) and prepares the next agent in the background: it assembles
+that agent's prompt and transcript, warms its model connection and, for the
+evaluator, drafts the debrief. If the trainee then goes another way, the
+preparation is discarded.
+
+A draft is only served to a request that matches what it was drafted from:
+the same trainee messages (normalized as by the response cache) and the same
+state of the keys the agents read. Anything else discards it.
+"""
+import asyncio
+import hashlib
+import re
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Callable, Dict, List, Optional
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.models import BaseLlm
+from google.adk.plugins.base_plugin import BasePlugin
+from google.genai import types
+
+from .response_cache import DEFAULT_STATE_KEYS, normalize_request, state_hash
+from .usage import UsagePlugin, set_current_call
+
+_STAGE_2_MEDICATIONS = re.compile(r"nitro|morphine", re.IGNORECASE)
+_SBAR_APPROVED = re.compile(r"good work on the sbar report", re.IGNORECASE)
+
+
+def _event_text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return " ".join(part.text for part in event.content.parts if part.text)
+
+
+def medication_ordered(event: Event) -> bool:
+    """The nurse acknowledged a nitroglycerin or morphine order"""
+    for call in event.get_function_calls():
+        if any(_STAGE_2_MEDICATIONS.search(str(value)) for value in (call.args or {}).values()):
+            return True
+    return False
+
+
+def sbar_approved(event: Event) -> bool:
+    """The doctor approved the trainee's SBAR report"""
+    return bool(_SBAR_APPROVED.search(_event_text(event)))
+
+
+@dataclass(frozen=True)
+class Handover:
+    from_agent: str
+    trigger: Callable[[Event], bool]
+    to_agent: str
+    # Pre-compute the next agent's first response (only where it doesn't
+    # depend on what the trainee says next, e.g. the debrief)
+    draft: bool = False
+
+
+HANDOVERS = (
+    Handover("nurse_agent", medication_ordered, "doctor_agent"),
+    Handover("doctor_agent", sbar_approved, "evaluator_agent", draft=True),
+)
+
+
+@dataclass
+class PreparationStats:
+    triggered: int = 0
+    warmed: int = 0
+    drafted: int = 0
+    served: int = 0
+    discarded: int = 0
+    expired: int = 0
+    # Drafts dropped because the request differed from the drafted one
+    mismatched: int = 0
+    warm_ms: List[float] = field(default_factory=list)
+    draft_ms: List[float] = field(default_factory=list)
+
+
+@dataclass
+class _Preparation:
+    agent_name: str
+    started: float
+    # preparation_key() of the conversation and state drafted from
+    key: str
+    user_turns: int = 0
+    task: Optional[asyncio.Task] = None
+
+
+def transcript_contents(events: List[Event], agent_name: str) -> List[types.Content]:
+    """
+    The conversation as agent_name would see it: the trainee's messages as
+    user turns, its own as model turns and other agents' replies as context
+    """
+    contents = []
+    for event in events:
+        text = _event_text(event)
+        if not text or event.partial:
+            continue
+        if event.author == "user":
+            contents.append(types.Content(role="user", parts=[types.Part(text=text)]))
+        elif event.author == agent_name:
+            contents.append(types.Content(role="model", parts=[types.Part(text=text)]))
+        else:
+            contents.append(types.Content(role="user", parts=[
+                types.Part(text="For context:"),
+                types.Part(text=f"[{event.author}] said: {text}"),
+            ]))
+    return contents
+
+
+def _is_trainee_message(content: types.Content) -> bool:
+    return (
+        content.role == "user"
+        and bool(content.parts)
+        and any(part.text for part in content.parts)
+        and content.parts[0].text != "For context:"
+    )
+
+
+def preparation_key(contents: List[types.Content], state) -> str:
+    """What a draft depends on: the trainee's messages and the state the
+    agents read (other agents' replies, tool calls and prompts are left out)"""
+    request = LlmRequest(contents=[content for content in contents if _is_trainee_message(content)])
+    digest = hashlib.sha256()
+    for piece in (normalize_request(request), state_hash(state, DEFAULT_STATE_KEYS)):
+        digest.update(piece.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class StagePreparationPlugin(BasePlugin):
+    def __init__(self,
+                 root_agent: LlmAgent,
+                 handovers=HANDOVERS,
+                 max_user_turns: int = 2,
+                 ttl: float = 300.0,
+                 usage: UsagePlugin = None,
+                 name: str = "stage_preparation"):
+        """
+        Prepare the next stage's agent before the handover
+
+        The next agents' models are resolved here without changing the
+        agents: model instances (e.g. hedged models) are shared with their
+        turns, model names get an instance of their own for warming and
+        drafting.
+
+        Args:
+            root_agent: Agent tree containing the handover agents
+            handovers: Which events trigger preparing which agent
+            max_user_turns: Trainee messages after the trigger before the
+                preparation is considered off-track and discarded
+            ttl: Seconds a preparation is kept without being used
+            usage: Charged for the drafts, served or not (they skip the
+                UsagePlugin's own accounting)
+        """
+        super().__init__(name=name)
+        self.handovers = handovers
+        self.max_user_turns = max_user_turns
+        self.ttl = ttl
+        self.usage = usage
+        self.stats = PreparationStats()
+        self.agents: Dict[str, LlmAgent] = {}
+        self.models: Dict[str, BaseLlm] = {}
+        for handover in handovers:
+            agent = root_agent.find_agent(handover.to_agent)
+            if agent is None:
+                raise ValueError(f"Unknown agent: {handover.to_agent}")
+            self.agents[handover.to_agent] = agent
+            self.models[handover.to_agent] = agent.canonical_model
+        # session id -> preparation in progress
+        self._prepared: Dict[str, _Preparation] = {}
+
+    def _discard(self, session_id: str, expired: bool = False):
+        preparation = self._prepared.pop(session_id, None)
+        if preparation is None:
+            return
+        if preparation.task and not preparation.task.done():
+            preparation.task.cancel()
+        if expired:
+            self.stats.expired += 1
+        else:
+            self.stats.discarded += 1
+
+    async def on_user_message_callback(
+        self, *, invocation_context: InvocationContext, user_message: types.Content
+    ) -> Optional[types.Content]:
+        session_id = invocation_context.session.id
+        preparation = self._prepared.get(session_id)
+        if preparation is None:
+            return None
+        preparation.user_turns += 1
+        if time.monotonic() - preparation.started > self.ttl:
+            self._discard(session_id, expired=True)
+        elif preparation.user_turns > self.max_user_turns:
+            self._discard(session_id)
+        return None
+
+    async def on_event_callback(
+        self, *, invocation_context: InvocationContext, event: Event
+    ) -> Optional[Event]:
+        if event.partial:
+            return None
+        session = invocation_context.session
+        current = self._prepared.get(session.id)
+        for handover in self.handovers:
+            if event.author != handover.from_agent or not handover.trigger(event):
+                continue
+            if current and current.agent_name == handover.to_agent:
+                break
+            self._discard(session.id)
+            self.stats.triggered += 1
+            events = session.events + [event]
+            # The trigger's own state changes are applied after this callback
+            state = {**session.state, **(event.actions.state_delta if event.actions else {})}
+            preparation = _Preparation(
+                agent_name=handover.to_agent,
+                started=time.monotonic(),
+                key=preparation_key(transcript_contents(events, handover.to_agent), state),
+            )
+            preparation.task = asyncio.create_task(self._prepare(handover, events, session.id))
+            self._prepared[session.id] = preparation
+            break
+        return None
+
+    async def _prepare(self, handover: Handover, events: List[Event], session_id: str) -> Optional[LlmResponse]:
+        """Build the next agent's request, warm its connection, maybe draft"""
+        # Extra calls made for the draft (e.g. hedges) go to the next agent
+        set_current_call(self.usage, session_id, handover.to_agent)
+        agent = self.agents[handover.to_agent]
+        model = self.models[handover.to_agent]
+        if not isinstance(agent.instruction, str):
+            return None
+
+        request = LlmRequest(
+            model=model.model,
+            contents=transcript_contents(events, agent.name),
+            config=types.GenerateContentConfig(system_instruction=agent.instruction),
+        )
+
+        try:
+            client = getattr(model, "api_client", None)
+            if client is not None:
+                started = time.perf_counter()
+                await client.aio.models.count_tokens(model=model.model, contents=request.contents)
+                self.stats.warmed += 1
+                self.stats.warm_ms.append((time.perf_counter() - started) * 1000)
+                del self.stats.warm_ms[:-256]
+
+            if not handover.draft:
+                return None
+            started = time.perf_counter()
+            draft = None
+            async for response in model.generate_content_async(request, stream=False):
+                if not response.partial:
+                    draft = response
+            if self.usage and draft is not None:
+                self.usage.charge(session_id, agent.name, request.model, draft.usage_metadata)
+            if draft is not None and draft.content and not draft.error_code:
+                self.stats.drafted += 1
+                self.stats.draft_ms.append((time.perf_counter() - started) * 1000)
+                del self.stats.draft_ms[:-256]
+                return draft
+        except Exception as e:
+            print(f"Error preparing {agent.name}: {e}")
+        return None
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        session_id = callback_context.session.id
+        preparation = self._prepared.get(session_id)
+        if preparation is None or preparation.agent_name != callback_context.agent_name:
+            return None
+
+        # The handover happened; use the preparation at most once
+        del self._prepared[session_id]
+        if time.monotonic() - preparation.started > self.ttl:
+            preparation.task.cancel()
+            self.stats.expired += 1
+            return None
+        if preparation_key(llm_request.contents, callback_context.state) != preparation.key:
+            # The trainee said something else, or the state moved on
+            preparation.task.cancel()
+            self.stats.mismatched += 1
+            return None
+
+        try:
+            # Still drafting: finishing the draft beats starting over
+            draft = await preparation.task
+        except asyncio.CancelledError:
+            return None
+        if draft is None:
+            return None
+        self.stats.served += 1
+        return draft
+
+    def get_stats(self) -> dict:
+        def average(samples):
+            return round(sum(samples) / len(samples), 1) if samples else 0.0
+
+        stats = asdict(self.stats)
+        stats["warm_ms_avg"] = average(stats.pop("warm_ms"))
+        stats["draft_ms_avg"] = average(stats.pop("draft_ms"))
+        stats["pending"] = len(self._prepared)
+        return stats
@@ -1,7 +1,13 @@
 import asyncio
 import os
-from sub_agents.tts_agent import TTSAgent
-from sub_agents.stt_agent import STTAgent
+import sys
+
+# Allow running as a script from this directory; the agents import shared
+# modules from the emergency_room_agent package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emergency_room_agent.sub_agents.tts_agent import TTSAgent
+from emergency_room_agent.sub_agents.stt_agent import STTAgent
 
 async def quick_tts_test():
     """Test TTS only - no microphone needed"""
@@ -64,6 +70,9 @@ async def quick_combined_test():
         credentials_path="./google-cloud-credentials.json"  
     )
     
+    # A newer turn supersedes queued replies of older ones
+    turn_id = 0
+    
     # Simple responses
     responses = {
         "hello": "Hello! How can I help you today?",
@@ -72,7 +81,12 @@ async def quick_combined_test():
         "chest": "Chest pain can be serious. Are you having trouble breathing?"
     }
     
+    async def on_speech_start():
+        # Stop the reply when the user talks over it
+        tts.scheduler.interrupt()
+    
     def on_final_speech(transcript):
+        nonlocal turn_id
         print(f"You said: {transcript}")
         
         # Simple keyword matching for responses
@@ -85,13 +99,17 @@ async def quick_combined_test():
                 break
         
         print(f"Responding: {response}")
-        asyncio.create_task(tts.speak_text(response))
+        turn_id += 1
+        tts.enqueue_speech(response, turn_id=turn_id)
     
     print("Say something like 'hello', 'help', 'I have chest pain'...")
     print("Press Ctrl+C to stop.")
     
     try:
-        await stt.start_continuous_recognition(on_final=on_final_speech)
+        await stt.start_continuous_recognition(
+            on_final=on_final_speech,
+            on_speech_start=on_speech_start
+        )
     except KeyboardInterrupt:
         print("Stopping conversation...")
         stt.stop_listening()
@@ -0,0 +1,177 @@
+"""
+Process-wide pool of Google Cloud clients and audio device handles.
+
+Creating a SpeechClient / TextToSpeechClient opens a new gRPC channel (and a
+TLS handshake on first use), and every PyAudio() instance re-initialises
+PortAudio. Agents built per session ask the shared ResourceManager instead,
+which hands out warmed clients keyed by credentials and reference-counts the
+audio backend.
+"""
+import asyncio
+import atexit
+import itertools
+import threading
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+from google.cloud import speech
+from google.cloud import texttospeech
+from google.oauth2 import service_account
+
+
+class ResourceManager:
+    def __init__(self, pool_size: int = 4):
+        """
+        Initialize an empty resource pool
+
+        Args:
+            pool_size: Clients (gRPC channels) kept per kind and credentials.
+                A channel multiplexes ~100 concurrent streams, so streaming
+                recognition for hundreds of sessions needs several.
+        """
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._credentials: Dict[str, service_account.Credentials] = {}
+        self._pools: Dict[Tuple, list] = {}
+        self._cursors: Dict[Tuple, itertools.cycle] = {}
+        # grpc.aio channels are bound to the loop they were created on, so
+        # async clients are pooled per loop: (pools, cursors)
+        self._loop_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[dict, dict]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._audio = None
+        self._audio_refs = 0
+        self._closed = False
+
+    def _get_credentials(self, credentials_path: Optional[str]):
+        """Load service account credentials once per file (None = default credentials)"""
+        if not credentials_path:
+            return None
+        if credentials_path not in self._credentials:
+            self._credentials[credentials_path] = (
+                service_account.Credentials.from_service_account_file(credentials_path)
+            )
+        return self._credentials[credentials_path]
+
+    def _get_client(self, key: Tuple, factory: Callable, credentials_path: Optional[str],
+                    loop: asyncio.AbstractEventLoop = None):
+        """Return the next pooled client for key, creating the pool on first use"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ResourceManager has been shut down")
+            if loop is None:
+                pools, cursors = self._pools, self._cursors
+            else:
+                # Clients of a closed loop can't be used or closed any more
+                for closed in [other for other in self._loop_pools if other.is_closed()]:
+                    del self._loop_pools[closed]
+                pools, cursors = self._loop_pools.setdefault(loop, ({}, {}))
+            if key not in pools:
+                credentials = self._get_credentials(credentials_path)
+                pools[key] = [factory(credentials=credentials) for _ in range(self.pool_size)]
+                cursors[key] = itertools.cycle(pools[key])
+            return next(cursors[key])
+
+    def speech_client(self, credentials_path: str = None) -> speech.SpeechClient:
+        return self._get_client(("speech", credentials_path), speech.SpeechClient, credentials_path)
+
+    def speech_async_client(self, credentials_path: str = None) -> speech.SpeechAsyncClient:
+        return self._get_client(("speech_async", credentials_path), speech.SpeechAsyncClient,
+                                credentials_path, loop=asyncio.get_running_loop())
+
+    async def release_loop(self):
+        """Close the async clients created on the running loop; call before it closes"""
+        with self._lock:
+            pools, _ = self._loop_pools.pop(asyncio.get_running_loop(), ({}, {}))
+        for key, pool in pools.items():
+            for client in pool:
+                try:
+                    await client.transport.close()
+                except Exception as e:
+                    print(f"Error closing {key[0]} client: {e}")
+
+    def tts_client(self, credentials_path: str = None) -> texttospeech.TextToSpeechClient:
+        return self._get_client(("tts", credentials_path),
+                                texttospeech.TextToSpeechClient, credentials_path)
+
+    def warm_up(self, credentials_path: str = None, timeout: float = 10.0):
+        """
+        Open the gRPC channels of the sync clients ahead of the first session
+
+        Args:
+            credentials_path: Credentials whose pools should be warmed
+            timeout: Seconds to wait for each channel to connect
+        """
+        import grpc
+
+        try:
+            self.speech_client(credentials_path)
+            self.tts_client(credentials_path)
+        except Exception as e:
+            print(f"Error creating Google clients: {e}")
+            return
+        for kind in ("speech", "tts"):
+            for client in self._pools[(kind, credentials_path)]:
+                try:
+                    grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=timeout)
+                except Exception as e:
+                    print(f"Error warming up {kind} client: {e}")
+
+    def acquire_audio(self):
+        """Return the shared PyAudio instance, initialising PortAudio on first use"""
+        import pyaudio
+
+        with self._lock:
+            if self._audio is None:
+                self._audio = pyaudio.PyAudio()
+            self._audio_refs += 1
+            return self._audio
+
+    def release_audio(self):
+        """Drop one audio reference, terminating PortAudio when none remain"""
+        with self._lock:
+            if self._audio_refs == 0:
+                return
+            self._audio_refs -= 1
+            if self._audio_refs == 0 and self._audio is not None:
+                self._audio.terminate()
+                self._audio = None
+
+    def get_stats(self) -> dict:
+        client_pools = {"/".join(str(part) for part in key): len(pool)
+                        for key, pool in self._pools.items()}
+        for pools, _ in list(self._loop_pools.values()):
+            for key, pool in pools.items():
+                name = "/".join(str(part) for part in key)
+                client_pools[name] = client_pools.get(name, 0) + len(pool)
+        return {
+            "client_pools": client_pools,
+            "event_loops": len(self._loop_pools),
+            "audio_refs": self._audio_refs,
+        }
+
+    def shutdown(self):
+        """Close every pooled channel and release the audio backend"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            pools, self._pools = self._pools, {}
+            self._cursors = {}
+            # Async clients need their loop to close, see release_loop()
+            self._loop_pools.clear()
+            audio, self._audio = self._audio, None
+            self._audio_refs = 0
+
+        for key, pool in pools.items():
+            for client in pool:
+                try:
+                    client.transport.close()
+                except Exception as e:
+                    print(f"Error closing {key[0]} client: {e}")
+        if audio is not None:
+            audio.terminate()
+
+
+default_resources = ResourceManager()
+atexit.register(default_resources.shutdown)
@@ -0,0 +1,209 @@
+"""
+Exact-match LLM response cache shared by every session in the process.
+
+Many turns are identical across trainees (doctor_agent's scripted "Hi there,
+I'm Dr. Wang..." intro, greetings to nurse_agent). ResponseCachePlugin keys
+each model call on (agent name, model, normalized prompt, hash of the state
+keys that agent depends on) and serves repeats straight from memory, skipping
+the model. Only allowlisted agents are cached.
+"""
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+
+# State that shapes the agents' answers; anything else (ids, timings) is ignored
+DEFAULT_STATE_KEYS = ("states", "patient_information", "session_flags")
+
+
+def _normalize_text(text: str) -> str:
+    # Whitespace only: case carries meaning here (names, drugs, "ASA" vs "asa")
+    return " ".join(text.split())
+
+
+def _normalize_part(part) -> dict:
+    if part.text is not None:
+        return {"text": _normalize_text(part.text)}
+    if part.function_call:
+        # Call ids are random per session and must not affect the key
+        return {"call": part.function_call.name, "args": part.function_call.args}
+    if part.function_response:
+        return {"response": part.function_response.name, "data": part.function_response.response}
+    return {"other": part.model_dump(mode="json", exclude_none=True)}
+
+
+def normalize_request(llm_request: LlmRequest) -> str:
+    """Canonical JSON of what the model sees: instruction, tools and contents"""
+    config = llm_request.config
+    system_instruction = config.system_instruction if config else None
+    if system_instruction is not None and not isinstance(system_instruction, str):
+        system_instruction = json.dumps(
+            system_instruction.model_dump(mode="json", exclude_none=True), sort_keys=True
+        )
+    canonical = {
+        "system": re.sub(r"\s+", " ", system_instruction or "").strip(),
+        "tools": sorted(llm_request.tools_dict),
+        "contents": [
+            {"role": content.role, "parts": [_normalize_part(part) for part in content.parts or []]}
+            for content in llm_request.contents
+        ],
+    }
+    return json.dumps(canonical, sort_keys=True, default=str)
+
+
+def state_hash(state, keys: Iterable[str]) -> str:
+    relevant = {key: state.get(key) for key in keys}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    bytes_stored: int = 0
+    bytes_served: int = 0
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0):
+        """
+        In-memory LRU store with per-entry TTL
+
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            max_bytes: Total serialized response size kept
+            ttl: Seconds an entry stays valid
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        stored_at, payload = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        self.stats.bytes_served += len(payload)
+        return payload
+
+    def put(self, key: str, payload: str):
+        if len(payload) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic(), payload)
+        self.stats.stores += 1
+        self.stats.bytes_stored += len(payload)
+        while len(self._entries) > self.max_entries or self.stats.bytes_stored > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def _remove(self, key: str):
+        _, payload = self._entries.pop(key)
+        self.stats.bytes_stored -= len(payload)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCachePlugin(BasePlugin):
+    """Serve repeated model calls of allowlisted agents from a ResponseCache"""
+
+    def __init__(self,
+                 allowlist: Dict[str, Iterable[str]],
+                 cache: ResponseCache = None,
+                 name: str = "response_cache"):
+        """
+        Args:
+            allowlist: Agent name -> state keys its responses depend on
+            cache: Shared store (a new in-memory cache if not given)
+        """
+        super().__init__(name=name)
+        self.allowlist = {agent: tuple(keys) for agent, keys in allowlist.items()}
+        self.cache = cache or ResponseCache()
+        self.agent_stats: Dict[str, CacheStats] = {}
+        self._pending: Dict[tuple, str] = {}
+
+    def cache_key(self, callback_context: CallbackContext, llm_request: LlmRequest) -> str:
+        agent_name = callback_context.agent_name
+        digest = hashlib.sha256()
+        for piece in (
+            agent_name,
+            llm_request.model or "",
+            normalize_request(llm_request),
+            state_hash(callback_context.state, self.allowlist[agent_name]),
+        ):
+            digest.update(piece.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        agent_name = callback_context.agent_name
+        if agent_name not in self.allowlist:
+            return None
+
+        key = self.cache_key(callback_context, llm_request)
+        stats = self.agent_stats.setdefault(agent_name, CacheStats())
+        payload = self.cache.get(key)
+        if payload is None:
+            stats.misses += 1
+            self._pending[(callback_context.invocation_id, agent_name)] = key
+            return None
+
+        stats.hits += 1
+        stats.bytes_served += len(payload)
+        return LlmResponse.model_validate_json(payload)
+
+    async def after_model_callback(
+        self, *, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> Optional[LlmResponse]:
+        key = self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if key is None or llm_response.partial or llm_response.error_code or not llm_response.content:
+            return None
+
+        cached = llm_response.model_copy(deep=True)
+        for part in cached.content.parts or []:
+            if part.function_call:
+                part.function_call.id = None  # reassigned per session by ADK
+        payload = cached.model_dump_json(exclude_none=True)
+        self.cache.put(key, payload)
+
+        stats = self.agent_stats.setdefault(callback_context.agent_name, CacheStats())
+        stats.stores += 1
+        stats.bytes_stored += len(payload)
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> Optional[LlmResponse]:
+        self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        return None
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.cache),
+            "total": asdict(self.cache.stats),
+            "agents": {agent: asdict(stats) for agent, stats in self.agent_stats.items()},
+        }
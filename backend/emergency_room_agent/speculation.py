@@ -0,0 +1,302 @@
+"""
+Speculative agent turns on stable interim STT transcripts.
+
+STTAgent reports interim transcripts long before the final one. When an
+interim transcript has not changed for `stability_window` seconds, the turn
+is started on it against a sandboxed copy of the session. If the final
+transcript matches, the sandbox events are committed to the real session and
+the model latency has already been (partly) paid; otherwise the speculation
+is discarded and the turn runs normally.
+
+VoicePipeline uses it when given a speculator (main.py --voice with
+ER_VOICE_SPECULATE=true). Sandbox runs only get the plugins passed in
+(main.py passes admission control and a replaying cassette), so a
+speculation that is thrown away doesn't charge usage, record analytics or
+fill the response cache. The session's budget still applies to sandbox
+calls, and a committed speculation is charged to the session's usage and
+recorded by analytics when it is appended.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from .analytics import TurnRecorderPlugin
+from .usage import UsagePlugin
+
+
+def normalize_transcript(text: str) -> str:
+    """Compare transcripts ignoring case, punctuation and extra whitespace"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+@dataclass
+class SpeculationStats:
+    """Speculation outcome counters (shared by all sessions of a runner)"""
+    speculations: int = 0
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    latency_saved_ms: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        finals = self.hits + self.misses
+        return self.hits / finals if finals else 0.0
+
+
+class _SandboxBudgetPlugin(BasePlugin):
+    """Applies the session's budget to sandbox calls without charging them"""
+
+    def __init__(self, usage: UsagePlugin):
+        super().__init__(name="speculation_budget")
+        self.usage = usage
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        # The sandbox starts from a copy of the real state, usage included
+        self.usage.apply_budget(callback_context.state.get("usage"), llm_request)
+        return None
+
+
+def _log_discarded(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error in discarded speculative turn: {task.exception()}")
+
+
+@dataclass
+class _Speculation:
+    user_id: str
+    session_id: str
+    transcript: str
+    base_event_count: int
+    started: float
+    task: asyncio.Task
+    finished: Optional[float] = None
+
+
+class SpeculativeTurnRunner:
+    def __init__(self,
+                 runner: Runner,
+                 stability_window: float = 0.6,
+                 plugins: List[BasePlugin] = None,
+                 usage: UsagePlugin = None,
+                 recorder: TurnRecorderPlugin = None):
+        """
+        Opt-in wrapper that runs agent turns ahead of the final transcript
+
+        Args:
+            runner: The real runner; its agent and app name are reused for
+                the sandbox runs
+            stability_window: Seconds an interim transcript must stay
+                unchanged before a speculative turn starts
+            plugins: Plugins for the sandbox runs, e.g. the real runner's
+                AdmissionPlugin and a replaying CassettePlugin. Nothing that
+                charges or records per call: discarded runs go through them
+            usage: The real runner's UsagePlugin; its budgets apply to the
+                sandbox runs and committed model calls are charged to it
+            recorder: The real runner's TurnRecorderPlugin; committed turns
+                are recorded with it
+        """
+        self.runner = runner
+        self.stability_window = stability_window
+        self.usage = usage
+        self.recorder = recorder
+        self.sandbox_service = InMemorySessionService()
+        self.sandbox_runner = Runner(
+            agent=runner.agent,
+            app_name=runner.app_name,
+            session_service=self.sandbox_service,
+            plugins=[*(plugins or []), *([_SandboxBudgetPlugin(usage)] if usage else [])],
+        )
+        self.stats = SpeculationStats()
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._last_interim: Dict[str, str] = {}
+        self._speculations: Dict[str, _Speculation] = {}
+
+    def on_interim(self, user_id: str, session_id: str, transcript: str):
+        """
+        Feed an interim transcript; (re)arms the stability timer
+
+        Safe to pass directly as (a wrapper around) STTAgent's on_transcript.
+        """
+        normalized = normalize_transcript(transcript)
+        if not normalized or self._last_interim.get(session_id) == normalized:
+            return
+        self._last_interim[session_id] = normalized
+
+        timer = self._timers.pop(session_id, None)
+        if timer:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[session_id] = loop.call_later(
+            self.stability_window, self._speculate, user_id, session_id, transcript
+        )
+
+    def _speculate(self, user_id: str, session_id: str, transcript: str):
+        """Start a sandboxed turn on a transcript that stopped changing"""
+        self._timers.pop(session_id, None)
+        current = self._speculations.get(session_id)
+        if current and normalize_transcript(current.transcript) == normalize_transcript(transcript):
+            return
+        self._discard(session_id)
+
+        self.stats.speculations += 1
+        speculation = _Speculation(
+            user_id=user_id,
+            session_id=session_id,
+            transcript=transcript,
+            base_event_count=-1,
+            started=time.perf_counter(),
+            task=None,
+        )
+        speculation.task = asyncio.create_task(self._run_sandboxed(speculation))
+        self._speculations[session_id] = speculation
+
+    async def _run_sandboxed(self, speculation: _Speculation) -> list:
+        """Run the turn against a copy of the session; return the new events"""
+        real = await self.runner.session_service.get_session(
+            app_name=self.runner.app_name,
+            user_id=speculation.user_id,
+            session_id=speculation.session_id,
+        )
+        if real is None:
+            raise ValueError(f"Session {speculation.session_id} not found")
+        speculation.base_event_count = len(real.events)
+
+        sandbox_id = f"{real.id}::speculative::{self.stats.speculations}"
+        sandbox = await self.sandbox_service.create_session(
+            app_name=real.app_name,
+            user_id=real.user_id,
+            session_id=sandbox_id,
+            state=dict(real.state),
+        )
+        try:
+            # Replaying the history re-applies state deltas onto the already
+            # final state, which leaves it unchanged
+            for event in real.events:
+                await self.sandbox_service.append_event(sandbox, event)
+
+            content = types.Content(role="user", parts=[types.Part(text=speculation.transcript)])
+            async for _ in self.sandbox_runner.run_async(
+                user_id=real.user_id, session_id=sandbox_id, new_message=content
+            ):
+                pass
+
+            sandbox = await self.sandbox_service.get_session(
+                app_name=real.app_name, user_id=real.user_id, session_id=sandbox_id
+            )
+            speculation.finished = time.perf_counter()
+            return sandbox.events[len(real.events):]
+        finally:
+            await self.sandbox_service.delete_session(
+                app_name=real.app_name, user_id=real.user_id, session_id=sandbox_id
+            )
+
+    def _discard(self, session_id: str):
+        speculation = self._speculations.pop(session_id, None)
+        if speculation:
+            self._drop(speculation)
+
+    @staticmethod
+    def _drop(speculation: _Speculation):
+        """Cancel a speculation nobody will commit, logging its error if it failed"""
+        speculation.task.cancel()
+        speculation.task.add_done_callback(_log_discarded)
+
+    async def run_final(self, user_id: str, session_id: str, transcript: str) -> List:
+        """
+        Run (or commit) the turn for a final transcript
+
+        Returns:
+            The turn's events, in order, as appended to the real session
+        """
+        final_at = time.perf_counter()
+        timer = self._timers.pop(session_id, None)
+        if timer:
+            timer.cancel()
+        self._last_interim.pop(session_id, None)
+
+        speculation = self._speculations.pop(session_id, None)
+        if speculation:
+            if normalize_transcript(speculation.transcript) == normalize_transcript(transcript):
+                events = await self._commit(speculation)
+                if events is not None:
+                    self.stats.hits += 1
+                    hidden_until = min(final_at, speculation.finished or final_at)
+                    self.stats.latency_saved_ms += (hidden_until - speculation.started) * 1000
+                    return events
+            else:
+                self.stats.misses += 1
+                self._drop(speculation)
+
+        content = types.Content(role="user", parts=[types.Part(text=transcript)])
+        return [
+            event
+            async for event in self.runner.run_async(
+                user_id=user_id, session_id=session_id, new_message=content
+            )
+        ]
+
+    async def _commit(self, speculation: _Speculation) -> Optional[list]:
+        """Append a matching speculation's events to the real session"""
+        try:
+            events = await speculation.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in speculative turn for session {speculation.session_id}: {e}")
+            return None
+
+        real = await self.runner.session_service.get_session(
+            app_name=self.runner.app_name,
+            user_id=speculation.user_id,
+            session_id=speculation.session_id,
+        )
+        if real is None or len(real.events) != speculation.base_event_count:
+            # Something else advanced the session meanwhile
+            self.stats.stale += 1
+            return None
+
+        state_before = dict(real.state)
+        for event in events:
+            await self.runner.session_service.append_event(real, event)
+        replies = [event for event in events if event.author != "user"]
+
+        # Added to state["usage"] with the session's next event
+        if self.usage:
+            for event in replies:
+                if event.usage_metadata:
+                    self.usage.charge(real.id, event.author, self._model(event), event.usage_metadata)
+        if self.recorder:
+            try:
+                await self.recorder.record_turn(real, events, state_before,
+                                                (speculation.finished - speculation.started) * 1000)
+            except Exception as e:
+                print(f"Error recording speculative turn for session {real.id}: {e}")
+        # Match run_async, which doesn't yield the user's own message
+        return replies
+
+    def _model(self, event) -> str:
+        """Model that answered event: the version it reports, else its agent's model"""
+        if event.model_version:
+            return event.model_version
+        agent = self.runner.agent.find_agent(event.author)
+        model = getattr(agent, "canonical_model", None)
+        return getattr(model, "model", None) or ""
+
+    def get_stats(self) -> dict:
+        return {
+            **asdict(self.stats),
+            "hit_rate": round(self.stats.hit_rate, 3),
+            "in_flight": len(self._speculations),
+        }
@@ -0,0 +1,240 @@
+"""
+Compact, typed representation of the simulation session state.
+
+The ADK session state is a nested dict of strings, and every session used to
+carry its own copy of the stage list and the scenario's patient data. Here the
+stages are an interned enum, vitals and flags are __slots__ dataclasses,
+patient data is one shared immutable record per scenario, and a SessionState
+only stores what actually changes during a simulation. to_adk_dict() and
+from_adk_dict() convert losslessly to and from the dict form ADK stores.
+"""
+import sys
+from dataclasses import dataclass, field, fields
+from enum import IntEnum
+from typing import Any, Dict, Optional
+
+
+class Stage(IntEnum):
+    S0_INITIAL_STABILIZATION = 0
+    S1_DIAGNOSTIC_CONFIRMATION = 1
+    S2_CRITICAL_CONSULTATION = 2
+    S3_SENIOR_HANDOVER = 3
+    S4_DEBRIEFING = 4
+
+
+STAGE_NAMES = tuple(sys.intern(stage.name) for stage in Stage)
+
+
+@dataclass(frozen=True, slots=True)
+class Vitals:
+    BP_Systolic: int
+    BP_Diastolic: int
+    HR: int
+    O2_Sat: int
+    O2_Source: str
+    Pain_Score: int
+
+
+@dataclass(frozen=True, slots=True)
+class History:
+    Age_Sex: str
+    Complaint: str
+    Known_History: str
+    Allergies: str
+
+
+@dataclass(frozen=True, slots=True)
+class PatientRecord:
+    """Scenario patient data, shared by every session of the scenario"""
+    patient_name: str
+    patient_age: int
+    vitals: Vitals
+    history: History
+
+    def to_dict(self) -> dict:
+        return {
+            "patient_name": self.patient_name,
+            "patient_age": self.patient_age,
+            "static_patient_data": {
+                "vitals_snapshot": _as_dict(self.vitals),
+                "history": _as_dict(self.history),
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, intern: bool = True) -> "PatientRecord":
+        static = data["static_patient_data"]
+        record = cls(
+            patient_name=data["patient_name"],
+            patient_age=data["patient_age"],
+            vitals=Vitals(**static["vitals_snapshot"]),
+            history=History(**static["history"]),
+        )
+        return intern_patient(record) if intern else record
+
+
+@dataclass(slots=True)
+class SessionFlags:
+    protocol_asa_given: bool = False
+    protocol_ecg_ordered: bool = False
+    protocol_diagnosis_confirmed: bool = False
+    protocol_nitro_or_morphine: bool = False
+
+
+def _as_dict(instance) -> dict:
+    return {f.name: getattr(instance, f.name) for f in fields(instance)}
+
+
+SCENARIOS: Dict[str, PatientRecord] = {
+    "stemi": PatientRecord(
+        patient_name="Brandon Hancock",
+        patient_age=55,
+        vitals=Vitals(BP_Systolic=118, BP_Diastolic=75, HR=105, O2_Sat=94,
+                      O2_Source="Room Air", Pain_Score=8),
+        history=History(Age_Sex="55-year-old male",
+                        Complaint="Crushing substernal chest pain",
+                        Known_History="Hypertension, Smoker",
+                        Allergies="None known"),
+    ),
+    "emergency-triage/1": PatientRecord(
+        patient_name="Sarah Johnson",
+        patient_age=34,
+        vitals=Vitals(BP_Systolic=90, BP_Diastolic=60, HR=110, O2_Sat=92,
+                      O2_Source="Room Air", Pain_Score=8),
+        history=History(Age_Sex="34-year-old female",
+                        Complaint="Motor vehicle accident with chest pain and difficulty breathing",
+                        Known_History="Asthma, Previous appendectomy",
+                        Allergies="Penicillin"),
+    ),
+}
+
+# Only the built-in scenarios are interned, so sessions with other patient
+# data can't grow these tables
+_PATIENTS: Dict[PatientRecord, PatientRecord] = {record: record for record in SCENARIOS.values()}
+_PATIENT_DICTS: Dict[PatientRecord, dict] = {}
+
+
+def intern_patient(record: PatientRecord) -> PatientRecord:
+    """Return the shared scenario instance equal to record, else record"""
+    return _PATIENTS.get(record, record)
+
+
+def _known_patient(record: PatientRecord) -> Optional[PatientRecord]:
+    """The scenario record for the same patient, ignoring vitals"""
+    for known in _PATIENTS:
+        if (known.patient_name, known.patient_age, known.history) == \
+                (record.patient_name, record.patient_age, record.history):
+            return known
+    return None
+
+
+_KNOWN_KEYS = {"states", "patient_information", "session_flags", "session_id"}
+_STATES_KEYS = {"current_stage", "stages"}
+_FLAG_NAMES = {f.name for f in fields(SessionFlags)}
+# A tuple, so no session can change the stage list of every other session
+_SHARED_STAGES = STAGE_NAMES
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Per-session state: a shared patient record plus the mutable parts"""
+    patient: PatientRecord
+    stage: Stage = Stage.S0_INITIAL_STABILIZATION
+    flags: SessionFlags = field(default_factory=SessionFlags)
+    session_id: Optional[str] = None
+    # Only set once a session's vitals diverge from the scenario snapshot
+    vitals: Optional[Vitals] = None
+    # Any other top-level keys (module_id, scenario_id, ...), kept verbatim
+    extra: Optional[Dict[str, Any]] = None
+    # Keys of state["session_flags"] / state["states"] not modelled above
+    extra_flags: Optional[Dict[str, Any]] = None
+    extra_states: Optional[Dict[str, Any]] = None
+
+    def to_adk_dict(self, share_static: bool = True) -> dict:
+        """
+        Convert to the nested dict ADK stores as session.state
+
+        Args:
+            share_static: Reuse one stage list and one patient dict for all
+                sessions of a scenario instead of copying them per session.
+                ADK state deltas replace top-level keys rather than mutating
+                them, so the shared objects stay intact; callers must treat
+                them as read-only. The session services keep these shared
+                objects in the sessions they store (see
+                benchmarks/session_state_memory.py); sessions reloaded from
+                disk or JSON get their own copies.
+        """
+        if self.vitals is None and share_static and self.patient in _PATIENTS:
+            patient = _PATIENT_DICTS.get(self.patient)
+            if patient is None:
+                patient = _PATIENT_DICTS[self.patient] = self.patient.to_dict()
+        else:
+            patient = self.patient.to_dict()
+            if self.vitals is not None:
+                patient["static_patient_data"]["vitals_snapshot"] = _as_dict(self.vitals)
+
+        state = {
+            "states": {
+                "current_stage": int(self.stage),
+                "stages": _SHARED_STAGES if share_static else list(STAGE_NAMES),
+                **(self.extra_states or {}),
+            },
+            "patient_information": patient,
+            "session_flags": {**_as_dict(self.flags), **(self.extra_flags or {})},
+        }
+        if self.session_id is not None:
+            state["session_id"] = self.session_id
+        if self.extra:
+            state.update(self.extra)
+        return state
+
+    @classmethod
+    def from_adk_dict(cls, state: dict) -> "SessionState":
+        """
+        Parse the ADK dict form
+
+        Raises:
+            ValueError: The dict uses a stage list other than STAGE_NAMES
+        """
+        stages = state["states"].get("stages", STAGE_NAMES)
+        if tuple(stages) != STAGE_NAMES:
+            raise ValueError(f"Unknown stage list: {stages}")
+
+        patient = PatientRecord.from_dict(state["patient_information"], intern=False)
+        vitals = patient.vitals
+        # A known patient whose vitals have changed keeps the shared record
+        # and stores only the new vitals
+        patient = _known_patient(patient) or patient
+        flags = state.get("session_flags", {})
+        extra = {key: value for key, value in state.items() if key not in _KNOWN_KEYS}
+        extra_flags = {key: value for key, value in flags.items() if key not in _FLAG_NAMES}
+        extra_states = {key: value for key, value in state["states"].items() if key not in _STATES_KEYS}
+        return cls(
+            patient=patient,
+            stage=Stage(state["states"]["current_stage"]),
+            flags=SessionFlags(**{key: value for key, value in flags.items() if key in _FLAG_NAMES}),
+            session_id=state.get("session_id"),
+            vitals=None if vitals == patient.vitals else vitals,
+            extra=extra or None,
+            extra_flags=extra_flags or None,
+            extra_states=extra_states or None,
+        )
+
+
+def build_initial_state(session_id: str = None, scenario: str = "stemi", **extra) -> dict:
+    """
+    Fresh ADK state dict for a new session
+    
+    The top-level dict and the mutable parts are new for every session; the
+    stage list and patient data are the shared read-only scenario objects.
+
+    Args:
+        session_id: Stored under state["session_id"]
+        scenario: Key of SCENARIOS
+        **extra: Additional top-level keys, e.g. module_id / scenario_id
+    """
+    return SessionState(
+        patient=SCENARIOS[scenario],
+        session_id=session_id,
+        extra=extra or None,
+    ).to_adk_dict()
@@ -0,0 +1,141 @@
+"""
+Versioned session state and a bounded log of state deltas, for incremental
+state sync.
+
+HibernatingSessionService stamps every event that changes state with the next
+state["state_version"] and records its state_delta here. A client that has
+version N then asks for the changes since N instead of the whole session:
+
+    GET /apps/{app}/users/{user}/sessions/{id}/state?since=N
+        200 {"version": V, "delta": {...}}   apply the delta (top-level keys replace)
+        304                                  nothing changed (also via If-None-Match)
+        410 {"version": V}                   too old: GET the full session again
+    GET /apps/{app}/users/{user}/sessions/{id}/state/stream?since=N
+        Server-sent events, one "delta" event per change (see api_server.py)
+
+Deltas replace top-level keys, as sessions apply them, so consecutive deltas
+merge into one with dict.update().
+"""
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict
+from typing import Deque, Optional, Tuple
+
+VERSION_KEY = "state_version"
+
+SessionKey = Tuple[str, str, str]
+
+
+@dataclass
+class StateSyncStats:
+    recorded: int = 0
+    # Requests answered with a delta / as unchanged / with a full resync
+    deltas: int = 0
+    not_modified: int = 0
+    resyncs: int = 0
+
+
+class _SessionLog:
+    __slots__ = ("version", "deltas", "changed")
+
+    def __init__(self, version: int, max_deltas: int):
+        self.version = version
+        # (version, delta), oldest first
+        self.deltas: Deque[Tuple[int, dict]] = deque(maxlen=max_deltas)
+        # Set (and replaced) on every change, to wake up pushing clients
+        self.changed: Optional[asyncio.Event] = None
+
+
+class StateLog:
+    def __init__(self, max_deltas: int = 64, max_sessions: int = 10000):
+        """
+        Recent state deltas per session
+
+        Args:
+            max_deltas: Deltas kept per session; clients further behind get
+                a full resync
+            max_sessions: Sessions with a log; least recently changed beyond
+                this are dropped (their clients resync)
+        """
+        self.max_deltas = max_deltas
+        self.max_sessions = max_sessions
+        self.stats = StateSyncStats()
+        self._logs: "OrderedDict[SessionKey, _SessionLog]" = OrderedDict()
+
+    def _log(self, key: SessionKey, version: int) -> _SessionLog:
+        log = self._logs.get(key)
+        if log is None:
+            log = self._logs[key] = _SessionLog(version, self.max_deltas)
+            while len(self._logs) > self.max_sessions:
+                self._logs.popitem(last=False)
+        return log
+
+    def seed(self, key: SessionKey, version: int):
+        """Start a session's log at its current version (e.g. after a restart)"""
+        self._log(key, version)
+
+    def record(self, key: SessionKey, version: int, delta: dict):
+        log = self._log(key, version - 1)
+        if version != log.version + 1:
+            # Versions skipped (e.g. the log was dropped): older clients resync
+            log.deltas.clear()
+        log.version = version
+        log.deltas.append((version, delta))
+        self._logs.move_to_end(key)
+        self.stats.recorded += 1
+        if log.changed is not None:
+            log.changed.set()
+            log.changed = None
+
+    def version(self, key: SessionKey) -> Optional[int]:
+        log = self._logs.get(key)
+        return log.version if log else None
+
+    def changes_since(self, key: SessionKey, since: int) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        Changes after version since
+
+        Returns:
+            (version, delta): delta is {} when nothing changed and None when
+            the changes are no longer known (the client must resync);
+            version is None for sessions without a log
+        """
+        log = self._logs.get(key)
+        if log is None:
+            self.stats.resyncs += 1
+            return None, None
+        if since == log.version:
+            self.stats.not_modified += 1
+            return log.version, {}
+        oldest = log.deltas[0][0] if log.deltas else log.version + 1
+        if since > log.version or since < oldest - 1:
+            self.stats.resyncs += 1
+            return log.version, None
+        delta = {}
+        for version, changes in log.deltas:
+            if version > since:
+                delta.update(changes)
+        self.stats.deltas += 1
+        return log.version, delta
+
+    async def wait_for_change(self, key: SessionKey, version: int, timeout: float) -> bool:
+        """Wait until the session's version moves past version; False on timeout"""
+        log = self._logs.get(key)
+        if log is None:
+            return False
+        if log.version != version:
+            return True
+        if log.changed is None:
+            log.changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(log.changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_stats(self) -> dict:
+        return {**asdict(self.stats), "sessions": len(self._logs)}
+
+
+# Shared by the session service and the API routes of a process
+default_state_log = StateLog()
@@ -1,14 +1,46 @@
+from functools import partial
 
 from google.adk.agents import Agent
 from google.adk.tools import FunctionTool, ToolContext
-from google.adk.events import Event, EventActions
 
+from ...tools import deep_merge, run_concurrently, update_state
+from .orders import handle_order
 
-def acknowledge_order(order: str) -> dict:
-    """Acknowledge the order"""
+
+async def acknowledge_orders(orders: list[str], tool_context: ToolContext) -> dict:
+    """
+    Carry out the doctor's orders, all of them in one call
+    (e.g. ["aspirin", "12-lead ECG", "oxygen"] for "give aspirin, get a
+    12-lead and start oxygen")
+    Moves the user to stage 1 once aspirin and the ECG have both been done
+    """
+    vitals = tool_context.state["patient_information"]["static_patient_data"]["vitals_snapshot"]
+    results = await run_concurrently([partial(handle_order, order, vitals["BP_Systolic"]) for order in orders])
+
+    acknowledged = []
+    changes = {}
+    for order, result in zip(orders, results):
+        if isinstance(result, Exception):
+            print(f"Error handling order {order!r}: {result}")
+            acknowledged.append({"order": order, "done": False, "response": "Could not do that one"})
+            continue
+        changes = deep_merge(changes, result.pop("changes"))
+        acknowledged.append(result)
+
+    flags = deep_merge(tool_context.state.get("session_flags") or {}, changes.get("session_flags", {}))
+    stage_updated = (
+        tool_context.state["states"]["current_stage"] == 0
+        and flags.get("protocol_asa_given") and flags.get("protocol_ecg_ordered")
+    )
+    if stage_updated:
+        changes = deep_merge(changes, {"states": {"current_stage": 1}})
+
+    # One delta for all the orders (and the stage change)
+    update_state(tool_context, changes)
     return {
-        "response": f"I did {order}, what else can I do?",
-        "order": order,
+        "orders": acknowledged,
+        "session_flags": flags,
+        "stage_updated": stage_updated,
     }
 
 def move_to_stage_1(tool_context: ToolContext, message: str) -> dict:
@@ -25,7 +57,7 @@ def move_to_stage_1(tool_context: ToolContext, message: str) -> dict:
         }
     }
 
-    actions_with_update = EventActions(state_delta=state_changes)
+    update_state(tool_context, state_changes)
 
     return {
         "response" : "Moving to stage 1",
@@ -71,7 +103,12 @@ Stage Transitions:
 
 If user orders ECG only: Drop subtle hints about missing interventions
 If user orders aspirin only: Drop subtle hints about diagnostic steps
-When user completes BOTH actions: Call move_to_stage_1 tool
+When user completes BOTH actions: acknowledge_orders moves the user to stage 1 (stage_updated in its result)
+
+Orders:
+
+Call acknowledge_orders ONCE per message with EVERY order in it, e.g. "give aspirin, get a 12-lead, and start oxygen" is one call with three orders
+Orders it reports as not done were held back: hint at the patient's condition instead
 
 Special ECG Handling:
 
@@ -170,5 +207,5 @@ Continue involvement after Stage 3 begins
         "protocol_diagnosis_confirmed": False,
         "protocol_nitro_or_morphine": False
     }""",
-    tools=[FunctionTool(acknowledge_order), FunctionTool(move_to_stage_1)],
+    tools=[FunctionTool(acknowledge_orders), FunctionTool(move_to_stage_1)],
 )
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""
+What the nurse does for each kind of order, and which protocol flags it sets.
+
+Handlers are independent of each other, so acknowledge_orders can run the
+orders of one message concurrently and merge their changes.
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class OrderType:
+    name: str
+    pattern: re.Pattern
+    # Protocol flag set once the order is carried out
+    flag: Optional[str]
+    done: str
+    # For medications: whether it is right for the patient's systolic BP
+    indicated: Optional[Callable[[int], bool]] = None
+
+
+ORDER_TYPES = (
+    OrderType("aspirin", re.compile(r"\b(aspirin|asa)\b"), "protocol_asa_given",
+              "Aspirin 324 milligrams, chewed"),
+    OrderType("ecg", re.compile(r"\b(ecg|ekg|12[- ]?lead|twelve[- ]lead)\b"), "protocol_ecg_ordered",
+              "12-lead ECG done: ST-segment elevation in leads V1 and V2"),
+    OrderType("nitroglycerin", re.compile(r"\b(nitro\w*|ntg)\b"), "protocol_nitro_or_morphine",
+              "Nitroglycerin 0.4 milligrams sublingual", indicated=lambda systolic: systolic > 100),
+    OrderType("morphine", re.compile(r"\bmorphine\b"), "protocol_nitro_or_morphine",
+              "Morphine for the pain", indicated=lambda systolic: systolic <= 100),
+    OrderType("oxygen", re.compile(r"\b(oxygen|o2|nasal cannula)\b"), None,
+              "Oxygen on, 2 liters by nasal cannula"),
+)
+
+
+def handle_order(order: str, systolic: int) -> dict:
+    """
+    Carry out one order
+
+    Returns:
+        The acknowledgement for the model plus "changes", the state changes
+        to merge (nested, see tools.update_state)
+    """
+    text = order.lower()
+    order_type = next((order_type for order_type in ORDER_TYPES if order_type.pattern.search(text)), None)
+    if order_type is None:
+        return {"order": order, "type": "other", "done": True, "response": f"Done: {order}", "changes": {}}
+
+    if order_type.indicated is not None and not order_type.indicated(systolic):
+        # Held back; the nurse hints at the patient's condition instead
+        return {"order": order, "type": order_type.name, "done": False,
+                "response": f"Holding {order_type.name} for now", "changes": {}}
+
+    changes = {"session_flags": {order_type.flag: True}} if order_type.flag else {}
+    return {"order": order, "type": order_type.name, "done": True, "response": order_type.done, "changes": changes}
@@ -1,2 +1,3 @@
 from .agent import STTAgent
-__all__ = ['STTAgent']
\ No newline at end of file
+from .ingest import AudioIngestHub
+__all__ = ['STTAgent', 'AudioIngestHub']
\ No newline at end of file
@@ -2,15 +2,30 @@ import asyncio
 import pyaudio
 import wave
 from google.cloud import speech
-from typing import Optional, Callable
+import inspect
+from typing import AsyncIterator, Optional, Callable
 import threading
 import queue
 
+from ...echo import EchoGate
+from ...resources import ResourceManager, default_resources
+
+async def _invoke(callback, *args):
+    """Call an optional sync or async callback"""
+    if callback is None:
+        return
+    outcome = callback(*args)
+    if inspect.isawaitable(outcome):
+        await outcome
+
+
 class STTAgent:
     def __init__(self, 
                  credentials_path: str = None,
                  language_code: str = "en-US",
-                 sample_rate: int = 16000):
+                 sample_rate: int = 16000,
+                 resources: ResourceManager = None,
+                 echo_gate: EchoGate = None):
         """
         Initialize STT Agent with Google Cloud Speech-to-Text
         
@@ -18,13 +33,14 @@ class STTAgent:
             credentials_path: Path to Google Cloud credentials JSON
             language_code: Language for speech recognition
             sample_rate: Audio sample rate
+            resources: Shared client/audio pool (defaults to the process-wide one)
+            echo_gate: Shared with the TTSAgent playing the replies; drops
+                microphone frames that are just the reply's echo
         """
-        # Set up Google Cloud credentials if provided
-        if credentials_path:
-            import os
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-        
-        self.client = speech.SpeechClient()
+        self.resources = resources or default_resources
+        self.credentials_path = credentials_path
+        self.client = self.resources.speech_client(credentials_path)
+        self.echo_gate = echo_gate
         self.language_code = language_code
         self.sample_rate = sample_rate
         self.is_listening = False
@@ -34,17 +50,27 @@ class STTAgent:
         self.chunk = 1024
         self.format = pyaudio.paInt16
         self.channels = 1
-        self.audio = pyaudio.PyAudio()
+        self._audio = None
+        
+    @property
+    def audio(self):
+        """Shared PyAudio handle, acquired on first microphone use"""
+        if self._audio is None:
+            self._audio = self.resources.acquire_audio()
+        return self._audio
         
     async def start_continuous_recognition(self, 
-                                         on_transcript: Callable[[str], None],
-                                         on_final: Callable[[str], None] = None):
+                                         on_transcript: Callable[[str], None] = None,
+                                         on_final: Callable[[str], None] = None,
+                                         on_speech_start: Callable[[], None] = None):
         """
         Start continuous speech recognition
         
         Args:
             on_transcript: Callback for interim transcripts
             on_final: Callback for final transcripts
+            on_speech_start: Callback when the speaker starts a new utterance
+                (used for barge-in)
         """
         self.is_listening = True
         
@@ -53,7 +79,7 @@ class STTAgent:
         record_thread.start()
         
         # Process audio stream
-        await self._process_audio_stream(on_transcript, on_final)
+        await self._process_audio_stream(on_transcript, on_final, on_speech_start)
         
     def _record_audio(self):
         """Record audio from microphone"""
@@ -68,6 +94,8 @@ class STTAgent:
         while self.is_listening:
             try:
                 data = stream.read(self.chunk, exception_on_overflow=False)
+                if self.echo_gate and not self.echo_gate.admit(data):
+                    continue
                 self.audio_queue.put(data)
             except Exception as e:
                 print(f"Error recording audio: {e}")
@@ -76,60 +104,119 @@ class STTAgent:
         stream.stop_stream()
         stream.close()
         
+    def microphone_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Start recording and return an async iterator over microphone chunks
+        (e.g. to feed a VoicePipeline); stop_listening() ends it
+        """
+        self.is_listening = True
+        threading.Thread(target=self._record_audio, daemon=True).start()
+        return self._microphone_chunks()
+        
+    async def _microphone_chunks(self):
+        """Async iterator over chunks queued by the recording thread"""
+        loop = asyncio.get_running_loop()
+        while self.is_listening:
+            try:
+                yield await loop.run_in_executor(None, self.audio_queue.get, True, 1.0)
+            except queue.Empty:
+                continue
+        
     async def _process_audio_stream(self, 
-                                  on_transcript: Callable[[str], None],
-                                  on_final: Callable[[str], None] = None):
+                                  on_transcript: Callable[[str], None] = None,
+                                  on_final: Callable[[str], None] = None,
+                                  on_speech_start: Callable[[], None] = None):
         """Process recorded audio with Google Speech-to-Text"""
+        # Responses are consumed on the event loop without blocking it, so
+        # playback and agent turns keep running (and can be cancelled)
+        # while the microphone is live
+        try:
+            await self.recognize_stream(
+                self._microphone_chunks(),
+                on_transcript,
+                on_final,
+                on_speech_start=on_speech_start,
+            )
+        except Exception as e:
+            print(f"Error in speech recognition: {e}")
+    
+    def _streaming_config(self, sample_rate: int = None):
+        """Build the streaming recognition config for a stream"""
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=self.sample_rate,
+            sample_rate_hertz=sample_rate or self.sample_rate,
             language_code=self.language_code,
             enable_automatic_punctuation=True,
         )
         
-        streaming_config = speech.StreamingRecognitionConfig(
+        return speech.StreamingRecognitionConfig(
             config=config,
             interim_results=True,
         )
         
-        def request_generator():
-            while self.is_listening:
-                try:
-                    data = self.audio_queue.get(timeout=1.0)
-                    yield speech.StreamingRecognizeRequest(audio_content=data)
-                except queue.Empty:
-                    continue
-                except Exception as e:
-                    print(f"Error in request generator: {e}")
-                    break
+    async def recognize_stream(self,
+                               audio_chunks: AsyncIterator[bytes],
+                               on_transcript: Callable[[str], None] = None,
+                               on_final: Callable[[str], None] = None,
+                               sample_rate: int = None,
+                               on_speech_start: Callable[[], None] = None):
+        """
+        Recognize audio pushed from a remote source (e.g. a browser WebSocket)
+        instead of the local microphone.
         
-        try:
-            requests = request_generator()
-            responses = self.client.streaming_recognize(streaming_config, requests)
-            
-            for response in responses:
-                if not self.is_listening:
-                    break
-                    
-                for result in response.results:
-                    transcript = result.alternatives[0].transcript
-                    
-                    if result.is_final:
-                        if on_final:
-                            on_final(transcript)
-                        else:
-                            on_transcript(transcript)
-                    else:
-                        on_transcript(transcript)
-                        
-        except Exception as e:
-            print(f"Error in speech recognition: {e}")
+        Each call is an independent recognition stream on the running event
+        loop, so one STTAgent can serve many sessions at once. Callbacks may
+        be plain functions or coroutines.
+        
+        Args:
+            audio_chunks: Async iterator of LINEAR16 mono PCM chunks
+            on_transcript: Callback for interim transcripts
+            on_final: Callback for final transcripts
+            sample_rate: Sample rate of the chunks (defaults to self.sample_rate)
+            on_speech_start: Callback on the first interim result of each
+                new utterance (used for barge-in)
+        """
+        async_client = self.resources.speech_async_client(self.credentials_path)
+        streaming_config = self._streaming_config(sample_rate)
+        
+        async def request_generator():
+            # The async client has no config helper, the first request
+            # must carry the streaming config on its own
+            yield speech.StreamingRecognizeRequest(streaming_config=streaming_config)
+            async for chunk in audio_chunks:
+                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+        
+        responses = await async_client.streaming_recognize(
+            requests=request_generator()
+        )
+        
+        in_utterance = False
+        async for response in responses:
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                transcript = result.alternatives[0].transcript
+                
+                if not in_utterance and transcript.strip():
+                    in_utterance = True
+                    await _invoke(on_speech_start)
+                
+                if result.is_final:
+                    in_utterance = False
+                    await _invoke(on_final or on_transcript, transcript)
+                else:
+                    await _invoke(on_transcript, transcript)
     
     def stop_listening(self):
         """Stop continuous recognition"""
         self.is_listening = False
         
+    def close(self):
+        """Release the shared audio handle"""
+        if getattr(self, '_audio', None) is not None:
+            self._audio = None
+            self.resources.release_audio()
+        
     def __del__(self):
         """Cleanup audio resources"""
-        if hasattr(self, 'audio'):
-            self.audio.terminate()
\ No newline at end of file
+        self.close()
\ No newline at end of file
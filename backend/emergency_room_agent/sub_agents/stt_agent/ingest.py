@@ -0,0 +1,286 @@
+"""
+Server-side audio ingestion for STTAgent.
+
+Browsers stream microphone audio over a WebSocket instead of using a local
+PyAudio microphone. Each connection becomes an AudioIngestSession that decodes
+its frames off the event loop and feeds its own recognition stream. All
+sessions share one STTAgent and one event loop, so a single process can serve
+hundreds of trainees.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Optional
+
+from ...audio import AudioConverter
+from .agent import STTAgent
+
+try:
+    import opuslib
+except ImportError:  # Opus ingest is optional, LINEAR16 always works
+    opuslib = None
+
+SUPPORTED_ENCODINGS = ("linear16", "float32", "opus")
+# Rate float32 (Web Audio) streams are resampled to for recognition
+RECOGNITION_SAMPLE_RATE = 16000
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class PcmDecoder:
+    """Pass-through decoder for LINEAR16 mono frames"""
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+
+    def decode(self, payload: bytes) -> bytes:
+        if len(payload) % 2:
+            raise ValueError("LINEAR16 frames must contain whole 16-bit samples")
+        return payload
+
+
+class OpusDecoder:
+    """Decode raw Opus packets (one packet per WebSocket message) to LINEAR16"""
+
+    def __init__(self, sample_rate: int):
+        if opuslib is None:
+            raise RuntimeError("Opus ingest requires opuslib: pip install opuslib")
+        if sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus cannot decode at {sample_rate} Hz")
+        self.sample_rate = sample_rate
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+        # Opus packets carry at most 120 ms of audio
+        self.max_frame_size = sample_rate * 120 // 1000
+
+    def decode(self, payload: bytes) -> bytes:
+        return self.decoder.decode(payload, self.max_frame_size)
+
+
+class ConvertingDecoder:
+    """Raw interleaved PCM in any layout -> mono LINEAR16 at target_rate"""
+
+    def __init__(self, sample_rate: int, channels: int, sample_format: str, target_rate: int):
+        self.converter = AudioConverter(sample_rate, channels, sample_format, out_rate=target_rate)
+        self.sample_rate = target_rate
+
+    def decode(self, payload: bytes) -> bytes:
+        return self.converter.convert(payload)
+
+
+def create_decoder(encoding: str, sample_rate: int, channels: int = 1):
+    """Return a decoder for a client-declared encoding"""
+    if encoding == "linear16":
+        if channels == 1:
+            return PcmDecoder(sample_rate)
+        return ConvertingDecoder(sample_rate, channels, "int16", sample_rate)
+    if encoding == "float32":
+        # e.g. a Web Audio worklet posting its 48 kHz Float32Arrays as-is
+        return ConvertingDecoder(sample_rate, channels, "float32", RECOGNITION_SAMPLE_RATE)
+    if encoding == "opus":
+        return OpusDecoder(sample_rate)
+    raise ValueError(f"Unsupported encoding '{encoding}', expected one of {SUPPORTED_ENCODINGS}")
+
+
+@dataclass
+class IngestStats:
+    """Per-connection ingest counters"""
+    frames_in: int = 0
+    bytes_in: int = 0
+    decode_errors: int = 0
+    backpressure_waits: int = 0
+
+
+class AudioIngestSession:
+    def __init__(self,
+                 session_id: str,
+                 decoder,
+                 executor: ThreadPoolExecutor,
+                 max_pending_frames: int = 50):
+        """
+        One remote audio stream feeding one recognition stream
+
+        Args:
+            session_id: Simulation session the audio belongs to
+            decoder: Decoder for the client's encoding
+            executor: Shared pool that runs decoding off the event loop
+            max_pending_frames: Decoded frames buffered before feed() blocks
+        """
+        self.session_id = session_id
+        self.decoder = decoder
+        self.executor = executor
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending_frames)
+        self.stats = IngestStats()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def sample_rate(self) -> int:
+        return self.decoder.sample_rate
+
+    def _check_recognition(self):
+        """Raise if the recognition stream has ended (it would never drain the queue)"""
+        if self.task is None or not self.task.done():
+            return
+        error = None if self.task.cancelled() else self.task.exception()
+        raise RuntimeError(
+            f"Speech recognition for session {self.session_id} stopped: {error or 'cancelled'}"
+        ) from error
+
+    async def feed(self, payload: bytes):
+        """
+        Decode one frame and queue it for recognition.
+
+        Blocks while the queue is full, which stops the caller from reading
+        the socket and pushes backpressure onto that one client.
+
+        Raises:
+            RuntimeError: The recognition stream has failed or ended
+        """
+        self._check_recognition()
+        self.stats.frames_in += 1
+        self.stats.bytes_in += len(payload)
+
+        loop = asyncio.get_running_loop()
+        try:
+            pcm = await loop.run_in_executor(self.executor, self.decoder.decode, payload)
+        except Exception as e:
+            self.stats.decode_errors += 1
+            print(f"Error decoding audio for session {self.session_id}: {e}")
+            return
+
+        if not self.queue.full():
+            self.queue.put_nowait(pcm)
+            return
+        self.stats.backpressure_waits += 1
+        if self.task is None:
+            await self.queue.put(pcm)
+            return
+        # Stop waiting if recognition dies while the queue is full
+        put = asyncio.ensure_future(self.queue.put(pcm))
+        try:
+            await asyncio.wait({put, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if not put.done() or put.cancelled():
+            self._check_recognition()
+
+    async def chunks(self):
+        """Async iterator of decoded PCM chunks, ends when the session closes"""
+        while True:
+            chunk = await self.queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def close(self, timeout: float = 5.0):
+        """
+        Finish the recognition stream, letting it drain buffered audio
+
+        Raises:
+            Exception: Whatever the recognition stream failed with
+        """
+        if self.task is None:
+            return
+        if not self.task.done():
+            try:
+                await asyncio.wait_for(self._finish(), timeout)
+            except asyncio.TimeoutError:
+                self.task.cancel()
+                return
+        if not self.task.cancelled() and self.task.exception():
+            raise self.task.exception()
+
+    async def _finish(self):
+        """Queue the end marker (unless recognition dies first) and wait for the stream"""
+        put = asyncio.ensure_future(self.queue.put(None))
+        await asyncio.wait({put, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+        await asyncio.wait({self.task})
+
+
+class AudioIngestHub:
+    def __init__(self,
+                 stt_agent: STTAgent = None,
+                 max_sessions: int = 500,
+                 decode_workers: int = 4,
+                 max_pending_frames: int = 50):
+        """
+        Multiplex many remote audio sessions onto one STTAgent
+
+        Args:
+            stt_agent: Shared STT agent (created on first use if not given)
+            max_sessions: Concurrent sessions accepted by this process
+            decode_workers: Threads used to decode frames off the event loop
+            max_pending_frames: Per-session buffer before backpressure applies
+        """
+        self.stt_agent = stt_agent
+        self.max_sessions = max_sessions
+        self.max_pending_frames = max_pending_frames
+        self.executor = ThreadPoolExecutor(max_workers=decode_workers,
+                                           thread_name_prefix="audio-decode")
+        self.sessions: Dict[str, AudioIngestSession] = {}
+
+    async def open_session(self,
+                           session_id: str,
+                           on_transcript: Callable[[str], None],
+                           on_final: Callable[[str], None] = None,
+                           encoding: str = "linear16",
+                           sample_rate: int = 16000,
+                           on_speech_start: Callable[[], None] = None,
+                           channels: int = 1) -> AudioIngestSession:
+        """
+        Start a recognition stream for a remote audio session
+
+        Raises:
+            ValueError: Unknown encoding or session already streaming
+            RuntimeError: Hub at capacity or decoder unavailable
+        """
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id} is already streaming audio")
+        if len(self.sessions) >= self.max_sessions:
+            raise RuntimeError("Audio ingest is at capacity, try again shortly")
+        if self.stt_agent is None:
+            self.stt_agent = STTAgent()
+
+        session = AudioIngestSession(
+            session_id,
+            create_decoder(encoding, sample_rate, channels),
+            self.executor,
+            self.max_pending_frames,
+        )
+        session.task = asyncio.create_task(
+            self.stt_agent.recognize_stream(
+                session.chunks(),
+                on_transcript,
+                on_final,
+                sample_rate=session.sample_rate,
+                on_speech_start=on_speech_start,
+            )
+        )
+        self.sessions[session_id] = session
+        return session
+
+    async def close_session(self, session_id: str):
+        """Close a session's recognition stream and forget it"""
+        session = self.sessions.pop(session_id, None)
+        if session:
+            await session.close()
+
+    def get_stats(self) -> dict:
+        """Snapshot of hub-wide and per-session ingest counters"""
+        return {
+            "active_sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "sessions": {
+                session_id: {**asdict(session.stats), "queued_frames": session.queue.qsize()}
+                for session_id, session in self.sessions.items()
+            },
+        }
+
+    async def shutdown(self):
+        """Close every session and stop the decode pool"""
+        await asyncio.gather(
+            *(self.close_session(session_id) for session_id in list(self.sessions)),
+            return_exceptions=True,
+        )
+        self.executor.shutdown(wait=False)
@@ -1,2 +1,2 @@
-from .agent import TTSAgent
-__all__ = ['TTSAgent']
\ No newline at end of file
+from .agent import TTSAgent, NETWORK_ENCODINGS, negotiate_audio_encoding
+__all__ = ['TTSAgent', 'NETWORK_ENCODINGS', 'negotiate_audio_encoding']
\ No newline at end of file
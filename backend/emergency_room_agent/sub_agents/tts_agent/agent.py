@@ -4,8 +4,85 @@ import wave
 import tempfile
 import os
 from google.cloud import texttospeech
-from typing import Optional
+from typing import AsyncIterator, Optional
 import io
+import re
+from collections import deque
+
+from ...audio import AudioConverter
+from ...echo import EchoGate
+from ...resources import ResourceManager, default_resources
+
+# Encodings offered to browsers: name -> (Google encoding, Content-Type)
+NETWORK_ENCODINGS = {
+    "ogg_opus": (texttospeech.AudioEncoding.OGG_OPUS, "audio/ogg; codecs=opus"),
+    "mp3": (texttospeech.AudioEncoding.MP3, "audio/mpeg"),
+}
+
+
+def negotiate_audio_encoding(accept: str = None, default: str = "ogg_opus") -> Optional[str]:
+    """
+    Pick a network encoding from an HTTP Accept header
+    
+    Args:
+        accept: Accept header value (e.g. 'audio/mpeg, audio/ogg;q=0.9')
+        default: Encoding used when the client accepts anything
+        
+    Returns:
+        Key of NETWORK_ENCODINGS, or None if nothing acceptable is offered
+    """
+    if not accept:
+        return default
+    
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip().lower() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+    
+    for _, _, media_type in sorted(candidates):
+        if media_type in ("*/*", "audio/*"):
+            return default
+        for name, (_, content_type) in NETWORK_ENCODINGS.items():
+            if media_type == content_type.split(";")[0]:
+                return name
+    return None
+
+
+# SSML prosody per emotion
+EMOTION_SETTINGS = {
+    "calm": {"rate": "slow", "pitch": "-2st"},
+    "urgent": {"rate": "fast", "pitch": "+3st"},
+    "concerned": {"rate": "medium", "pitch": "-1st"},
+    "reassuring": {"rate": "slow", "pitch": "-1st"}
+}
+
+
+def build_emotion_ssml(text: str, emotion: str) -> str:
+    """Wrap text in SSML prosody for an emotion (calm, urgent, concerned, reassuring)"""
+    settings = EMOTION_SETTINGS.get(emotion, {"rate": "medium", "pitch": "0st"})
+    
+    ssml = f"""
+    <speak>
+        <prosody rate="{settings['rate']}" pitch="{settings['pitch']}">
+            {text}
+        </prosody>
+    </speak>
+    """
+    return ssml.strip()
+
+
+def split_sentences(text: str) -> list:
+    """Split a reply into sentences so the first one can be sent early"""
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
 
 class TTSAgent:
     def __init__(self, 
@@ -13,7 +90,10 @@ class TTSAgent:
                  language_code: str = "en-US",
                  voice_name: str = None,
                  speaking_rate: float = 1.0,
-                 pitch: float = 0.0):
+                 pitch: float = 0.0,
+                 resources: ResourceManager = None,
+                 output_sample_rate: int = None,
+                 echo_gate: EchoGate = None):
         """
         Initialize TTS Agent with Google Cloud Text-to-Speech
         
@@ -23,19 +103,64 @@ class TTSAgent:
             voice_name: Specific voice name (e.g., 'en-US-Neural2-D')
             speaking_rate: Speech rate (0.25 to 4.0)
             pitch: Voice pitch (-20.0 to 20.0)
+            resources: Shared client/audio pool (defaults to the process-wide one)
+            output_sample_rate: Rate the output device runs at; synthesized
+                audio at another rate is resampled before playback
+                (None plays at the synthesized rate)
+            echo_gate: Shared with the STTAgent listening to the trainee;
+                every played frame is passed to it as the echo reference
         """
-        # Set up Google Cloud credentials if provided
-        if credentials_path:
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-        
-        self.client = texttospeech.TextToSpeechClient()
+        self.resources = resources or default_resources
+        self.credentials_path = credentials_path
+        self.client = self.resources.tts_client(credentials_path)
         self.language_code = language_code
         self.voice_name = voice_name
         self.speaking_rate = speaking_rate
         self.pitch = pitch
+        self.output_sample_rate = output_sample_rate
+        self.echo_gate = echo_gate
+        
+        # Audio playback handle, acquired on first playback
+        self._audio = None
+        self._scheduler = None
+        
+    @property
+    def audio(self):
+        """Shared PyAudio handle, acquired on first playback"""
+        if self._audio is None:
+            self._audio = self.resources.acquire_audio()
+        return self._audio
+        
+    @property
+    def scheduler(self):
+        """This session's prioritized output queue (see enqueue_speech)"""
+        if self._scheduler is None:
+            from .scheduler import AudioOutputScheduler
+            self._scheduler = AudioOutputScheduler(self)
+        return self._scheduler
         
-        # Audio playback settings
-        self.audio = pyaudio.PyAudio()
+    def enqueue_speech(self,
+                       text: str,
+                       emotion: str = None,
+                       priority: int = None,
+                       turn_id: int = None):
+        """
+        Queue text for playback instead of playing it right away
+        
+        Utterances play one at a time in priority order; emotion="urgent"
+        preempts whatever is playing (which plays again afterwards), and a
+        newer turn_id supersedes queued utterances of older turns.
+        
+        Args:
+            text: Text to speak
+            emotion: Optional emotion (calm, urgent, concerned, reassuring)
+            priority: Override the priority derived from the emotion
+            turn_id: Agent turn the utterance belongs to
+            
+        Returns:
+            The queued Utterance; await utterance.wait() for its outcome
+        """
+        return self.scheduler.enqueue(text, emotion=emotion, priority=priority, turn_id=turn_id)
         
     def get_available_voices(self, language_code: str = None):
         """
@@ -60,6 +185,92 @@ class TTSAgent:
                 
         return available_voices
         
+    async def synthesize_audio(self,
+                               text: str,
+                               encoding: str = "linear16",
+                               emotion: str = None) -> bytes:
+        """
+        Synthesize text to encoded audio without playing it
+        
+        Args:
+            text: Text to synthesize
+            encoding: 'linear16' or a key of NETWORK_ENCODINGS
+            emotion: Optional emotion, synthesized with SSML prosody like
+                speak_with_emotion
+            
+        Returns:
+            Encoded audio bytes (WAV, Ogg Opus or MP3)
+        """
+        if encoding == "linear16":
+            audio_encoding = texttospeech.AudioEncoding.LINEAR16
+        else:
+            audio_encoding = NETWORK_ENCODINGS[encoding][0]
+        
+        if emotion:
+            synthesis_input = texttospeech.SynthesisInput(ssml=build_emotion_ssml(text, emotion))
+            audio_config = texttospeech.AudioConfig(audio_encoding=audio_encoding)
+        else:
+            synthesis_input = texttospeech.SynthesisInput(text=text)
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=audio_encoding,
+                speaking_rate=self.speaking_rate,
+                pitch=self.pitch
+            )
+        
+        response = await asyncio.to_thread(
+            self.client.synthesize_speech,
+            input=synthesis_input,
+            voice=texttospeech.VoiceSelectionParams(
+                language_code=self.language_code,
+                name=self.voice_name
+            ),
+            audio_config=audio_config
+        )
+        return response.audio_content
+    
+    async def stream_for_network(self,
+                                 text: str,
+                                 encoding: str = "ogg_opus",
+                                 chunk_size: int = 8192,
+                                 synthesis_ahead: int = 2) -> AsyncIterator[bytes]:
+        """
+        Synthesize compressed audio for a browser and yield it in chunks
+        
+        The reply is synthesized sentence by sentence, a few sentences ahead,
+        and each sentence is streamed as soon as it is ready, so the client
+        can start playing the first sentence while the rest is synthesized.
+        Sentences are separate Ogg / MP3 streams back to back, which both
+        formats allow.
+        
+        Args:
+            text: Text to synthesize
+            encoding: Key of NETWORK_ENCODINGS ('ogg_opus' or 'mp3')
+            chunk_size: Bytes per yielded chunk
+            synthesis_ahead: Sentences synthesized concurrently
+        """
+        if encoding not in NETWORK_ENCODINGS:
+            raise ValueError(f"Unsupported network encoding '{encoding}'")
+        
+        sentences = iter(split_sentences(text))
+        pending = deque()
+        try:
+            for sentence in sentences:
+                pending.append(asyncio.create_task(self.synthesize_audio(sentence, encoding)))
+                if len(pending) >= synthesis_ahead:
+                    break
+            
+            while pending:
+                audio = await pending.popleft()
+                next_sentence = next(sentences, None)
+                if next_sentence:
+                    pending.append(asyncio.create_task(self.synthesize_audio(next_sentence, encoding)))
+                for start in range(0, len(audio), chunk_size):
+                    yield audio[start:start + chunk_size]
+        finally:
+            # Client went away or the turn was interrupted
+            for task in pending:
+                task.cancel()
+    
     async def speak_text(self, text: str, save_to_file: str = None) -> Optional[str]:
         """
         Convert text to speech and play it through speakers
@@ -87,8 +298,10 @@ class TTSAgent:
             pitch=self.pitch
         )
         
-        # Perform text-to-speech synthesis
-        response = self.client.synthesize_speech(
+        # Perform text-to-speech synthesis off the event loop so the
+        # request can be abandoned if the trainee interrupts
+        response = await asyncio.to_thread(
+            self.client.synthesize_speech,
             input=synthesis_input,
             voice=voice,
             audio_config=audio_config
@@ -108,17 +321,17 @@ class TTSAgent:
             audio_file.write(response.audio_content)
             
         # Play the audio through speakers
-        await self._play_audio_file(audio_file_path)
-        
-        # Clean up temporary file if not saving
-        if not save_to_file:
-            try:
-                os.unlink(audio_file_path)
-            except:
-                pass
-            return None
+        try:
+            await self._play_audio_file(audio_file_path)
+        finally:
+            # Clean up temporary file if not saving (also on cancellation)
+            if not save_to_file:
+                try:
+                    os.unlink(audio_file_path)
+                except:
+                    pass
         
-        return audio_file_path
+        return audio_file_path if save_to_file else None
     
     async def speak_with_emotion(self, text: str, emotion: str = "neutral"):
         """
@@ -128,26 +341,8 @@ class TTSAgent:
             text: Text to speak
             emotion: Emotion type (calm, urgent, concerned, reassuring)
         """
-        # Create SSML with emotional prosody
-        emotion_settings = {
-            "calm": {"rate": "slow", "pitch": "-2st"},
-            "urgent": {"rate": "fast", "pitch": "+3st"},
-            "concerned": {"rate": "medium", "pitch": "-1st"},
-            "reassuring": {"rate": "slow", "pitch": "-1st"}
-        }
-        
-        settings = emotion_settings.get(emotion, {"rate": "medium", "pitch": "0st"})
-        
-        ssml = f"""
-        <speak>
-            <prosody rate="{settings['rate']}" pitch="{settings['pitch']}">
-                {text}
-            </prosody>
-        </speak>
-        """
-        
-        # Use SSML synthesis
-        synthesis_input = texttospeech.SynthesisInput(ssml=ssml.strip())
+        # Use SSML synthesis with emotional prosody
+        synthesis_input = texttospeech.SynthesisInput(ssml=build_emotion_ssml(text, emotion))
         
         voice = texttospeech.VoiceSelectionParams(
             language_code=self.language_code,
@@ -158,7 +353,8 @@ class TTSAgent:
             audio_encoding=texttospeech.AudioEncoding.LINEAR16
         )
         
-        response = self.client.synthesize_speech(
+        response = await asyncio.to_thread(
+            self.client.synthesize_speech,
             input=synthesis_input,
             voice=voice,
             audio_config=audio_config
@@ -169,25 +365,50 @@ class TTSAgent:
         temp_file.write(response.audio_content)
         temp_file.close()
         
-        await self._play_audio_file(temp_file.name)
-        
-        # Clean up
         try:
-            os.unlink(temp_file.name)
-        except:
-            pass
+            await self._play_audio_file(temp_file.name)
+        finally:
+            # Clean up
+            try:
+                os.unlink(temp_file.name)
+            except:
+                pass
     
-    async def _play_audio_file(self, audio_file_path: str):
-        """Play an audio file using pyaudio"""
+    async def play_audio(self, audio: bytes):
+        """
+        Play LINEAR16 WAV bytes (e.g. from synthesize_audio) through speakers
+        
+        Args:
+            audio: WAV file contents
+        """
+        await self._play_audio_file(io.BytesIO(audio))
+    
+    async def _play_audio_file(self, audio_file_path):
+        """
+        Play an audio file (path or file-like WAV) using pyaudio
+        
+        Cancelling the calling task stops playback within one chunk
+        (~40 ms) and always releases the output stream.
+        """
+        wf = None
+        stream = None
         try:
             # Open wave file
             wf = wave.open(audio_file_path, 'rb')
             
+            # Resample 16-bit audio when the device runs at another rate
+            converter = None
+            rate = wf.getframerate()
+            channels = wf.getnchannels()
+            if self.output_sample_rate and self.output_sample_rate != rate and wf.getsampwidth() == 2:
+                converter = AudioConverter(rate, channels, "int16", out_rate=self.output_sample_rate)
+                rate, channels = self.output_sample_rate, 1
+            
             # Create audio stream
             stream = self.audio.open(
                 format=self.audio.get_format_from_width(wf.getsampwidth()),
-                channels=wf.getnchannels(),
-                rate=wf.getframerate(),
+                channels=channels,
+                rate=rate,
                 output=True
             )
             
@@ -196,18 +417,29 @@ class TTSAgent:
             data = wf.readframes(chunk)
             
             while data:
-                stream.write(data)
+                frames = converter.convert(data) if converter else data
+                # stream.write blocks until the device takes the chunk, so it
+                # runs in a thread to keep the event loop free
+                write = asyncio.ensure_future(asyncio.to_thread(stream.write, frames))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # Let the chunk finish before the stream is closed below
+                    await write
+                    raise
+                if self.echo_gate:
+                    self.echo_gate.playback(frames, rate, channels, wf.getsampwidth())
                 data = wf.readframes(chunk)
-                # Add small delay to prevent blocking
-                await asyncio.sleep(0.01)
-            
-            # Clean up
-            stream.stop_stream()
-            stream.close()
-            wf.close()
             
         except Exception as e:
             print(f"Error playing audio: {e}")
+        finally:
+            # Clean up
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            if wf is not None:
+                wf.close()
     
     def set_voice_parameters(self, 
                            voice_name: str = None,
@@ -228,7 +460,15 @@ class TTSAgent:
         if pitch:
             self.pitch = pitch
     
+    def close(self):
+        """Stop the output scheduler and release the shared audio handle"""
+        if getattr(self, '_scheduler', None) is not None:
+            self._scheduler.close()
+            self._scheduler = None
+        if getattr(self, '_audio', None) is not None:
+            self._audio = None
+            self.resources.release_audio()
+    
     def __del__(self):
         """Cleanup audio resources"""
-        if hasattr(self, 'audio'):
-            self.audio.terminate()
\ No newline at end of file
+        self.close()
\ No newline at end of file
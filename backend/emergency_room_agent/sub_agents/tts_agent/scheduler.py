@@ -0,0 +1,256 @@
+"""
+Per-session prioritized audio output scheduler for TTSAgent.
+
+Without coordination, concurrent speak_text / speak_with_emotion calls play
+over each other and an urgent clinical warning waits behind small talk. The
+scheduler owns the session's output device: utterances play one at a time in
+priority order, urgent ones preempt current playback (the preempted utterance
+is played again from the start after them), queued utterances from an older
+agent turn are superseded by a newer turn, and only a bounded number of
+utterances are synthesized ahead of playback.
+"""
+import asyncio
+import heapq
+import io
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# How an utterance left the queue
+PLAYED = "played"
+SUPERSEDED = "superseded"
+INTERRUPTED = "interrupted"
+FAILED = "failed"
+
+
+@dataclass(order=True)
+class Utterance:
+    priority: int
+    seq: int
+    text: str = field(compare=False)
+    emotion: Optional[str] = field(compare=False, default=None)
+    turn_id: Optional[int] = field(compare=False, default=None)
+    preemptions: int = field(compare=False, default=0)
+    enqueued_at: float = field(compare=False, default_factory=time.perf_counter)
+    synthesis: Optional[asyncio.Task] = field(compare=False, default=None, repr=False)
+    outcome: Optional[asyncio.Future] = field(compare=False, default=None, repr=False)
+
+    async def wait(self) -> str:
+        """Wait until the utterance is played or dropped; returns the outcome"""
+        return await asyncio.shield(self.outcome)
+
+
+@dataclass
+class SchedulerStats:
+    enqueued: int = 0
+    played: int = 0
+    superseded: int = 0
+    preempted: int = 0
+    interrupted: int = 0
+    failed: int = 0
+    max_queue_depth: int = 0
+    wait_ms: List[float] = field(default_factory=list)
+
+
+class AudioOutputScheduler:
+    def __init__(self, tts_agent, max_synthesis_ahead: int = 2, wait_samples: int = 256):
+        """
+        Serialize one session's speech output
+
+        Args:
+            tts_agent: TTSAgent used to synthesize and play utterances
+            max_synthesis_ahead: Queued utterances synthesized before their
+                turn to play (bounds buffered audio)
+            wait_samples: Recent queue wait times kept for percentiles
+        """
+        self.tts = tts_agent
+        self.max_synthesis_ahead = max_synthesis_ahead
+        self.wait_samples = wait_samples
+        self.stats = SchedulerStats()
+        self._queue: List[Utterance] = []
+        self._seq = itertools.count()
+        self._current: Optional[Utterance] = None
+        self._playback: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    def enqueue(self,
+                text: str,
+                emotion: str = None,
+                priority: int = None,
+                turn_id: int = None) -> Utterance:
+        """Queue an utterance (see TTSAgent.enqueue_speech)"""
+        if priority is None:
+            priority = PRIORITY_URGENT if emotion == "urgent" else PRIORITY_NORMAL
+
+        loop = asyncio.get_running_loop()
+        utterance = Utterance(
+            priority=priority,
+            seq=next(self._seq),
+            text=text,
+            emotion=emotion,
+            turn_id=turn_id,
+            outcome=loop.create_future(),
+        )
+
+        if turn_id is not None:
+            self._supersede_before(turn_id)
+
+        heapq.heappush(self._queue, utterance)
+        self.stats.enqueued += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, len(self._queue))
+
+        current = self._current
+        if current is not None and priority < current.priority and self._playback:
+            self._playback.cancel()
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._changed.set()
+        return utterance
+
+    def _supersede_before(self, turn_id: int):
+        """Drop queued, non-urgent utterances that belong to older turns"""
+        kept = []
+        for utterance in self._queue:
+            stale = (utterance.turn_id is not None
+                     and utterance.turn_id < turn_id
+                     and utterance.priority != PRIORITY_URGENT)
+            if stale:
+                self._finish(utterance, SUPERSEDED)
+            else:
+                kept.append(utterance)
+        if len(kept) != len(self._queue):
+            heapq.heapify(kept)
+            self._queue = kept
+
+    def _finish(self, utterance: Utterance, outcome: str):
+        if utterance.synthesis and not utterance.synthesis.done():
+            utterance.synthesis.cancel()
+        utterance.synthesis = None  # drop buffered audio
+        if not utterance.outcome.done():
+            utterance.outcome.set_result(outcome)
+        if outcome == PLAYED:
+            self.stats.played += 1
+        elif outcome == SUPERSEDED:
+            self.stats.superseded += 1
+        elif outcome == INTERRUPTED:
+            self.stats.interrupted += 1
+        else:
+            self.stats.failed += 1
+
+    def _start_synthesis(self):
+        """Synthesize the next few utterances in play order, no further"""
+        ahead = heapq.nsmallest(self.max_synthesis_ahead, self._queue)
+        for utterance in ahead:
+            if utterance.synthesis is None:
+                utterance.synthesis = asyncio.create_task(
+                    self.tts.synthesize_audio(utterance.text, emotion=utterance.emotion)
+                )
+        # Utterances pushed back (e.g. behind an urgent one) give up their
+        # synthesis, so buffered audio stays within the bound
+        ahead_ids = {id(utterance) for utterance in ahead}
+        for utterance in self._queue:
+            if utterance.synthesis is not None and id(utterance) not in ahead_ids:
+                utterance.synthesis.cancel()
+                utterance.synthesis = None
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            self._start_synthesis()
+            head = self._queue[0]
+
+            # Wait for the head's audio, unless the queue changes first
+            # (e.g. an urgent utterance jumps ahead)
+            self._changed.clear()
+            changed = asyncio.create_task(self._changed.wait())
+            await asyncio.wait({head.synthesis, changed}, return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
+            if not self._queue or self._queue[0] is not head or not head.synthesis.done():
+                continue
+
+            heapq.heappop(self._queue)
+            try:
+                audio = head.synthesis.result()
+            except (asyncio.CancelledError, Exception) as e:
+                print(f"Error synthesizing speech: {e}")
+                self._finish(head, FAILED)
+                continue
+
+            if not head.preemptions:
+                self.stats.wait_ms.append((time.perf_counter() - head.enqueued_at) * 1000)
+                del self.stats.wait_ms[:-self.wait_samples]
+
+            self._current = head
+            self._playback = asyncio.create_task(self.tts._play_audio_file(io.BytesIO(audio)))
+            await asyncio.wait({self._playback})
+            if head.outcome.done():
+                pass  # interrupt() already settled it
+            elif self._playback.cancelled():
+                # Preempted: keep its place (priority, seq) and audio, so it
+                # plays again once the urgent utterance is done
+                head.preemptions += 1
+                self.stats.preempted += 1
+                heapq.heappush(self._queue, head)
+            elif self._playback.exception() is not None:
+                print(f"Error playing speech: {self._playback.exception()}")
+                self._finish(head, FAILED)
+            else:
+                self._finish(head, PLAYED)
+            self._current = None
+            self._playback = None
+
+    def interrupt(self):
+        """Stop current playback and drop everything queued (barge-in)"""
+        while self._queue:
+            self._finish(heapq.heappop(self._queue), INTERRUPTED)
+        if self._current is not None:
+            self._finish(self._current, INTERRUPTED)
+            if self._playback:
+                self._playback.cancel()
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def get_stats(self) -> dict:
+        """Queue depth, outcome counts and queue wait-time percentiles"""
+        waits = sorted(self.stats.wait_ms)
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "queue_depth": len(self._queue),
+            "playing": self._current is not None,
+            "synthesized_ahead": sum(1 for u in self._queue if u.synthesis and u.synthesis.done()),
+            "enqueued": self.stats.enqueued,
+            "played": self.stats.played,
+            "superseded": self.stats.superseded,
+            "preempted": self.stats.preempted,
+            "interrupted": self.stats.interrupted,
+            "failed": self.stats.failed,
+            "max_queue_depth": self.stats.max_queue_depth,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+        }
+
+    def close(self):
+        """Drop queued audio and stop the worker"""
+        try:
+            self.interrupt()
+            if self._worker and not self._worker.done():
+                self._worker.cancel()
+        except RuntimeError:
+            # Event loop already closed (e.g. during interpreter shutdown)
+            pass
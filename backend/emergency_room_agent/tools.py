@@ -0,0 +1,72 @@
+"""
+Helpers for tools that do several independent things in one call.
+
+One tool call per item costs a model round-trip per item, so tools such as
+the nurse's acknowledge_orders take a list, handle the items concurrently
+(run_concurrently) and write all of their state changes as one delta
+(update_state).
+
+Sessions apply a state delta one top-level key at a time, replacing the
+value: a delta of {"session_flags": {"protocol_asa_given": True}} would drop
+the other flags. update_state therefore writes whole top-level values, with
+the changes merged into the current ones.
+"""
+import asyncio
+import inspect
+from typing import Any, Callable, List
+
+from google.adk.tools import ToolContext
+
+
+def deep_merge(base: dict, changes: dict) -> dict:
+    """
+    base with changes merged in, nested dicts included
+
+    Only the dicts along changed paths are copied; everything else is shared
+    with base (e.g. the read-only scenario objects in session state).
+    """
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def update_state(tool_context: ToolContext, changes: dict) -> dict:
+    """
+    Merge nested changes into the session state as one delta
+
+    Returns:
+        The top-level values written
+    """
+    written = {}
+    for key, value in changes.items():
+        current = tool_context.state.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            value = deep_merge(current, value)
+        tool_context.state[key] = written[key] = value
+    return written
+
+
+async def run_concurrently(calls: List[Callable[[], Any]]) -> List[Any]:
+    """
+    Run independent calls at once, results in order
+
+    Plain functions are called inline (they are quick, in-memory work; a
+    thread hop would cost more than the call), coroutine functions are
+    awaited together. A call that raises gives its exception as its result.
+    """
+    results = []
+    for call in calls:
+        try:
+            results.append(call())
+        except Exception as e:
+            results.append(e)
+
+    waiting = [i for i, result in enumerate(results) if inspect.isawaitable(result)]
+    awaited = await asyncio.gather(*(results[i] for i in waiting), return_exceptions=True)
+    for i, result in zip(waiting, awaited):
+        results[i] = result
+    return results
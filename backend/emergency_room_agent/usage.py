@@ -0,0 +1,318 @@
+"""
+Token and cost accounting per session, with budgets.
+
+UsagePlugin adds up the usage metadata of every model response and keeps the
+totals in session state under "usage" - overall and per agent, stage and
+model - so they are saved, hibernated and served with the rest of the state:
+
+    GET /apps/{app}/users/{user}/sessions/{session_id}  ->  state["usage"]
+
+Past the soft budget a session's model calls go to a cheaper model; past the
+hard budget the prompt is also compacted to the most recent turns. Calls
+answered by the response cache or a cassette never reach the model and are
+not counted.
+
+Model calls made outside the agent's own call are charged where they are
+issued, through UsagePlugin.charge(): StagePreparationPlugin's drafts (served
+or not), HedgedLlm's losing attempts (usage_charger()) and committed
+speculative turns. They are added to the session's totals with its next
+event.
+"""
+import copy
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.genai import types
+
+from .state import STAGE_NAMES
+
+# USD per million tokens: (input, output); output includes thinking tokens
+DEFAULT_PRICES = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+COUNTERS = ("model_calls", "prompt_tokens", "cached_tokens", "output_tokens", "thoughts_tokens", "cost_usd")
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse 'model=input/output' prices in USD per million tokens
+
+    Example: 'gemini-2.0-flash=0.10/0.40,gemini-2.5-flash=0.30/2.50'
+    """
+    prices = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, price = item.partition("=")
+        input_price, _, output_price = price.partition("/")
+        prices[model.strip()] = (float(input_price), float(output_price or input_price))
+    return prices
+
+
+def price_for(model: str, prices: Dict[str, Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+    """Price of model, matching versioned names (gemini-2.0-flash-001) by prefix"""
+    model = (model or "").removeprefix("models/")
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+# (plugin, session id, agent name) of the model call this task is making
+_current_call: ContextVar[Optional[Tuple["UsagePlugin", str, str]]] = ContextVar("usage_current_call", default=None)
+
+
+def set_current_call(plugin: "UsagePlugin", session_id: str, agent_name: str):
+    """Charge usage_charger() calls of this task to session_id / agent_name"""
+    _current_call.set((plugin, session_id, agent_name) if plugin else None)
+
+
+def usage_charger() -> Optional[Callable[[str, types.GenerateContentResponseUsageMetadata], None]]:
+    """
+    Charger for extra model calls made on behalf of the current model call
+    (e.g. a losing hedge attempt): charger(model, usage_metadata)
+
+    Returns:
+        None outside a model call counted by a UsagePlugin
+    """
+    current = _current_call.get()
+    if current is None:
+        return None
+    plugin, session_id, agent_name = current
+    return lambda model, usage_metadata: plugin.charge(session_id, agent_name, model, usage_metadata)
+
+
+def empty_usage() -> dict:
+    return {
+        "totals": dict.fromkeys(COUNTERS, 0),
+        "by_agent": {},
+        "by_stage": {},
+        "by_model": {},
+        "budget": "ok",
+        "fallback_calls": 0,
+        "compacted_calls": 0,
+    }
+
+
+def _add(counters: dict, call: dict):
+    for counter in COUNTERS:
+        counters[counter] = counters.get(counter, 0) + call[counter]
+    counters["cost_usd"] = round(counters["cost_usd"], 6)
+
+
+def compact_contents(contents: List[types.Content], keep_turns: int = 4) -> List[types.Content]:
+    """
+    Keep only the last keep_turns user turns of a prompt
+
+    A turn starts at a user text message, so function calls stay paired
+    with their responses.
+    """
+    starts = [
+        i for i, content in enumerate(contents)
+        if content.role == "user" and content.parts
+        and any(part.text for part in content.parts)
+        and not any(part.function_response for part in content.parts)
+    ]
+    if len(starts) <= keep_turns:
+        return contents
+    cut = starts[-keep_turns]
+    note = types.Content(role="user", parts=[types.Part(
+        text=f"[{cut} earlier messages were left out to keep this session within its budget]"
+    )])
+    return [note] + contents[cut:]
+
+
+@dataclass
+class UsageStats:
+    """Process-wide counters, across sessions"""
+    model_calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    fallback_calls: int = 0
+    compacted_calls: int = 0
+    unpriced_models: Set[str] = field(default_factory=set)
+
+
+class UsagePlugin(BasePlugin):
+    def __init__(self,
+                 prices: Dict[str, Tuple[float, float]] = None,
+                 soft_budget_usd: float = None,
+                 hard_budget_usd: float = None,
+                 fallback_model: str = "gemini-2.0-flash-lite",
+                 keep_turns: int = 4,
+                 max_unbilled_sessions: int = 10000,
+                 name: str = "usage"):
+        """
+        Account model usage per session and enforce per-session budgets
+
+        Args:
+            prices: USD per million (input, output) tokens per model prefix
+                (defaults to DEFAULT_PRICES)
+            soft_budget_usd: Session cost after which calls use fallback_model
+            hard_budget_usd: Session cost after which prompts are also
+                compacted to the last keep_turns turns
+            fallback_model: Cheaper model used past a budget
+            keep_turns: User turns kept when compacting
+            max_unbilled_sessions: Sessions whose charge()d calls wait for
+                their next event; the oldest beyond this are only counted
+                process-wide
+        """
+        super().__init__(name=name)
+        self.prices = prices or DEFAULT_PRICES
+        self.soft_budget_usd = soft_budget_usd
+        self.hard_budget_usd = hard_budget_usd
+        self.fallback_model = fallback_model
+        self.keep_turns = keep_turns
+        self.max_unbilled_sessions = max_unbilled_sessions
+        self.stats = UsageStats()
+        # (invocation id, agent) -> (model, adjustments) of calls sent to the model
+        self._pending: Dict[Tuple[str, str], Tuple[str, List[str]]] = {}
+        # session id -> (agent, model, call) charged but not yet in its state
+        self._unbilled: "OrderedDict[str, List[Tuple[str, str, dict]]]" = OrderedDict()
+
+    def budget_level(self, cost_usd: float) -> str:
+        if self.hard_budget_usd is not None and cost_usd >= self.hard_budget_usd:
+            return "hard"
+        if self.soft_budget_usd is not None and cost_usd >= self.soft_budget_usd:
+            return "soft"
+        return "ok"
+
+    def call_cost(self, model: str, prompt_tokens: int, output_tokens: int) -> float:
+        price = price_for(model, self.prices)
+        if price is None:
+            self.stats.unpriced_models.add(model)
+            return 0.0
+        return (prompt_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+    def _call(self, model: str, metadata: types.GenerateContentResponseUsageMetadata) -> dict:
+        """Counters of one model call"""
+        output_tokens = metadata.candidates_token_count or 0
+        thoughts_tokens = metadata.thoughts_token_count or 0
+        call = {
+            "model_calls": 1,
+            "prompt_tokens": metadata.prompt_token_count or 0,
+            "cached_tokens": metadata.cached_content_token_count or 0,
+            "output_tokens": output_tokens,
+            "thoughts_tokens": thoughts_tokens,
+            "cost_usd": self.call_cost(model, metadata.prompt_token_count or 0, output_tokens + thoughts_tokens),
+        }
+        self.stats.model_calls += 1
+        self.stats.prompt_tokens += call["prompt_tokens"]
+        self.stats.output_tokens += output_tokens + thoughts_tokens
+        self.stats.cost_usd += call["cost_usd"]
+        return call
+
+    def charge(self, session_id: str, agent_name: str, model: str,
+               usage_metadata: types.GenerateContentResponseUsageMetadata):
+        """
+        Charge a model call made outside the agent's own call (a draft, a
+        losing hedge attempt); added to the session's usage with its next
+        event
+        """
+        if usage_metadata is None:
+            return
+        call = self._call(model, usage_metadata)
+        self._unbilled.setdefault(session_id, []).append((agent_name, model, call))
+        self._unbilled.move_to_end(session_id)
+        while len(self._unbilled) > self.max_unbilled_sessions:
+            self._unbilled.popitem(last=False)
+
+    def apply_budget(self, usage: dict, llm_request: LlmRequest) -> List[str]:
+        """
+        Switch llm_request to the fallback model / compact it for a session
+        with the given state["usage"]
+
+        Returns:
+            The adjustments made ("fallback", "compacted")
+        """
+        level = self.budget_level((usage or {}).get("totals", {}).get("cost_usd", 0.0))
+        adjustments = []
+
+        if level != "ok" and self.fallback_model and llm_request.model != self.fallback_model:
+            llm_request.model = self.fallback_model
+            # Thinking budgets are rejected by models without thinking
+            if llm_request.config and llm_request.config.thinking_config and "2.5" not in self.fallback_model:
+                llm_request.config.thinking_config = None
+            adjustments.append("fallback")
+
+        if level == "hard":
+            compacted = compact_contents(llm_request.contents, self.keep_turns)
+            if compacted is not llm_request.contents:
+                llm_request.contents = compacted
+                adjustments.append("compacted")
+        return adjustments
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        adjustments = self.apply_budget(callback_context.state.get("usage"), llm_request)
+        self.stats.fallback_calls += "fallback" in adjustments
+        self.stats.compacted_calls += "compacted" in adjustments
+
+        self._pending[(callback_context.invocation_id, callback_context.agent_name)] = (
+            llm_request.model, adjustments
+        )
+        set_current_call(self, callback_context.session.id, callback_context.agent_name)
+        return None
+
+    async def on_model_error_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest, error: Exception
+    ) -> Optional[LlmResponse]:
+        self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        return None
+
+    async def on_event_callback(
+        self, *, invocation_context: InvocationContext, event: Event
+    ) -> Optional[Event]:
+        if event.partial:
+            return None
+        session = invocation_context.session
+        calls = self._unbilled.pop(session.id, [])
+        pending = self._pending.pop((event.invocation_id, event.author), None) if event.usage_metadata else None
+        if pending is not None:
+            model, adjustments = pending
+            calls.append((event.author, model, self._call(model, event.usage_metadata)))
+        if not calls:
+            return None  # no call this plugin let through or was charged for
+
+        usage = copy.deepcopy(session.state.get("usage")) or empty_usage()
+        stage = (session.state.get("states") or {}).get("current_stage", 0)
+        stage_name = STAGE_NAMES[stage] if 0 <= stage < len(STAGE_NAMES) else str(stage)
+        for agent_name, model, call in calls:
+            _add(usage["totals"], call)
+            _add(usage["by_agent"].setdefault(agent_name, {}), call)
+            _add(usage["by_stage"].setdefault(stage_name, {}), call)
+            _add(usage["by_model"].setdefault(model, {}), call)
+        if pending is not None:
+            usage["fallback_calls"] += "fallback" in adjustments
+            usage["compacted_calls"] += "compacted" in adjustments
+
+        level = self.budget_level(usage["totals"]["cost_usd"])
+        if level != usage["budget"]:
+            print(f"Session {session.id} reached its {level} budget (${usage['totals']['cost_usd']:.4f})")
+            usage["budget"] = level
+
+        # Stored with the event, so the totals persist with the session
+        event.actions.state_delta["usage"] = usage
+        return None
+
+    async def after_run_callback(self, *, invocation_context: InvocationContext) -> None:
+        # Calls that never produced an event (e.g. rejected by admission)
+        for key in [key for key in self._pending if key[0] == invocation_context.invocation_id]:
+            del self._pending[key]
+
+    def get_stats(self) -> dict:
+        stats = asdict(self.stats)
+        stats["cost_usd"] = round(stats["cost_usd"], 6)
+        stats["unpriced_models"] = sorted(self.stats.unpriced_models)
+        stats["unbilled_sessions"] = len(self._unbilled)
+        return stats
@@ -0,0 +1,523 @@
+"""
+Spoken simulation: microphone to the agent tree to speakers as asyncio stages.
+
+    capture -> recognition -> agent turn -> synthesis -> playback
+
+Stages are joined by bounded queues, so a slow stage holds back the ones
+before it instead of letting work pile up. Agent turns, synthesis and
+playback each run up to their own concurrency limit while keeping their
+input order: with two synthesis workers the second sentence of a reply is
+synthesized while the first one plays.
+
+Mouth-to-ear latency is measured per utterance from the last words the
+recognizer heard to the first audio of the reply, split into the time each
+stage added, so the queue sizes and concurrency limits can be tuned against
+a real spoken STEMI run (see get_stats()).
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from google.adk.runners import Runner
+from google.genai import types
+
+from .speculation import SpeculativeTurnRunner
+from .sub_agents.stt_agent import STTAgent
+from .sub_agents.tts_agent import TTSAgent
+from .sub_agents.tts_agent.agent import split_sentences
+
+STAGES = ("capture", "recognition", "agent", "synthesis", "playback")
+
+DEFAULT_CONCURRENCY = {"agent": 1, "synthesis": 2, "playback": 1}
+
+# Items each stage's input queue holds; capture chunks are ~64 ms of audio
+DEFAULT_QUEUE_SIZES = {"recognition": 50, "agent": 4, "synthesis": 8, "playback": 2}
+
+_DONE = object()
+
+
+def parse_stage_settings(spec: str) -> Dict[str, int]:
+    """
+    Parse 'stage=value' pairs
+
+    Example: 'synthesis=3,playback=1'
+    """
+    settings = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        stage, _, value = item.partition("=")
+        if stage.strip() not in STAGES:
+            raise ValueError(f"Unknown voice pipeline stage '{stage.strip()}', expected one of {STAGES}")
+        settings[stage.strip()] = int(value)
+    return settings
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+
+@dataclass
+class Utterance:
+    """One recognized user utterance and the progress of its reply"""
+    id: int
+    transcript: str
+    heard_at: float  # perf_counter when the last words were recognized
+    # stage -> perf_counter of the stage's first output for this utterance
+    marks: Dict[str, float] = field(default_factory=dict)
+
+    def mark(self, stage: str) -> bool:
+        """Record the stage's first output; False if it was already recorded"""
+        if stage in self.marks:
+            return False
+        self.marks[stage] = time.perf_counter()
+        return True
+
+
+@dataclass
+class Packet:
+    utterance: Utterance
+    value: Any
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    outputs: int = 0
+    errors: int = 0
+    dropped: int = 0
+    max_queue_depth: int = 0
+    wait_ms: List[float] = field(default_factory=list)
+    service_ms: List[float] = field(default_factory=list)
+
+
+class Stage:
+    def __init__(self,
+                 name: str,
+                 handler: Callable[[Packet], AsyncIterator[Any]],
+                 queue_size: int,
+                 concurrency: int = 1,
+                 is_stale: Callable[[Utterance], bool] = None,
+                 samples: int = 512):
+        """
+        Run handler on queued packets, up to concurrency at a time
+
+        Outputs are passed downstream in input order, whatever order the
+        work finishes in. A packet holds its concurrency slot until all its
+        outputs are passed on, so a full downstream queue stops this stage
+        from starting more work.
+
+        Args:
+            name: Stage name in stats
+            handler: Async generator function(packet) yielding output values
+            queue_size: Packets the input queue holds before put() waits
+            concurrency: Packets processed at once
+            is_stale: Returns True for utterances whose reply was
+                interrupted; their packets and outputs are dropped
+            samples: Recent timings kept for percentiles
+        """
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.is_stale = is_stale or (lambda utterance: False)
+        self.samples = samples
+        self.downstream: Optional["Stage"] = None
+        self.inbox: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._order: asyncio.Queue = asyncio.Queue()
+        self._work: Dict[asyncio.Task, Packet] = {}
+
+    def _record(self, samples: List[float], started: float):
+        samples.append((time.perf_counter() - started) * 1000)
+        del samples[:-self.samples]
+
+    async def put(self, packet: Packet):
+        await self.inbox.put(packet)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.inbox.qsize())
+
+    async def close(self):
+        """Finish the queued work, then close the downstream stages"""
+        await self.inbox.put(_DONE)
+
+    def cancel_stale(self) -> List[asyncio.Task]:
+        """Cancel in-flight work for interrupted utterances; returns the tasks"""
+        stale = [task for task, packet in self._work.items() if self.is_stale(packet.utterance)]
+        for task in stale:
+            task.cancel()
+        return stale
+
+    async def run(self):
+        emitter = asyncio.create_task(self._emit())
+        try:
+            while True:
+                await self._slots.acquire()
+                packet = await self.inbox.get()
+                if packet is _DONE:
+                    break
+                if self.is_stale(packet.utterance):
+                    self.stats.dropped += 1
+                    self._slots.release()
+                    continue
+                self._record(self.stats.wait_ms, packet.queued_at)
+                results: asyncio.Queue = asyncio.Queue()
+                task = asyncio.create_task(self._process(packet, results))
+                self._work[task] = packet
+                task.add_done_callback(self._work.pop)
+                await self._order.put((packet, results))
+            await self._order.put(_DONE)
+            await emitter
+        finally:
+            emitter.cancel()
+            for task in list(self._work):
+                task.cancel()
+
+    async def _process(self, packet: Packet, results: asyncio.Queue):
+        started = time.perf_counter()
+        try:
+            async for value in self.handler(packet):
+                results.put_nowait(value)
+            self.stats.processed += 1
+            self._record(self.stats.service_ms, started)
+        except asyncio.CancelledError:
+            self.stats.dropped += 1
+        except Exception as e:
+            self.stats.errors += 1
+            print(f"Error in {self.name} stage: {e}")
+        finally:
+            results.put_nowait(_DONE)
+
+    async def _emit(self):
+        while True:
+            entry = await self._order.get()
+            if entry is _DONE:
+                break
+            packet, results = entry
+            try:
+                while (value := await results.get()) is not _DONE:
+                    if self.is_stale(packet.utterance):
+                        continue
+                    self.stats.outputs += 1
+                    packet.utterance.mark(self.name)
+                    if self.downstream:
+                        await self.downstream.put(Packet(packet.utterance, value))
+            finally:
+                self._slots.release()
+        if self.downstream:
+            await self.downstream.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self.inbox.qsize(),
+            "max_queue_depth": self.stats.max_queue_depth,
+            "in_flight": len(self._work),
+            "concurrency": self.concurrency,
+            "processed": self.stats.processed,
+            "outputs": self.stats.outputs,
+            "errors": self.stats.errors,
+            "dropped": self.stats.dropped,
+            "wait_ms_p50": _percentile(self.stats.wait_ms, 0.5),
+            "wait_ms_p95": _percentile(self.stats.wait_ms, 0.95),
+            "service_ms_p50": _percentile(self.stats.service_ms, 0.5),
+            "service_ms_p95": _percentile(self.stats.service_ms, 0.95),
+        }
+
+
+class VoicePipeline:
+    def __init__(self,
+                 runner: Runner,
+                 user_id: str,
+                 session_id: str,
+                 stt: STTAgent,
+                 tts: TTSAgent,
+                 source: AsyncIterator[bytes] = None,
+                 sample_rate: int = None,
+                 concurrency: Dict[str, int] = None,
+                 queue_sizes: Dict[str, int] = None,
+                 barge_in: bool = True,
+                 cancel_timeout: float = 0.5,
+                 speculator: SpeculativeTurnRunner = None,
+                 on_utterance: Callable[[str], None] = None,
+                 on_reply: Callable[[str, str], None] = None,
+                 samples: int = 512):
+        """
+        Run one spoken session: capture -> recognition -> agent turn ->
+        synthesis -> playback
+
+        Args:
+            runner: Runner for the agent tree (e.g. root_agent)
+            user_id: Session owner
+            session_id: Existing session the turns run in
+            stt: Speech-to-text agent used for recognition
+            tts: Text-to-speech agent used for synthesis and playback
+            source: Async iterator of LINEAR16 mono chunks (e.g. an
+                AudioIngestSession); defaults to stt's microphone
+            sample_rate: Sample rate of source (defaults to stt.sample_rate)
+            concurrency: Overrides of DEFAULT_CONCURRENCY per stage (the
+                agent stage is always 1)
+            queue_sizes: Overrides of DEFAULT_QUEUE_SIZES per stage
+            barge_in: Drop the current reply when the trainee starts talking
+            cancel_timeout: Seconds interrupt() waits for cancelled work
+                (agent turn, synthesis, playback) to unwind
+            speculator: Starts agent turns on stable interim transcripts
+                (wrapping runner); None runs turns on final transcripts only
+            on_utterance: Called with each final transcript
+            on_reply: Called with (author, text) of each agent reply
+            samples: Recent timings kept for percentiles
+        """
+        self.runner = runner
+        self.user_id = user_id
+        self.session_id = session_id
+        self.stt = stt
+        self.tts = tts
+        self.source = source
+        self.sample_rate = sample_rate
+        self.barge_in = barge_in
+        self.cancel_timeout = cancel_timeout
+        self.speculator = speculator
+        self.on_utterance = on_utterance
+        self.on_reply = on_reply
+        self.samples = samples
+        concurrency = {**DEFAULT_CONCURRENCY, **(concurrency or {})}
+        if concurrency["agent"] != 1:
+            # Turns of one session must run in order against its state
+            raise ValueError(f"Agent stage concurrency must be 1, got {concurrency['agent']}")
+        queue_sizes = {**DEFAULT_QUEUE_SIZES, **(queue_sizes or {})}
+
+        self.utterances = 0
+        self.interruptions = 0
+        self.cancelled_tasks = 0
+        # Tasks still running cancel_timeout after an interrupt
+        self.slow_cancellations = 0
+        self.cancel_ms: List[float] = []
+        self._interrupted_through = 0
+        self._heard_at: Optional[float] = None
+        self._source_done = False
+        self.capture_stats = StageStats()
+        self.recognition_stats = StageStats()
+        self.mouth_to_ear_ms: List[float] = []
+        self.breakdown_ms: Dict[str, List[float]] = {stage: [] for stage in STAGES[1:]}
+        self._audio: asyncio.Queue = asyncio.Queue(maxsize=queue_sizes["recognition"])
+
+        self.stages = [
+            Stage(name, handler, queue_sizes[name], concurrency[name], self._is_stale, samples)
+            for name, handler in (
+                ("agent", self._agent_turn),
+                ("synthesis", self._synthesize),
+                ("playback", self._play),
+            )
+        ]
+        for stage, downstream in zip(self.stages, self.stages[1:]):
+            stage.downstream = downstream
+        self._tasks: List[asyncio.Task] = []
+        self._capture_task: Optional[asyncio.Task] = None
+
+    def _is_stale(self, utterance: Utterance) -> bool:
+        return utterance.id <= self._interrupted_through
+
+    def _record(self, samples: List[float], value: float):
+        samples.append(value)
+        del samples[:-self.samples]
+
+    async def run(self):
+        """Run until the source ends (or stop() is called) and replies finish"""
+        if self.source is None:
+            self.source = self.stt.microphone_chunks()
+        self._tasks = [asyncio.create_task(stage.run()) for stage in self.stages]
+        self._capture_task = asyncio.create_task(self._capture())
+        try:
+            await self._recognize()
+            await self.stages[0].close()
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks + [self._capture_task]:
+                task.cancel()
+
+    def stop(self):
+        """End capture; queued replies still play before run() returns"""
+        self.stt.stop_listening()
+        if self._capture_task:
+            self._capture_task.cancel()
+
+    async def interrupt(self) -> int:
+        """
+        Drop every reply in progress (queued, being generated, synthesized
+        or played)
+
+        Returns:
+            Number of in-flight tasks cancelled
+        """
+        if self._interrupted_through == self.utterances:
+            return 0
+        self._interrupted_through = self.utterances
+        cancelled = [task for stage in self.stages for task in stage.cancel_stale()]
+        if cancelled or any(not stage.inbox.empty() for stage in self.stages):
+            self.interruptions += 1  # there was a reply to talk over
+        if cancelled:
+            started = time.perf_counter()
+            _, still_running = await asyncio.wait(cancelled, timeout=self.cancel_timeout)
+            self._record(self.cancel_ms, (time.perf_counter() - started) * 1000)
+            self.cancelled_tasks += len(cancelled)
+            self.slow_cancellations += len(still_running)
+        return len(cancelled)
+
+    # capture
+
+    async def _capture(self):
+        """Move source chunks into the recognition queue, dropping the
+        oldest chunk when recognition falls behind instead of stalling the
+        microphone"""
+        stats = self.capture_stats
+        try:
+            async for chunk in self.source:
+                if self._audio.full():
+                    self._audio.get_nowait()
+                    stats.dropped += 1
+                self._audio.put_nowait((chunk, time.perf_counter()))
+                stats.processed += 1
+                stats.max_queue_depth = max(stats.max_queue_depth, self._audio.qsize())
+        finally:
+            self._source_done = True
+            if self._audio.full():
+                self._audio.get_nowait()
+            self._audio.put_nowait(_DONE)
+
+    # recognition
+
+    async def _audio_chunks(self):
+        while True:
+            entry = await self._audio.get()
+            if entry is _DONE:
+                return
+            chunk, captured_at = entry
+            self._record(self.recognition_stats.wait_ms, (time.perf_counter() - captured_at) * 1000)
+            yield chunk
+
+    async def _recognize(self):
+        """Stream captured audio to recognition, restarting the stream when
+        the service ends it (streams are limited to a few minutes)"""
+        while not self._source_done or not self._audio.empty():
+            try:
+                await self.stt.recognize_stream(
+                    self._audio_chunks(),
+                    on_transcript=self._on_interim,
+                    on_final=self._on_final,
+                    sample_rate=self.sample_rate,
+                    on_speech_start=self._on_speech_start,
+                )
+            except Exception as e:
+                self.recognition_stats.errors += 1
+                print(f"Error in recognition stage: {e}")
+                await asyncio.sleep(0.5)
+
+    def _on_interim(self, transcript: str):
+        self._heard_at = time.perf_counter()
+        if self.speculator:
+            self.speculator.on_interim(self.user_id, self.session_id, transcript)
+
+    async def _on_speech_start(self):
+        if self.barge_in:
+            await self.interrupt()
+
+    async def _on_final(self, transcript: str):
+        now = time.perf_counter()
+        heard_at, self._heard_at = self._heard_at or now, None
+        if not transcript.strip():
+            return
+
+        self.utterances += 1
+        utterance = Utterance(self.utterances, transcript.strip(), heard_at)
+        utterance.mark("recognition")
+        stats = self.recognition_stats
+        stats.processed += 1
+        stats.outputs += 1
+        # Endpointing: last words heard -> final transcript
+        self._record(stats.service_ms, (now - heard_at) * 1000)
+        if self.on_utterance:
+            self.on_utterance(utterance.transcript)
+        await self.stages[0].put(Packet(utterance, utterance.transcript))
+
+    # agent turn -> synthesis -> playback
+
+    async def _events(self, transcript: str):
+        if self.speculator:
+            # Commits the speculative turn when it ran on this transcript
+            for event in await self.speculator.run_final(self.user_id, self.session_id, transcript):
+                yield event
+            return
+        content = types.Content(role="user", parts=[types.Part(text=transcript)])
+        async for event in self.runner.run_async(
+            user_id=self.user_id, session_id=self.session_id, new_message=content
+        ):
+            yield event
+
+    async def _agent_turn(self, packet: Packet):
+        async for event in self._events(packet.value):
+            if not event.is_final_response() or not event.content or not event.content.parts:
+                continue
+            text = " ".join(part.text.strip() for part in event.content.parts if part.text and part.text.strip())
+            if not text:
+                continue
+            if self.on_reply:
+                self.on_reply(event.author, text)
+            # Sentence by sentence, so the first one is synthesized early
+            for sentence in split_sentences(text):
+                yield sentence
+
+    async def _synthesize(self, packet: Packet):
+        yield await self.tts.synthesize_audio(packet.value, "linear16")
+
+    async def _play(self, packet: Packet):
+        utterance = packet.utterance
+        if utterance.mark("playback"):
+            self._record_latency(utterance)
+        await self.tts.play_audio(packet.value)
+        yield None
+
+    def _record_latency(self, utterance: Utterance):
+        self._record(self.mouth_to_ear_ms, (utterance.marks["playback"] - utterance.heard_at) * 1000)
+        previous = utterance.heard_at
+        for stage in STAGES[1:]:
+            if stage in utterance.marks:
+                self._record(self.breakdown_ms[stage], (utterance.marks[stage] - previous) * 1000)
+                previous = utterance.marks[stage]
+
+    def get_stats(self) -> dict:
+        """Per-stage queue depth, throughput and timings plus mouth-to-ear latency"""
+        stages = {
+            "capture": {
+                "queue_depth": self._audio.qsize(),
+                "max_queue_depth": self.capture_stats.max_queue_depth,
+                "chunks": self.capture_stats.processed,
+                "dropped": self.capture_stats.dropped,
+                # Frames kept from recognition while replies played
+                "echo_gate": self.stt.echo_gate.get_stats() if self.stt.echo_gate else None,
+            },
+            "recognition": {
+                "utterances": self.recognition_stats.processed,
+                "errors": self.recognition_stats.errors,
+                "chunk_wait_ms_p50": _percentile(self.recognition_stats.wait_ms, 0.5),
+                "chunk_wait_ms_p95": _percentile(self.recognition_stats.wait_ms, 0.95),
+                "endpoint_ms_p50": _percentile(self.recognition_stats.service_ms, 0.5),
+                "endpoint_ms_p95": _percentile(self.recognition_stats.service_ms, 0.95),
+            },
+        }
+        for stage in self.stages:
+            stages[stage.name] = stage.get_stats()
+        return {
+            "utterances": self.utterances,
+            "interruptions": self.interruptions,
+            "speculation": self.speculator.get_stats() if self.speculator else None,
+            "cancelled_tasks": self.cancelled_tasks,
+            "slow_cancellations": self.slow_cancellations,
+            "cancel_ms_p95": _percentile(self.cancel_ms, 0.95),
+            "mouth_to_ear_ms_p50": _percentile(self.mouth_to_ear_ms, 0.5),
+            "mouth_to_ear_ms_p95": _percentile(self.mouth_to_ear_ms, 0.95),
+            "mouth_to_ear_ms_last": round(self.mouth_to_ear_ms[-1], 1) if self.mouth_to_ear_ms else 0.0,
+            # Median time each stage added before the reply was heard
+            "breakdown_ms_p50": {stage: _percentile(samples, 0.5) for stage, samples in self.breakdown_ms.items()},
+            "stages": stages,
+        }
@@ -1,72 +1,169 @@
+import argparse
 import asyncio
+import atexit
+import os
 import uuid
 import json
 
 from dotenv import load_dotenv
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
 from emergency_room_agent import root_agent as emergency_room_agent
+from emergency_room_agent.admission import (
+    AdmissionController,
+    AdmissionPlugin,
+    parse_rate_limits,
+)
+from emergency_room_agent.analytics import EventStore, TurnRecorderPlugin
+from emergency_room_agent.cassette import CassettePlugin
+from emergency_room_agent.hedging import RequestHedger, hedge_agents
+from emergency_room_agent.hibernation import HibernatingSessionService
+from emergency_room_agent.preparation import StagePreparationPlugin
+from emergency_room_agent.response_cache import (
+    DEFAULT_STATE_KEYS,
+    ResponseCache,
+    ResponseCachePlugin,
+)
+from emergency_room_agent.speculation import SpeculativeTurnRunner
+from emergency_room_agent.state import STAGE_NAMES, build_initial_state
+from emergency_room_agent.usage import DEFAULT_PRICES, UsagePlugin, parse_prices
+from profiling import MODES, TurnProfiler
 from utils import call_agent_async_json
+from worker import Worker, run_worker
 
 load_dotenv()
 
-# Create a new session service to store state
-session_service_stateful = InMemorySessionService()
-
-initial_state = {
-    "states": {
-        'current_stage': 0,
-        'stages': ['S0_INITIAL_STABILIZATION', 'S1_DIAGNOSTIC_CONFIRMATION', 'S2_CRITICAL_CONSULTATION', 'S3_SENIOR_HANDOVER', 'S4_DEBRIEFING']
-    },
-    "patient_information": {
-        "patient_name": "Brandon Hancock",
-        "patient_age": 55,
-        "static_patient_data": {
-        "vitals_snapshot": {
-            "BP_Systolic": 118,
-            "BP_Diastolic": 75,
-            "HR": 105,
-            "O2_Sat": 94,
-            "O2_Source": "Room Air",
-            "Pain_Score": 8
-        },
-        "history": {
-            "Age_Sex": "55-year-old male",
-            "Complaint": "Crushing substernal chest pain",
-            "Known_History": "Hypertension, Smoker",
-            "Allergies": "None known"
-        }
-        }
-    },
-    "session_flags": {
-        "protocol_asa_given": False,
-        "protocol_ecg_ordered": False,
-        "protocol_diagnosis_confirmed": False,
-        "protocol_nitro_or_morphine": False
-    }
-}
-
-async def main():
+APP_NAME = "Brandon Bot"
 
-    # Create a NEW session
-    APP_NAME = "Brandon Bot"
-    USER_ID = "brandon_hancock"
-    SESSION_ID = str(uuid.uuid4())
-    initial_state["session_id"] = SESSION_ID
+# Create a new session service to store state; idle sessions are moved to disk
+session_service_stateful = HibernatingSessionService(
+    directory=os.getenv("ER_SESSION_DIR", ".sessions"),
+    idle_ttl=float(os.getenv("ER_SESSION_IDLE_TTL", "900")),
+    max_resident=int(os.getenv("ER_MAX_RESIDENT_SESSIONS", "1000")),
+)
 
+# One response cache for every runner, so repeats are shared across sessions
+response_cache = ResponseCache(ttl=float(os.getenv("ER_RESPONSE_CACHE_TTL", "3600")))
 
-    stateful_session = await session_service_stateful.create_session(
-        app_name=APP_NAME,
-        user_id=USER_ID,
-        session_id=SESSION_ID,
-        state=initial_state,
+
+def build_hedger():
+    """
+    Hedge slow model calls of the agents in ER_HEDGE_AGENTS, e.g.
+    ER_HEDGE_AGENTS=nurse_agent,doctor_agent ER_HEDGE_BUDGET=0.1
+    """
+    hedged_agents = os.getenv("ER_HEDGE_AGENTS")
+    if not hedged_agents:
+        return None
+    hedger = RequestHedger(
+        budget=float(os.getenv("ER_HEDGE_BUDGET", "0.1")),
+        percentile=float(os.getenv("ER_HEDGE_PERCENTILE", "0.95")),
+        hedge_model=os.getenv("ER_HEDGE_MODEL") or None,
+    )
+    hedge_agents(emergency_room_agent, hedger, [agent.strip() for agent in hedged_agents.split(",") if agent.strip()])
+    return hedger
+
+
+# Agents are shared by all runners, so their models are wrapped once
+hedger = build_hedger()
+
+
+def build_plugins():
+    """Model-call plugins enabled through the environment (.env)"""
+    plugins = []
+
+    # Record/replay model calls first, so replays skip everything else
+    # e.g. ER_CASSETTE=cassettes/stemi.jsonl.gz ER_CASSETTE_MODE=strict
+    cassette = os.getenv("ER_CASSETTE")
+    if cassette:
+        plugins.append(CassettePlugin(
+            cassette,
+            os.getenv("ER_CASSETTE_MODE", "replay"),
+            latency_scale=float(os.getenv("ER_CASSETTE_LATENCY_SCALE", "0")),
+        ))
+
+    # Cache first, so cache hits don't use up admission tokens
+    # e.g. ER_RESPONSE_CACHE_AGENTS=doctor_agent,nurse_agent
+    cached_agents = os.getenv("ER_RESPONSE_CACHE_AGENTS")
+    if cached_agents:
+        plugins.append(ResponseCachePlugin(
+            {agent.strip(): DEFAULT_STATE_KEYS for agent in cached_agents.split(",") if agent.strip()},
+            response_cache,
+        ))
+
+    # Token / cost totals in session state["usage"]; past a budget, calls go
+    # to a cheaper model (soft) and prompts are compacted (hard). Before
+    # admission, so calls are rate-limited against the model actually used
+    soft_budget = os.getenv("ER_SESSION_SOFT_BUDGET_USD")
+    hard_budget = os.getenv("ER_SESSION_HARD_BUDGET_USD")
+    prices = os.getenv("ER_MODEL_PRICES")
+    usage = UsagePlugin(
+        {**DEFAULT_PRICES, **parse_prices(prices)} if prices else None,
+        soft_budget_usd=float(soft_budget) if soft_budget else None,
+        hard_budget_usd=float(hard_budget) if hard_budget else None,
+        fallback_model=os.getenv("ER_BUDGET_FALLBACK_MODEL", "gemini-2.0-flash-lite"),
+    )
+
+    # Prepare the doctor / evaluator before their handover; drafts served
+    # from here skip admission like cache hits, and are charged to usage
+    # when drafted
+    if os.getenv("ER_PREPARE_NEXT_STAGE", "").lower() in ("1", "true", "yes"):
+        plugins.append(StagePreparationPlugin(emergency_room_agent, usage=usage))
+
+    plugins.append(usage)
+
+    # e.g. ER_MODEL_RATE_LIMITS=gemini-2.0-flash=60,gemini-2.5-flash=30
+    rate_limits = os.getenv("ER_MODEL_RATE_LIMITS")
+    if rate_limits:
+        plugins.append(AdmissionPlugin(AdmissionController(
+            parse_rate_limits(rate_limits),
+            max_queue=int(os.getenv("ER_ADMISSION_MAX_QUEUE", "100")),
+            max_wait=float(os.getenv("ER_ADMISSION_MAX_WAIT", "10")),
+        )))
+
+    # Per-turn rows for the admin dashboards, e.g. ER_ANALYTICS_DIR=analytics
+    analytics_dir = os.getenv("ER_ANALYTICS_DIR")
+    if analytics_dir:
+        store = EventStore(analytics_dir)
+        atexit.register(store.flush)
+        plugins.append(TurnRecorderPlugin(store))
+
+    return plugins
+
+
+async def current_stage(app_name, user_id, session_id):
+    session = await session_service_stateful.get_session(
+        app_name=app_name, user_id=user_id, session_id=session_id
     )
-    runner = Runner(
+    return STAGE_NAMES[session.state["states"]["current_stage"]]
+
+
+def build_runner():
+    return Runner(
         agent=emergency_room_agent,
         app_name=APP_NAME,
         session_service=session_service_stateful,
+        plugins=build_plugins(),
+    )
+
+
+async def start_session():
+    """Create a new session and a runner for it"""
+    USER_ID = "brandon_hancock"
+    SESSION_ID = str(uuid.uuid4())
+
+    await session_service_stateful.create_session(
+        app_name=APP_NAME,
+        user_id=USER_ID,
+        session_id=SESSION_ID,
+        state=build_initial_state(SESSION_ID),
     )
+    return build_runner(), USER_ID, SESSION_ID
+
+
+async def main(profiler: TurnProfiler = None):
+
+    # Create a NEW session
+    runner, USER_ID, SESSION_ID = await start_session()
 
     while True:
         # Get user input
@@ -77,8 +174,114 @@ async def main():
             break
 
         # Process the user query through the agent with JSON output
-        await call_agent_async_json(runner, USER_ID, SESSION_ID, user_input)
+        if profiler is None:
+            await call_agent_async_json(runner, USER_ID, SESSION_ID, user_input)
+            continue
+
+        stage = await current_stage(runner.app_name, USER_ID, SESSION_ID)
+        with profiler.turn(SESSION_ID, stage) as turn:
+            response = await call_agent_async_json(runner, USER_ID, SESSION_ID, user_input)
+            if response:
+                turn.agent = response["author"]
+
+    if profiler:
+        print(profiler.summary())
+    if hedger:
+        print(json.dumps(hedger.get_stats(), indent=2))
+
+
+async def voice_main():
+    """Run the simulation by voice: microphone -> agents -> speakers"""
+    # Audio dependencies (pyaudio, Cloud Speech / TTS) are only needed here
+    from emergency_room_agent.sub_agents.stt_agent import STTAgent
+    from emergency_room_agent.sub_agents.tts_agent import TTSAgent
+    from emergency_room_agent.echo import EchoGate
+    from emergency_room_agent.voice_pipeline import VoicePipeline, parse_stage_settings
+
+    runner, USER_ID, SESSION_ID = await start_session()
+    # Keep the speakers' reply out of the microphone:
+    # ER_VOICE_ECHO_GATE=correlation (default), half_duplex or off
+    gate_mode = os.getenv("ER_VOICE_ECHO_GATE", "correlation")
+    echo_gate = EchoGate(gate_mode) if gate_mode != "off" else None
+    stt = STTAgent(echo_gate=echo_gate)
+    tts = TTSAgent(voice_name=os.getenv("ER_VOICE_NAME"), echo_gate=echo_gate)
+    # Start the turn on interim transcripts that stop changing, e.g.
+    # ER_VOICE_SPECULATE=true ER_VOICE_SPECULATE_WINDOW=0.6
+    speculator = None
+    if os.getenv("ER_VOICE_SPECULATE", "").lower() in ("1", "true", "yes"):
+        plugins = runner.plugin_manager.plugins
+        speculator = SpeculativeTurnRunner(
+            runner,
+            stability_window=float(os.getenv("ER_VOICE_SPECULATE_WINDOW", "0.6")),
+            # Sandbox calls are rate-limited with everyone else's and may be
+            # replayed; usage and analytics only see committed speculations,
+            # and discarded ones must not fill the response cache
+            plugins=[
+                plugin for plugin in plugins
+                if isinstance(plugin, AdmissionPlugin)
+                or (isinstance(plugin, CassettePlugin) and plugin.mode != "record")
+            ],
+            usage=next((plugin for plugin in plugins if isinstance(plugin, UsagePlugin)), None),
+            recorder=next((plugin for plugin in plugins if isinstance(plugin, TurnRecorderPlugin)), None),
+        )
+    # e.g. ER_VOICE_CONCURRENCY=synthesis=3 ER_VOICE_QUEUE_SIZES=playback=1
+    pipeline = VoicePipeline(
+        runner,
+        USER_ID,
+        SESSION_ID,
+        stt,
+        tts,
+        concurrency=parse_stage_settings(os.getenv("ER_VOICE_CONCURRENCY", "")),
+        queue_sizes=parse_stage_settings(os.getenv("ER_VOICE_QUEUE_SIZES", "")),
+        barge_in=os.getenv("ER_VOICE_BARGE_IN", "true").lower() in ("1", "true", "yes"),
+        speculator=speculator,
+        on_utterance=lambda transcript: print(f"You: {transcript}"),
+        on_reply=lambda author, text: print(json.dumps({"author": author, "message": text})),
+    )
+
+    print("Speak to the nurse. Press Ctrl+C to stop.")
+    try:
+        await pipeline.run()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        stt.stop_listening()
+        await stt.resources.release_loop()
+        print(json.dumps(pipeline.get_stats(), indent=2))
+
+
+async def worker_main(socket_path: str = None, max_concurrency: int = 64):
+    """Serve many sessions over the JSON-lines worker protocol (see worker.py)"""
+    reports = {"hedging": hedger.get_stats} if hedger else None
+    worker = Worker(build_runner(), max_concurrency=max_concurrency, reports=reports)
+    await run_worker(worker, socket_path)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the emergency room simulation in the terminal")
+    parser.add_argument("--profile", choices=MODES, nargs="?", const="sampling",
+                        help="Profile agent turns (default mode: sampling)")
+    parser.add_argument("--profile-every", type=int, default=1, help="Profile every Nth turn")
+    parser.add_argument("--profile-dir", default="profiles", help="Where per-turn profiles are written")
+    parser.add_argument("--profile-top", type=int, default=20, help="Entries in the run summary")
+    parser.add_argument("--voice", action="store_true",
+                        help="Talk to the agents through the microphone and speakers")
+    parser.add_argument("--worker", action="store_true",
+                        help="Serve many sessions over JSON lines on stdin/stdout (see worker.py)")
+    parser.add_argument("--socket", help="With --worker: listen on this Unix socket instead of stdin")
+    parser.add_argument("--max-concurrency", type=int, default=64,
+                        help="With --worker: requests executed at once")
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(worker_main(args.socket, args.max_concurrency))
+    elif args.voice:
+        try:
+            asyncio.run(voice_main())
+        except KeyboardInterrupt:
+            pass
+    else:
+        profiler = None
+        if args.profile:
+            profiler = TurnProfiler(args.profile, args.profile_dir, args.profile_every, top=args.profile_top)
+        asyncio.run(main(profiler))
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Per-turn profiling for the agent entry point (python main.py --profile).
+
+Each profiled turn writes its own files to the output directory, named after
+the turn number, session id, stage and answering agent:
+
+    sampling: <turn>.collapsed - one "frame;frame;frame count" line per stack,
+              ready for flamegraph.pl or speedscope
+    cprofile: <turn>.prof      - deterministic profile for pstats / snakeviz
+
+A top-N summary across all profiled turns is printed when the run ends.
+Sampling only sees the stack between bytecodes, so long C calls that hold the
+GIL (the C JSON encoder, pydantic-core) are under-counted; use cprofile to
+measure those.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+MODES = ("sampling", "cprofile")
+
+# Leaf frames that mean the event loop is idle, waiting on the network
+_IDLE_FRAMES = {"selectors.py:select", "selectors.py:poll", "threading.py:wait"}
+
+
+class TurnRecord:
+    """Tags for one turn; the agent is filled in once the turn has answered"""
+
+    def __init__(self, number: int, session_id: str, stage: str):
+        self.number = number
+        self.session_id = session_id
+        self.stage = stage
+        self.agent = "unknown"
+
+    @property
+    def name(self) -> str:
+        parts = (f"turn{self.number:04d}", self.session_id[:8], self.stage, self.agent)
+        return "_".join(re.sub(r"[^\w.-]", "-", str(part)) for part in parts)
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+class TurnProfiler:
+    def __init__(self,
+                 mode: str = "sampling",
+                 output_dir: str = "profiles",
+                 every: int = 1,
+                 interval: float = 0.005,
+                 top: int = 20):
+        """
+        Profile selected agent turns
+
+        Args:
+            mode: "sampling" (low overhead, collapsed stacks) or "cprofile"
+                (deterministic, every call counted)
+            output_dir: Directory for the per-turn files
+            every: Profile every Nth turn only
+            interval: Seconds between stack samples in sampling mode
+            top: Entries shown in the run summary
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode}. Use one of {MODES}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.every = max(1, every)
+        self.interval = interval
+        self.top = top
+        self.turns = 0
+        self.profiled = []
+        self._self_samples = Counter()
+        self._total_samples = 0
+        self._idle_samples = 0
+        self._stats = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    @contextmanager
+    def turn(self, session_id: str, stage: str):
+        """Profile the code inside the with block as one turn"""
+        self.turns += 1
+        record = TurnRecord(self.turns, session_id, stage)
+        if (self.turns - 1) % self.every:
+            yield record
+            return
+
+        started = time.perf_counter()
+        if self.mode == "sampling":
+            sampler = _StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            try:
+                yield record
+            finally:
+                self._save_samples(record, sampler.stop())
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield record
+            finally:
+                profile.disable()
+                self._save_profile(record, profile)
+        self.profiled.append((record.name, time.perf_counter() - started))
+
+    def _save_samples(self, record: TurnRecord, stacks: Counter):
+        path = os.path.join(self.output_dir, f"{record.name}.collapsed")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        for stack, count in stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            self._total_samples += count
+            if leaf in _IDLE_FRAMES:
+                self._idle_samples += count
+            else:
+                self._self_samples[leaf] += count
+
+    def _save_profile(self, record: TurnRecord, profile: cProfile.Profile):
+        profile.dump_stats(os.path.join(self.output_dir, f"{record.name}.prof"))
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+
+    def summary(self) -> str:
+        """Top-N hotspots across every profiled turn"""
+        if not self.profiled:
+            return "No turns profiled"
+
+        lines = [f"Profiled {len(self.profiled)} of {self.turns} turns ({self.mode}), "
+                 f"files in {self.output_dir}/"]
+        for name, seconds in self.profiled:
+            lines.append(f"  {name}: {seconds * 1000:.0f} ms")
+
+        if self.mode == "sampling":
+            busy = self._total_samples - self._idle_samples
+            lines.append(f"Top {self.top} frames by self samples "
+                         f"({busy} busy, {self._idle_samples} waiting on I/O):")
+            for frame, count in self._self_samples.most_common(self.top):
+                lines.append(f"  {count / max(1, busy):6.1%} {count:6d}  {frame}")
+        elif self._stats is not None:
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats("cumulative").print_stats(self.top)
+            lines.append(out.getvalue())
+        return "\n".join(lines)
@@ -0,0 +1,9 @@
+"""
+Custom session services for `adk api_server` / `adk web`, loaded from the
+agents directory by the ADK service registry.
+"""
+from google.adk.cli.service_registry import get_service_registry
+
+from emergency_room_agent.hibernation import from_uri
+
+get_service_registry().register_session_service("hibernate", from_uri)
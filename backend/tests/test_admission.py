@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from emergency_room_agent.admission import (
+    AdmissionController,
+    AdmissionPlugin,
+    AdmissionRejected,
+    TokenBucket,
+    parse_rate_limits,
+)
+
+
+def _controller(max_queue=100, max_wait=10.0):
+    """One token at a time, refilled every 10 ms"""
+    controller = AdmissionController({}, max_queue=max_queue, max_wait=max_wait)
+    controller.buckets["m"] = TokenBucket(6000, burst=1)
+    return controller
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(60, burst=2)
+    assert bucket.try_take() and bucket.try_take()
+    assert not bucket.try_take()
+    assert 0 < bucket.seconds_until_available() <= 1.0
+    assert parse_rate_limits("gemini-2.0-flash=60, gemini-2.5-flash=30") == \
+        {"gemini-2.0-flash": 60.0, "gemini-2.5-flash": 30.0}
+
+
+def test_queued_sessions_are_served_round_robin():
+    async def run():
+        controller = _controller()
+        admitted = []
+
+        async def call(session_id, n):
+            await controller.acquire("m", session_id)
+            admitted.append(f"{session_id}{n}")
+
+        await call("a", 0)  # takes the only token
+        calls = [asyncio.create_task(call("a", n)) for n in range(1, 4)]
+        await asyncio.sleep(0)
+        calls.append(asyncio.create_task(call("b", 0)))
+        await asyncio.gather(*calls)
+
+        assert admitted == ["a0", "a1", "b0", "a2", "a3"]
+        stats = controller.get_stats()["m"]
+        assert stats["admitted"] == 5 and stats["queued"] == 4 and stats["queue_depth"] == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected_at_once_with_retry_after():
+    async def run():
+        controller = _controller(max_queue=1)
+        await controller.acquire("m", "a")
+        queued = asyncio.create_task(controller.acquire("m", "a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("m", "b")
+        assert rejected.value.retry_after >= 0
+        assert controller.get_stats()["m"]["rejected"] == 1
+        await queued
+
+        # Expected wait beyond max_wait is refused without queuing
+        slow = AdmissionController({"m": 6}, max_wait=1.0)
+        await slow.acquire("m", "a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await slow.acquire("m", "a")
+        assert rejected.value.retry_after == 10.0
+        assert slow.queue_depth("m") == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_and_timed_out_waiters_leave_the_queue():
+    async def run():
+        controller = _controller(max_queue=2, max_wait=0.05)
+        controller.buckets["m"] = TokenBucket(6, burst=1)  # next token in 10 s
+        await controller.acquire("m", "a")
+
+        cancelled = [asyncio.create_task(controller.acquire("m", "a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        for task in cancelled:
+            task.cancel()
+        await asyncio.gather(*cancelled, return_exceptions=True)
+        assert controller.queue_depth("m") == 0
+
+        controller.max_wait = 60
+        timed_out = asyncio.create_task(asyncio.wait_for(controller.acquire("m", "b"), 0.01))
+        with pytest.raises(asyncio.TimeoutError):
+            await timed_out
+        assert controller.queue_depth("m") == 0
+
+    asyncio.run(run())
+
+
+def test_parallel_calls_of_one_agent_are_timed_separately():
+    async def run():
+        controller = AdmissionController({})
+        plugin = AdmissionPlugin(controller)
+        context = SimpleNamespace(invocation_id="inv", agent_name="nurse_agent", session=SimpleNamespace(id="s1"))
+
+        async def call(seconds):
+            await plugin.before_model_callback(callback_context=context, llm_request=SimpleNamespace(model="m"))
+            await asyncio.sleep(seconds)
+            await plugin.after_model_callback(callback_context=context, llm_response=None)
+
+        await asyncio.gather(call(0.05), call(0.01))
+
+        samples = sorted(controller.stats["m"].model_ms)
+        assert len(samples) == 2
+        assert samples[0] < 30 <= samples[1]
+
+    asyncio.run(run())
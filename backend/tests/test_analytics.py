@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from emergency_room_agent.analytics import (
+    EventStore,
+    median_time_to_ecg,
+    sbar_attempt_distribution,
+    usage_by_agent,
+)
+
+DAY = datetime(2025, 9, 27, 12, tzinfo=timezone.utc)
+
+
+def _row(session_id, ts, cohort="a", agent="nurse_agent", elapsed=0.0, flags=(), approved=False):
+    return {
+        "ts": ts, "cohort": cohort, "user_id": "u", "session_id": session_id, "invocation_id": "inv",
+        "stage": 0, "agent": agent, "tool_calls": [], "flag_changes": list(flags), "sbar_approved": approved,
+        "session_elapsed_s": elapsed, "stage_elapsed_s": 0.0, "turn_ms": 10.0, "model_ms": 8.0,
+        "model_calls": 1, "prompt_tokens": 100, "output_tokens": 10,
+    }
+
+
+def _partitions(root):
+    return {path.name: sorted(child.name.split("-")[0] for child in path.iterdir())
+            for path in root.iterdir()}
+
+
+def test_flush_writes_one_file_per_date_partition(tmp_path):
+    store = EventStore(str(tmp_path), flush_rows=2)
+    store.append(_row("s1", DAY))
+    assert not store.due()
+    store.append(_row("s1", DAY + timedelta(days=1)))
+    assert store.due()
+
+    # Buffered rows are visible before the flush
+    assert store.table(["session_id"]).num_rows == 2
+    store.flush()
+
+    assert _partitions(tmp_path) == {"date=2025-09-27": ["part"], "date=2025-09-28": ["part"]}
+    assert store.table(["session_id", "date"]).column("date").to_pylist() == ["2025-09-27", "2025-09-28"]
+    assert store.get_stats()["rows_written"] == 2
+
+
+def test_compaction_keeps_replaced_files_for_running_readers(tmp_path):
+    store = EventStore(str(tmp_path), compact_files=100, retire_after=60)
+    for i in range(3):
+        store.append(_row(f"s{2 - i}", DAY + timedelta(seconds=i)))
+        store.flush()
+    reader = store.dataset()  # e.g. an /analytics request in another process
+
+    store.compact()
+
+    files = _partitions(tmp_path)["date=2025-09-27"]
+    assert files == ["compact", "compact", "part", "part", "part"]  # .parquet and .sources
+    assert reader.to_table().num_rows == 3
+    table = store.table(["session_id"])
+    assert table.column("session_id").to_pylist() == ["s0", "s1", "s2"]
+
+    # Once no reader can be using them, the replaced files go
+    store.retire_after = 0
+    store.compact()
+    assert _partitions(tmp_path)["date=2025-09-27"] == ["compact"]
+    assert store.table(["session_id"]).num_rows == 3
+
+
+def test_flush_compacts_partitions_with_too_many_files(tmp_path):
+    store = EventStore(str(tmp_path), compact_files=3, retire_after=0)
+    for i in range(3):
+        store.append(_row(f"s{i}", DAY))
+        store.flush()
+
+    assert _partitions(tmp_path)["date=2025-09-27"] == ["compact"]
+    assert store.get_stats()["compactions"] == 1
+    assert store.table(["session_id"]).num_rows == 3
+
+
+def test_queries(tmp_path):
+    store = EventStore(str(tmp_path))
+    rows = [
+        _row("s1", DAY, elapsed=30, flags=["protocol_ecg_ordered"]),
+        _row("s1", DAY + timedelta(seconds=1), elapsed=90, flags=["protocol_ecg_ordered"]),
+        _row("s2", DAY, elapsed=60, flags=["protocol_ecg_ordered"]),
+        _row("s3", DAY, cohort="b", elapsed=120, flags=["protocol_ecg_ordered"]),
+        _row("s1", DAY + timedelta(seconds=2), agent="doctor_agent"),
+        _row("s1", DAY + timedelta(seconds=3), agent="doctor_agent", approved=True),
+        _row("s2", DAY + timedelta(seconds=2), agent="doctor_agent", approved=True),
+        _row("s3", DAY + timedelta(seconds=2), cohort="b", agent="doctor_agent"),
+    ]
+    for row in rows:
+        store.append(row)
+    store.flush()
+
+    assert median_time_to_ecg(store) == {"a": {"median_s": 45.0, "sessions": 2},
+                                         "b": {"median_s": 120.0, "sessions": 1}}
+    assert median_time_to_ecg(store, since=date(2025, 9, 28)) == {}
+
+    assert sbar_attempt_distribution(store) == {"attempts": {1: 1, 2: 1}, "approved": 2, "not_approved": 1}
+    assert sbar_attempt_distribution(store, cohort="b") == {"attempts": {}, "approved": 0, "not_approved": 1}
+
+    usage = usage_by_agent(store)
+    assert usage["nurse_agent"] == {"turns": 4, "prompt_tokens": 400, "output_tokens": 40, "model_ms_p50": 8.0}
+    assert usage["doctor_agent"]["turns"] == 4
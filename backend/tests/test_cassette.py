@@ -0,0 +1,75 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from emergency_room_agent.cassette import CassetteMiss, CassettePlugin
+
+
+def _reply(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class _StubLlm(BaseLlm):
+    """Answers with a numbered reply; counts its calls"""
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        self.calls += 1
+        yield _reply(f"live answer {self.calls}")
+
+
+class _Shortcut(BasePlugin):
+    """Stands in for the response cache / stage preparation: answers "cached" itself"""
+
+    async def before_model_callback(
+        self, *, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        if llm_request.contents[-1].parts[0].text == "cached":
+            return _reply("from the cache")
+        return None
+
+
+async def _ask(model, plugins, *messages):
+    runner = Runner(agent=LlmAgent(name="nurse_agent", model=model), app_name="app",
+                    session_service=InMemorySessionService(), plugins=plugins)
+    await runner.session_service.create_session(app_name="app", user_id="u", session_id="s1")
+    replies = []
+    for message in messages:
+        async for event in runner.run_async(user_id="u", session_id="s1", new_message=types.Content(
+                role="user", parts=[types.Part(text=message)])):
+            replies.append(event.content.parts[0].text)
+    return replies
+
+
+def test_record_replay_and_strict_miss(tmp_path):
+    path = str(tmp_path / "cassettes" / "run.jsonl.gz")
+
+    async def run():
+        recorder = CassettePlugin(path, "record")
+        recorded = await _ask(_StubLlm(model="m"), [recorder, _Shortcut(name="shortcut")], "hello", "cached")
+        assert recorded == ["live answer 1", "from the cache"]
+        assert recorder.get_stats()["recorded"] == 2
+        assert recorder._pending == {}
+
+        # Replays answer both calls without the model, in strict mode too
+        model = _StubLlm(model="m")
+        for mode in ("replay", "strict"):
+            assert await _ask(model, [CassettePlugin(path, mode)], "hello", "cached") == recorded
+        assert model.calls == 0
+
+        replay = CassettePlugin(path, "replay")
+        assert await _ask(model, [replay], "something new") == ["live answer 1"]
+        assert replay.get_stats()["misses"] == 1
+
+        with pytest.raises((CassetteMiss, RuntimeError), match="No recorded response for nurse_agent"):
+            await _ask(model, [CassettePlugin(path, "strict")], "something else")
+
+    asyncio.run(run())
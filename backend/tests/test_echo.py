@@ -0,0 +1,58 @@
+import numpy as np
+
+from emergency_room_agent.echo import EchoGate
+
+RATE = 16000
+FRAME = 1024
+
+
+def _pcm(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def _noise(seconds: float, seed: int, level: float = 0.3) -> np.ndarray:
+    return np.random.default_rng(seed).normal(0, level, int(seconds * RATE)).astype(np.float32)
+
+
+def test_passes_everything_when_nothing_plays():
+    gate = EchoGate("correlation")
+    assert gate.admit(_pcm(_noise(FRAME / RATE, 1)))
+    assert gate.stats.passed == 1
+
+
+def test_suppresses_echo_of_the_playback():
+    gate = EchoGate("correlation")
+    reply = _noise(0.5, 2)
+    gate.playback(_pcm(reply), RATE)
+
+    # The speakers' reply reaching the microphone, delayed and quieter
+    echo = 0.5 * reply[-FRAME - 800:-800]
+    assert not gate.admit(_pcm(echo))
+    assert gate.stats.suppressed_echo == 1
+
+
+def test_admits_the_trainee_talking_over_the_reply():
+    gate = EchoGate("correlation")
+    gate.playback(_pcm(_noise(0.5, 3)), RATE)
+
+    assert gate.admit(_pcm(_noise(FRAME / RATE, 4)))
+    assert gate.stats.passed_during_playback == 1
+
+
+def test_drops_quiet_frames_during_playback():
+    gate = EchoGate("correlation")
+    gate.playback(_pcm(_noise(0.5, 5)), RATE)
+
+    assert not gate.admit(_pcm(_noise(FRAME / RATE, 6, level=0.001)))
+    assert gate.stats.suppressed_quiet == 1
+
+
+def test_half_duplex_drops_all_frames_during_playback():
+    gate = EchoGate("half_duplex", hangover=0.3)
+    gate.playback(_pcm(_noise(0.1, 7)), RATE)
+
+    assert not gate.admit(_pcm(_noise(FRAME / RATE, 8)))
+    assert gate.stats.suppressed_half_duplex == 1
+
+    gate._last_played -= 1.0  # hangover over
+    assert gate.admit(_pcm(_noise(FRAME / RATE, 9)))
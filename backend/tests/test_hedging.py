@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from emergency_room_agent.hedging import RequestHedger
+
+
+class _CutOffLlm(BaseLlm):
+    """The primary model's request is cancelled underneath it (e.g. by its
+    HTTP client); requests for hedge_model answer, or fail with hedge_error"""
+    hedge_error: bool = False
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        await asyncio.sleep(0.05)
+        if llm_request.model != "hedge":
+            raise asyncio.CancelledError()
+        if self.hedge_error:
+            raise RuntimeError("hedge failed")
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text="from the hedge")]))
+
+
+def _request():
+    return LlmRequest(model="primary", contents=[types.Content(role="user", parts=[types.Part(text="hi")])])
+
+
+def _hedged(**fields):
+    hedger = RequestHedger(budget=1.0, initial_delay=0.01, min_delay=0.01, hedge_model="hedge")
+    return hedger, hedger.wrap(_CutOffLlm(model="primary", **fields))
+
+
+def test_cancelled_primary_is_rescued_by_the_hedge():
+    async def run():
+        hedger, model = _hedged()
+        responses = [response async for response in model.generate_content_async(_request())]
+
+        assert responses[0].content.parts[0].text == "from the hedge"
+        assert hedger.stats.rescued_errors == 1
+
+    asyncio.run(run())
+
+
+def test_both_attempts_failing_reports_the_hedge_error_for_a_cancelled_primary():
+    async def run():
+        hedger, model = _hedged(hedge_error=True)
+        with pytest.raises(RuntimeError, match="hedge failed"):
+            async for _ in model.generate_content_async(_request()):
+                pass
+        assert hedger.stats.errors == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_call_without_a_hedge_is_an_error_not_a_cancellation():
+    async def run():
+        hedger = RequestHedger(budget=0.0, burst=0.0, initial_delay=0.01)
+        model = hedger.wrap(_CutOffLlm(model="primary"))
+        with pytest.raises(RuntimeError, match="cancelled"):
+            async for _ in model.generate_content_async(_request()):
+                pass
+        assert hedger.stats.budget_denied == 1
+
+    asyncio.run(run())
+
+
+class _SlowLlm(BaseLlm):
+    """Answers after delays[model] seconds; remembers the requests cancelled"""
+    delays: dict
+    cancelled: list = []
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        try:
+            await asyncio.sleep(self.delays[llm_request.model])
+        except asyncio.CancelledError:
+            self.cancelled.append(llm_request.model)
+            raise
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=llm_request.model)]))
+
+
+async def _call(model):
+    return [response.content.parts[0].text async for response in model.generate_content_async(_request())]
+
+
+def test_hedges_after_the_p95_latency():
+    async def run():
+        hedger = RequestHedger(budget=1.0, min_samples=20, initial_delay=5.0, min_delay=0.01, hedge_model="hedge")
+        for i in range(20):
+            hedger.record("primary", 0.01 + i * 0.001, hedge_won=False)
+        assert hedger.delay("primary") == pytest.approx(0.029)
+
+        llm = _SlowLlm(model="primary", delays={"primary": 1.0, "hedge": 0.0})
+        started = asyncio.get_running_loop().time()
+        assert await _call(hedger.wrap(llm)) == ["hedge"]
+
+        assert asyncio.get_running_loop().time() - started < 0.5
+        assert hedger.stats.hedged == 1 and hedger.stats.hedge_wins == 1
+        # The primary was cut off: its latency is unknown, not ~29 ms
+        assert len(hedger._latencies["primary"]) == 20
+        assert len(hedger._delivered_ms) == 21
+
+    asyncio.run(run())
+
+
+def test_fast_calls_are_not_hedged():
+    async def run():
+        hedger = RequestHedger(budget=1.0, initial_delay=0.1, hedge_model="hedge")
+        llm = _SlowLlm(model="primary", delays={"primary": 0.0, "hedge": 0.0})
+        assert await _call(hedger.wrap(llm)) == ["primary"]
+
+        assert hedger.stats.hedged == 0
+        assert len(hedger._latencies["primary"]) == 1
+
+    asyncio.run(run())
+
+
+def test_hedges_stop_when_the_budget_is_spent():
+    async def run():
+        # One hedge of credit to start with, and 0.1 more per call
+        hedger = RequestHedger(budget=0.1, burst=5.0, initial_delay=0.01, hedge_model="hedge")
+        model = hedger.wrap(_SlowLlm(model="primary", delays={"primary": 0.05, "hedge": 0.0}))
+        answers = [await _call(model) for _ in range(3)]
+
+        assert answers == [["hedge"], ["primary"], ["primary"]]
+        assert hedger.stats.hedged == 1 and hedger.stats.budget_denied == 2
+        assert hedger.get_stats()["hedge_rate"] == pytest.approx(1 / 3, abs=1e-4)
+
+    asyncio.run(run())
+
+
+def test_loser_is_cancelled():
+    async def run():
+        hedger = RequestHedger(budget=1.0, initial_delay=0.01, hedge_model="hedge")
+        llm = _SlowLlm(model="primary", delays={"primary": 10.0, "hedge": 0.0}, cancelled=[])
+        assert await _call(hedger.wrap(llm)) == ["hedge"]
+        await asyncio.sleep(0)
+
+        assert llm.cancelled == ["primary"]
+        assert not [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import asyncio
+
+from emergency_room_agent.hibernation import HibernatingSessionService
+from emergency_room_agent.state_sync import StateLog
+
+APP = "app"
+USER = "trainee"
+
+
+def _service(tmp_path):
+    return HibernatingSessionService(str(tmp_path), sweep_interval=0, state_log=StateLog())
+
+
+async def _hibernated_session(service, session_id="s1"):
+    await service.create_session(app_name=APP, user_id=USER, session_id=session_id, state={"n": 1})
+    assert await service.hibernate(APP, USER, session_id)
+
+
+def test_concurrent_gets_reload_once(tmp_path):
+    async def run():
+        service = _service(tmp_path)
+        await _hibernated_session(service)
+
+        sessions = await asyncio.gather(*(
+            service.get_session(app_name=APP, user_id=USER, session_id="s1") for _ in range(5)
+        ))
+
+        assert all(session is not None and session.state["n"] == 1 for session in sessions)
+        assert service.reloads == 1
+        assert service.get_stats()["hibernated"] == 0
+        assert service.get_stats()["resident"] == 1
+
+    asyncio.run(run())
+
+
+def test_delete_during_reload(tmp_path):
+    async def run():
+        service = _service(tmp_path)
+        await _hibernated_session(service)
+        get = asyncio.create_task(service.get_session(app_name=APP, user_id=USER, session_id="s1"))
+        await asyncio.sleep(0)
+
+        await service.delete_session(app_name=APP, user_id=USER, session_id="s1")
+        await get
+
+        assert await service.get_session(app_name=APP, user_id=USER, session_id="s1") is None
+        assert service.get_stats()["hibernated"] == 0
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(run())
+
+
+def test_list_during_reload(tmp_path):
+    async def run():
+        service = _service(tmp_path)
+        await _hibernated_session(service, "s1")
+        await _hibernated_session(service, "s2")
+
+        listed, _ = await asyncio.gather(
+            service.list_sessions(app_name=APP, user_id=USER),
+            service.get_session(app_name=APP, user_id=USER, session_id="s1"),
+        )
+
+        assert sorted(session.id for session in listed.sessions) == ["s1", "s2"]
+
+    asyncio.run(run())
+
+
+def test_restart_picks_up_hibernated_sessions(tmp_path):
+    async def run():
+        await _hibernated_session(_service(tmp_path), "s1")
+        await _hibernated_session(_service(tmp_path), "s2")
+        (tmp_path / "broken.session.z").write_bytes(b"not zlib")
+        (tmp_path / "half.session.z.tmp").write_bytes(b"")
+
+        service = _service(tmp_path)
+        assert service.get_stats()["hibernated"] == 2
+        listed = await service.list_sessions(app_name=APP, user_id=USER)
+        assert sorted(session.id for session in listed.sessions) == ["s1", "s2"]
+
+        session = await service.get_session(app_name=APP, user_id=USER, session_id="s1")
+        assert session.state["n"] == 1
+        await service.delete_session(app_name=APP, user_id=USER, session_id="s2")
+        assert sorted(path.name for path in tmp_path.iterdir()) == []
+
+    asyncio.run(run())
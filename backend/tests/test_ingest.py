@@ -0,0 +1,74 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("pyaudio")
+pytest.importorskip("google.cloud.speech")
+
+from emergency_room_agent.sub_agents.stt_agent.ingest import AudioIngestSession, PcmDecoder
+
+FRAME = b"\x00\x01" * 160
+
+
+def make_session(recognize, max_pending_frames=2):
+    session = AudioIngestSession("s1", PcmDecoder(16000), ThreadPoolExecutor(1), max_pending_frames)
+    session.task = asyncio.create_task(recognize(session.chunks()))
+    return session
+
+
+def test_feed_raises_once_recognition_has_failed():
+    async def recognize(chunks):
+        raise ConnectionError("stream reset")
+
+    async def run():
+        session = make_session(recognize)
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match="stream reset"):
+            for _ in range(10):
+                await asyncio.wait_for(session.feed(FRAME), 1.0)
+        with pytest.raises(ConnectionError):
+            await session.close()
+
+    asyncio.run(run())
+
+
+def test_feed_blocked_on_full_queue_raises_when_recognition_dies():
+    async def run():
+        stop = asyncio.Event()
+
+        async def recognize(chunks):
+            await stop.wait()  # never reads the queue
+            raise ConnectionError("deadline exceeded")
+
+        session = make_session(recognize, max_pending_frames=2)
+        await session.feed(FRAME)
+        await session.feed(FRAME)
+        blocked = asyncio.create_task(session.feed(FRAME))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        assert session.stats.backpressure_waits == 1
+
+        stop.set()
+        with pytest.raises(RuntimeError, match="deadline exceeded"):
+            await asyncio.wait_for(blocked, 1.0)
+
+    asyncio.run(run())
+
+
+def test_close_drains_audio_and_returns_cleanly():
+    async def run():
+        received = []
+
+        async def recognize(chunks):
+            async for chunk in chunks:
+                await asyncio.sleep(0.01)
+                received.append(chunk)
+
+        session = make_session(recognize, max_pending_frames=2)
+        for _ in range(5):
+            await session.feed(FRAME)
+        await session.close()
+        assert len(received) == 5
+
+    asyncio.run(run())
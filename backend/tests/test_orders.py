@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from emergency_room_agent.state import build_initial_state
+from emergency_room_agent.sub_agents.nurse_agent.agent import acknowledge_orders
+from emergency_room_agent.tools import deep_merge, run_concurrently, update_state
+
+
+def _context(**changes):
+    return SimpleNamespace(state=deep_merge(build_initial_state("s1"), changes))
+
+
+def test_update_state_keeps_sibling_keys():
+    context = _context()
+    shared_patient = context.state["patient_information"]
+
+    written = update_state(context, {"session_flags": {"protocol_asa_given": True}, "cohort": "A"})
+
+    assert written["session_flags"] == {
+        "protocol_asa_given": True,
+        "protocol_ecg_ordered": False,
+        "protocol_diagnosis_confirmed": False,
+        "protocol_nitro_or_morphine": False,
+    }
+    assert context.state["cohort"] == "A"
+    assert context.state["patient_information"] is shared_patient
+
+
+def test_deep_merge_copies_only_changed_paths():
+    base = build_initial_state("s1")
+    merged = deep_merge(base, {"states": {"current_stage": 2}})
+
+    assert merged["states"]["current_stage"] == 2
+    assert base["states"]["current_stage"] == 0
+    assert merged["states"]["stages"] is base["states"]["stages"]
+
+
+def test_one_call_merges_every_order_and_moves_to_stage_1():
+    context = _context()
+
+    result = asyncio.run(acknowledge_orders(["give aspirin", "12-lead ECG", "start oxygen"], context))
+
+    assert [order["type"] for order in result["orders"]] == ["aspirin", "ecg", "oxygen"]
+    assert result["stage_updated"]
+    assert context.state["states"]["current_stage"] == 1
+    flags = context.state["session_flags"]
+    assert flags["protocol_asa_given"] and flags["protocol_ecg_ordered"]
+    assert not flags["protocol_nitro_or_morphine"]
+
+
+def test_earlier_flags_count_towards_the_stage_change():
+    context = _context(session_flags={"protocol_asa_given": True})
+
+    result = asyncio.run(acknowledge_orders(["get an EKG"], context))
+
+    assert result["stage_updated"]
+    assert context.state["session_flags"]["protocol_asa_given"]
+
+
+def test_contraindicated_medication_is_held():
+    context = _context(
+        states={"current_stage": 2},
+        patient_information={"static_patient_data": {"vitals_snapshot": {"BP_Systolic": 90}}},
+    )
+
+    result = asyncio.run(acknowledge_orders(["nitro 0.4 sublingual", "morphine"], context))
+
+    assert [order["done"] for order in result["orders"]] == [False, True]
+    assert context.state["session_flags"]["protocol_nitro_or_morphine"]
+    assert not result["stage_updated"]
+
+
+def test_session_without_flags_is_not_advanced():
+    context = _context()
+    del context.state["session_flags"]
+
+    result = asyncio.run(acknowledge_orders(["start oxygen"], context))
+
+    assert not result["stage_updated"]
+    assert context.state["states"]["current_stage"] == 0
+
+
+def test_run_concurrently_keeps_order_and_errors():
+    async def later():
+        await asyncio.sleep(0.01)
+        return "coroutine"
+
+    def fails():
+        raise ValueError("no such order")
+
+    results = asyncio.run(run_concurrently([later, lambda: "plain", fails]))
+
+    assert results[:2] == ["coroutine", "plain"]
+    assert isinstance(results[2], ValueError)
@@ -0,0 +1,40 @@
+from google.adk.events import Event
+from google.genai import types
+
+from emergency_room_agent.preparation import preparation_key, transcript_contents
+from emergency_room_agent.state import build_initial_state
+
+
+def _event(author, text):
+    return Event(author=author, content=types.Content(role="user" if author == "user" else "model",
+                                                      parts=[types.Part(text=text)]))
+
+
+def _user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def test_key_matches_the_request_adk_builds():
+    events = [
+        _event("user", "Give aspirin"),
+        _event("nurse_agent", "Aspirin given."),
+        _event("user", "Here is my SBAR"),
+        _event("doctor_agent", "Good work on the SBAR report."),
+    ]
+    state = build_initial_state("s1")
+    key = preparation_key(transcript_contents(events, "evaluator_agent"), state)
+
+    # How the evaluator's first request presents the same conversation
+    request_contents = [
+        _user("Give  aspirin"),
+        types.Content(role="user", parts=[types.Part(text="For context:"),
+                                          types.Part(text="[nurse_agent] called tool `acknowledge_orders`")]),
+        _user("Here is my SBAR"),
+        types.Content(role="user", parts=[types.Part(text="For context:"),
+                                          types.Part(text="[doctor_agent] said: Good work")]),
+    ]
+    assert preparation_key(request_contents, state) == key
+
+    assert preparation_key(request_contents + [_user("Wait, one more thing")], state) != key
+    moved_on = {**state, "states": {**state["states"], "current_stage": 4}}
+    assert preparation_key(request_contents, moved_on) != key
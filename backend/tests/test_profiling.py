@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from profiling import TurnProfiler
+
+
+def _busy(seconds=0.05):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+@pytest.mark.parametrize("mode, suffix", [("sampling", ".collapsed"), ("cprofile", ".prof")])
+def test_turn_files_are_tagged_and_summarized(tmp_path, mode, suffix):
+    profiler = TurnProfiler(mode, str(tmp_path), every=2, interval=0.001, top=3)
+    for _ in range(3):
+        with profiler.turn("3f2a9c1e-session", "S1_DIAGNOSTIC_CONFIRMATION") as turn:
+            _busy()
+            turn.agent = "nurse_agent"
+
+    # Every 2nd turn: the 1st and the 3rd
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"turn0001_3f2a9c1e_S1_DIAGNOSTIC_CONFIRMATION_nurse_agent{suffix}",
+        f"turn0003_3f2a9c1e_S1_DIAGNOSTIC_CONFIRMATION_nurse_agent{suffix}",
+    ]
+
+    summary = profiler.summary()
+    assert summary.startswith(f"Profiled 2 of 3 turns ({mode})")
+    assert "_busy" in summary
+    if mode == "sampling":
+        top = summary.split("waiting on I/O):\n", 1)[1].splitlines()
+        assert 1 <= len(top) <= 3
+        assert "test_profiling.py:_busy" in top[0]
@@ -0,0 +1,40 @@
+import asyncio
+
+from emergency_room_agent import resources
+from emergency_room_agent.resources import ResourceManager
+
+
+class _Transport:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class _AsyncClient:
+    def __init__(self, credentials=None):
+        self.transport = _Transport()
+
+
+def test_async_clients_are_pooled_per_loop_and_closed_on_release(monkeypatch):
+    monkeypatch.setattr(resources.speech, "SpeechAsyncClient", _AsyncClient)
+    manager = ResourceManager(pool_size=2)
+
+    async def first_loop():
+        clients = {id(manager.speech_async_client()) for _ in range(4)}
+        assert len(clients) == 2
+        return manager.speech_async_client()
+
+    async def second_loop():
+        client = manager.speech_async_client()
+        # The first loop is closed, its pool is gone
+        assert manager.get_stats()["event_loops"] == 1
+        await manager.release_loop()
+        return client
+
+    stale = asyncio.run(first_loop())
+    client = asyncio.run(second_loop())
+
+    assert client is not stale and client.transport.closed
+    assert manager.get_stats()["event_loops"] == 0
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from emergency_room_agent.response_cache import (
+    DEFAULT_STATE_KEYS,
+    ResponseCache,
+    ResponseCachePlugin,
+    normalize_request,
+)
+from emergency_room_agent.state import build_initial_state
+
+
+def _request(*parts, role="user"):
+    return LlmRequest(model="m", contents=[types.Content(role=role, parts=list(parts))])
+
+
+def _context(state, agent_name="nurse_agent"):
+    return SimpleNamespace(agent_name=agent_name, invocation_id="inv", state=state)
+
+
+def test_key_ignores_whitespace_and_call_ids_but_not_case():
+    def call(call_id):
+        return types.Part(function_call=types.FunctionCall(id=call_id, name="acknowledge_orders",
+                                                           args={"orders": "ASA"}))
+
+    assert normalize_request(_request(call("adk-1"), role="model")) == \
+        normalize_request(_request(call("adk-2"), role="model"))
+    assert normalize_request(_request(types.Part(text="Give  ASA\n now"))) == \
+        normalize_request(_request(types.Part(text="Give ASA now")))
+    assert normalize_request(_request(types.Part(text="Give ASA"))) != \
+        normalize_request(_request(types.Part(text="give asa")))
+
+
+def test_key_depends_only_on_allowlisted_state():
+    plugin = ResponseCachePlugin({"nurse_agent": DEFAULT_STATE_KEYS, "doctor_agent": ("states",)})
+    request = _request(types.Part(text="Give aspirin"))
+    state = build_initial_state("s1")
+    key = plugin.cache_key(_context(state), request)
+
+    assert plugin.cache_key(_context({**state, "session_id": "s2", "usage": {}}), request) == key
+    flags = {**state["session_flags"], "protocol_asa_given": True}
+    assert plugin.cache_key(_context({**state, "session_flags": flags}), request) != key
+    assert plugin.cache_key(_context(state, "doctor_agent"), request) != key
+    # The doctor doesn't depend on the flags
+    assert plugin.cache_key(_context({**state, "session_flags": flags}, "doctor_agent"), request) == \
+        plugin.cache_key(_context(state, "doctor_agent"), request)
+
+
+def test_repeat_is_served_without_the_call_id():
+    async def run():
+        plugin = ResponseCachePlugin({"nurse_agent": DEFAULT_STATE_KEYS})
+        context = _context(build_initial_state("s1"))
+        request = _request(types.Part(text="Give aspirin"))
+        response = LlmResponse(content=types.Content(role="model", parts=[types.Part(
+            function_call=types.FunctionCall(id="adk-1", name="acknowledge_orders", args={"orders": "ASA"})
+        )]))
+
+        assert await plugin.before_model_callback(callback_context=context, llm_request=request) is None
+        await plugin.after_model_callback(callback_context=context, llm_response=response)
+        cached = await plugin.before_model_callback(callback_context=context, llm_request=request)
+
+        call = cached.content.parts[0].function_call
+        assert (call.id, call.name, call.args) == (None, "acknowledge_orders", {"orders": "ASA"})
+        assert plugin.get_stats()["agents"]["nurse_agent"]["hits"] == 1
+        # Other agents aren't cached
+        other = _context(context.state, "doctor_agent")
+        assert await plugin.before_model_callback(callback_context=other, llm_request=request) is None
+
+    asyncio.run(run())
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put("a", "1111")
+    cache.put("b", "2222")
+    assert cache.get("a") == "1111"
+    cache.put("c", "3333")  # over max_entries: b is the least recently used
+    assert cache.get("b") is None and len(cache) == 2
+
+    cache.put("d", "444444")  # over max_bytes: a goes
+    assert cache.get("a") is None and cache.get("c") == "3333"
+    assert cache.get("d") == "444444"
+    cache.put("too big", "x" * 11)
+    assert cache.get("too big") is None
+    assert cache.stats.evictions == 2 and cache.stats.bytes_stored == 10
+
+    short = ResponseCache(ttl=0.01)
+    short.put("a", "1")
+    time.sleep(0.02)
+    assert short.get("a") is None
+    assert short.stats.expirations == 1 and len(short) == 0
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from emergency_room_agent.sub_agents.tts_agent.scheduler import (
+    INTERRUPTED,
+    PLAYED,
+    SUPERSEDED,
+    AudioOutputScheduler,
+)
+
+
+class _TTS:
+    """Synthesizes text as its bytes; playback takes play_s and is logged"""
+
+    def __init__(self, synth_s=0.0, play_s=0.02):
+        self.synth_s = synth_s
+        self.play_s = play_s
+        self.synthesizing = set()
+        self.log = []
+
+    async def synthesize_audio(self, text, emotion=None):
+        self.synthesizing.add(text)
+        try:
+            await asyncio.sleep(self.synth_s)
+        finally:
+            self.synthesizing.discard(text)
+        return text.encode()
+
+    async def _play_audio_file(self, audio):
+        text = audio.read().decode()
+        self.log.append(("start", text))
+        await asyncio.sleep(self.play_s)
+        self.log.append(("end", text))
+
+
+def _played(tts):
+    return [text for event, text in tts.log if event == "end"]
+
+
+def test_utterances_play_in_priority_order():
+    async def run():
+        tts = _TTS()
+        scheduler = AudioOutputScheduler(tts)
+        utterances = [
+            scheduler.enqueue("low", priority=2),
+            scheduler.enqueue("normal"),
+            scheduler.enqueue("urgent", emotion="urgent"),
+            scheduler.enqueue("normal again"),
+        ]
+        assert scheduler.queue_depth() == 4
+
+        assert [await utterance.wait() for utterance in utterances] == [PLAYED] * 4
+        assert _played(tts) == ["urgent", "normal", "normal again", "low"]
+
+        stats = scheduler.get_stats()
+        assert stats["queue_depth"] == 0 and stats["max_queue_depth"] == 4
+        assert stats["played"] == 4
+        assert stats["wait_ms_max"] >= stats["wait_ms_p50"] > 0
+        scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_newer_turn_supersedes_queued_utterances():
+    async def run():
+        tts = _TTS()
+        scheduler = AudioOutputScheduler(tts)
+        old = scheduler.enqueue("old", turn_id=1)
+        old_urgent = scheduler.enqueue("old urgent", emotion="urgent", turn_id=1)
+        new = scheduler.enqueue("new", turn_id=2)
+
+        assert await old.wait() == SUPERSEDED
+        assert await old_urgent.wait() == PLAYED
+        assert await new.wait() == PLAYED
+        assert _played(tts) == ["old urgent", "new"]
+        assert scheduler.get_stats()["superseded"] == 1
+        scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_preempted_utterance_plays_again_after_the_urgent_one():
+    async def run():
+        tts = _TTS(play_s=0.05)
+        scheduler = AudioOutputScheduler(tts)
+        normal = scheduler.enqueue("give aspirin")
+        later = scheduler.enqueue("and an ECG")
+        while ("start", "give aspirin") not in tts.log:
+            await asyncio.sleep(0.005)
+        urgent = scheduler.enqueue("patient is in VF", emotion="urgent")
+
+        assert [await u.wait() for u in (normal, later, urgent)] == [PLAYED] * 3
+        assert tts.log == [
+            ("start", "give aspirin"),
+            ("start", "patient is in VF"), ("end", "patient is in VF"),
+            ("start", "give aspirin"), ("end", "give aspirin"),
+            ("start", "and an ECG"), ("end", "and an ECG"),
+        ]
+        stats = scheduler.get_stats()
+        assert stats["preempted"] == 1 and stats["played"] == 3
+        # One wait sample per utterance, not per playback
+        assert len(scheduler.stats.wait_ms) == 3
+        scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_synthesis_stays_within_the_bound():
+    async def run():
+        tts = _TTS(synth_s=0.05)
+        scheduler = AudioOutputScheduler(tts, max_synthesis_ahead=2)
+        normal = [scheduler.enqueue(f"normal {i}") for i in range(2)]
+        await asyncio.sleep(0.01)
+        assert tts.synthesizing == {"normal 0", "normal 1"}
+
+        urgent = [scheduler.enqueue(f"urgent {i}", emotion="urgent") for i in range(2)]
+        await asyncio.sleep(0.01)
+        assert tts.synthesizing == {"urgent 0", "urgent 1"}
+        assert sum(1 for u in scheduler._queue if u.synthesis is not None) == 2
+
+        assert [await u.wait() for u in urgent + normal] == [PLAYED] * 4
+        assert _played(tts) == ["urgent 0", "urgent 1", "normal 0", "normal 1"]
+        scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_interrupt_drops_current_and_queued():
+    async def run():
+        tts = _TTS(play_s=1.0)
+        scheduler = AudioOutputScheduler(tts)
+        utterances = [scheduler.enqueue(f"line {i}") for i in range(3)]
+        while not tts.log:
+            await asyncio.sleep(0.005)
+
+        scheduler.interrupt()
+
+        assert [await u.wait() for u in utterances] == [INTERRUPTED] * 3
+        await asyncio.sleep(0.01)
+        assert _played(tts) == []
+        stats = scheduler.get_stats()
+        assert stats["interrupted"] == 3 and stats["preempted"] == 0
+        assert stats["queue_depth"] == 0 and not stats["playing"]
+        scheduler.close()
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from emergency_room_agent.speculation import SpeculativeTurnRunner
+from emergency_room_agent.state import build_initial_state
+from emergency_room_agent.usage import UsagePlugin, empty_usage
+
+PRICES = {"primary": (1.0, 1.0), "fallback": (1.0, 1.0)}
+# Models the stub was called with
+models = []
+
+
+class _StubLlm(BaseLlm):
+    """Records the model of each request; fails on "boom" """
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        models.append(llm_request.model)
+        if "boom" in llm_request.contents[-1].parts[0].text:
+            raise RuntimeError("model unavailable")
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text="Aspirin given.")]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=1000,
+                                                                      candidates_token_count=0),
+            model_version=llm_request.model,
+        )
+
+
+async def _setup(state):
+    usage = UsagePlugin(PRICES, soft_budget_usd=0.01, fallback_model="fallback")
+    runner = Runner(agent=LlmAgent(name="nurse_agent", model=_StubLlm(model="primary")),
+                    app_name="app", session_service=InMemorySessionService(), plugins=[usage])
+    await runner.session_service.create_session(app_name="app", user_id="u", session_id="s1", state=state)
+    return runner, usage, SpeculativeTurnRunner(runner, stability_window=0.01, usage=usage)
+
+
+async def _session(runner):
+    return await runner.session_service.get_session(app_name="app", user_id="u", session_id="s1")
+
+
+def test_committed_speculation_follows_the_budget_and_is_charged():
+    async def run():
+        models.clear()
+        over_budget = empty_usage()
+        over_budget["totals"]["cost_usd"] = 0.02
+        runner, usage, speculator = await _setup({**build_initial_state("s1"), "usage": over_budget})
+
+        speculator.on_interim("u", "s1", "give aspirin")
+        await asyncio.sleep(0.1)
+        events = await speculator.run_final("u", "s1", "Give aspirin.")
+
+        assert speculator.get_stats()["hits"] == 1
+        assert [event.author for event in events] == ["nurse_agent"]
+        assert models == ["fallback"]
+        assert usage.get_stats()["unbilled_sessions"] == 1
+
+        # The committed call is added with the session's next event
+        async for _ in runner.run_async(user_id="u", session_id="s1", new_message=types.Content(
+                role="user", parts=[types.Part(text="Order an ECG")])):
+            pass
+        totals = (await _session(runner)).state["usage"]["totals"]
+        assert totals["model_calls"] == 2
+        assert totals["cost_usd"] == 0.02 + 0.002
+
+    asyncio.run(run())
+
+
+def test_discarded_speculation_errors_are_logged(capsys):
+    async def run():
+        models.clear()
+        runner, usage, speculator = await _setup(build_initial_state("s1"))
+
+        speculator.on_interim("u", "s1", "boom")
+        await asyncio.sleep(0.1)
+        events = await speculator.run_final("u", "s1", "Give aspirin")
+        await asyncio.sleep(0)
+
+        assert speculator.get_stats()["misses"] == 1
+        assert [event.author for event in events] == ["nurse_agent"]
+        assert models == ["primary", "primary"]
+        # Only the real turn was charged
+        assert (await _session(runner)).state["usage"]["totals"]["model_calls"] == 1
+
+    asyncio.run(run())
+    assert "Error in discarded speculative turn: model unavailable" in capsys.readouterr().out
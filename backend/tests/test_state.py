@@ -0,0 +1,35 @@
+from emergency_room_agent import state
+from emergency_room_agent.state import SCENARIOS, PatientRecord, SessionState, build_initial_state
+
+
+def test_unknown_flags_and_stage_keys_round_trip():
+    adk = build_initial_state("s1", module_id=3)
+    adk["session_flags"] = {**adk["session_flags"], "protocol_heparin_given": True}
+    adk["states"] = {**adk["states"], "stage_started_at": 12.5}
+
+    parsed = SessionState.from_adk_dict(adk)
+
+    assert parsed.extra_flags == {"protocol_heparin_given": True}
+    assert parsed.extra_states == {"stage_started_at": 12.5}
+    assert parsed.to_adk_dict() == adk
+
+
+def test_only_scenario_patients_are_interned():
+    adk = build_initial_state("s1")
+    assert SessionState.from_adk_dict(adk).patient is SCENARIOS["stemi"]
+
+    known = len(state._PATIENTS)
+    for i in range(5):
+        patient = PatientRecord.from_dict({**adk["patient_information"], "patient_name": f"Patient {i}"})
+        custom = {**adk, "patient_information": patient.to_dict()}
+        assert SessionState.from_adk_dict(custom).to_adk_dict() == custom
+
+    assert len(state._PATIENTS) == known
+    assert len(state._PATIENT_DICTS) <= known
+
+
+def test_shared_stage_list_is_immutable():
+    first, second = build_initial_state("s1"), build_initial_state("s2")
+    assert first["states"]["stages"] is second["states"]["stages"]
+    assert isinstance(first["states"]["stages"], tuple)
+    assert SessionState.from_adk_dict({**first, "states": {**first["states"], "stages": list(state.STAGE_NAMES)}})
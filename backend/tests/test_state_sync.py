@@ -0,0 +1,77 @@
+import asyncio
+
+from emergency_room_agent.state_sync import StateLog
+
+KEY = ("app", "trainee", "s1")
+
+
+def test_seeded_session_is_unchanged_at_its_version():
+    log = StateLog()
+    log.seed(KEY, 7)
+
+    assert log.changes_since(KEY, 7) == (7, {})
+    # Changes before the seed were never logged
+    assert log.changes_since(KEY, 6) == (7, None)
+
+
+def test_deltas_merge_by_top_level_key():
+    log = StateLog()
+    log.seed(KEY, 0)
+    log.record(KEY, 1, {"session_flags": {"protocol_asa_given": True}, "state_version": 1})
+    log.record(KEY, 2, {"states": {"current_stage": 1}, "state_version": 2})
+    log.record(KEY, 3, {"session_flags": {"protocol_asa_given": True, "protocol_ecg_ordered": True},
+                        "state_version": 3})
+
+    assert log.changes_since(KEY, 1) == (3, {
+        "states": {"current_stage": 1},
+        "session_flags": {"protocol_asa_given": True, "protocol_ecg_ordered": True},
+        "state_version": 3,
+    })
+    assert log.changes_since(KEY, 0)[1]["state_version"] == 3
+
+
+def test_too_old_and_unknown_versions_resync():
+    log = StateLog(max_deltas=2)
+    log.seed(KEY, 0)
+    for version in range(1, 5):
+        log.record(KEY, version, {"n": version})
+
+    assert log.changes_since(KEY, 2) == (4, {"n": 4})
+    assert log.changes_since(KEY, 1) == (4, None)   # delta 2 was dropped
+    assert log.changes_since(KEY, 9) == (4, None)   # newer than the log
+    assert log.changes_since(("app", "trainee", "other"), 0) == (None, None)
+    assert log.get_stats()["resyncs"] == 3
+
+
+def test_skipped_versions_clear_the_log():
+    log = StateLog()
+    log.seed(KEY, 0)
+    log.record(KEY, 1, {"n": 1})
+    # e.g. another copy of the session advanced it without this log
+    log.record(KEY, 5, {"n": 5})
+
+    assert log.changes_since(KEY, 4) == (5, {"n": 5})
+    assert log.changes_since(KEY, 1) == (5, None)
+
+
+def test_oldest_sessions_are_dropped():
+    log = StateLog(max_sessions=2)
+    for session in ("a", "b", "c"):
+        log.seed(("app", "trainee", session), 0)
+
+    assert log.version(("app", "trainee", "a")) is None
+    assert log.get_stats()["sessions"] == 2
+
+
+def test_wait_for_change_wakes_on_record():
+    async def run():
+        log = StateLog()
+        log.seed(KEY, 3)
+        waiter = asyncio.create_task(log.wait_for_change(KEY, 3, timeout=1.0))
+        await asyncio.sleep(0)
+        log.record(KEY, 4, {"n": 4})
+
+        assert await waiter
+        assert not await log.wait_for_change(KEY, 4, timeout=0.01)
+
+    asyncio.run(run())
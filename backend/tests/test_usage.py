@@ -0,0 +1,133 @@
+import asyncio
+from types import SimpleNamespace
+
+from google.adk.events import Event, EventActions
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from emergency_room_agent.hedging import RequestHedger
+from emergency_room_agent.state import build_initial_state
+from emergency_room_agent.usage import UsagePlugin, set_current_call
+
+PRICES = {"primary": (1.0, 1.0), "fast": (1.0, 1.0)}
+
+
+def _metadata(prompt, output=0):
+    return types.GenerateContentResponseUsageMetadata(prompt_token_count=prompt, candidates_token_count=output)
+
+
+async def _next_event(plugin, session, author="nurse_agent"):
+    event = Event(invocation_id="inv", author=author, actions=EventActions())
+    await plugin.on_event_callback(invocation_context=SimpleNamespace(session=session), event=event)
+    return event.actions.state_delta.get("usage")
+
+
+def test_charged_calls_are_added_with_the_next_event():
+    async def run():
+        plugin = UsagePlugin(PRICES)
+        session = SimpleNamespace(id="s1", state=build_initial_state("s1"))
+        plugin.charge("s1", "evaluator_agent", "primary", _metadata(1000, 500))
+
+        usage = await _next_event(plugin, session)
+
+        assert usage["totals"]["model_calls"] == 1
+        assert usage["by_agent"]["evaluator_agent"]["prompt_tokens"] == 1000
+        assert usage["totals"]["cost_usd"] == 0.0015
+        assert plugin.get_stats()["unbilled_sessions"] == 0
+        assert await _next_event(plugin, session) is None
+
+    asyncio.run(run())
+
+
+class _StubLlm(BaseLlm):
+    """Answers requests for "fast" at once and stalls the others"""
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        await asyncio.sleep(0 if llm_request.model == "fast" else 10)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text="ok")]),
+            usage_metadata=_metadata(200, 10),
+        )
+
+
+def test_losing_hedge_attempt_is_charged():
+    async def run():
+        plugin = UsagePlugin(PRICES)
+        hedger = RequestHedger(budget=1.0, initial_delay=0.01, min_delay=0.01, hedge_model="fast")
+        model = hedger.wrap(_StubLlm(model="primary"))
+        set_current_call(plugin, "s1", "nurse_agent")
+
+        request = LlmRequest(model="primary", contents=[types.Content(role="user", parts=[types.Part(text="hi")])])
+        responses = [response async for response in model.generate_content_async(request)]
+        await asyncio.sleep(0.01)
+
+        assert responses[0].usage_metadata.prompt_token_count == 200
+        # The stalled primary was cut off: charged for its prompt only
+        assert plugin._unbilled["s1"] == [("nurse_agent", "primary", {
+            "model_calls": 1, "prompt_tokens": 200, "cached_tokens": 0,
+            "output_tokens": 0, "thoughts_tokens": 0, "cost_usd": 0.0002,
+        })]
+
+    asyncio.run(run())
+
+
+def _request(turns):
+    contents = []
+    for i in range(turns):
+        contents.append(types.Content(role="user", parts=[types.Part(text=f"question {i}")]))
+        contents.append(types.Content(role="model", parts=[types.Part(text=f"answer {i}")]))
+    return LlmRequest(model="primary", contents=contents)
+
+
+async def _before_model(plugin, cost_usd, request):
+    usage = {"totals": {"cost_usd": cost_usd}}
+    context = SimpleNamespace(state={"usage": usage}, invocation_id="inv", agent_name="nurse_agent",
+                              session=SimpleNamespace(id="s1"))
+    await plugin.before_model_callback(callback_context=context, llm_request=request)
+
+
+def test_soft_budget_switches_to_the_fallback_model():
+    async def run():
+        plugin = UsagePlugin(PRICES, soft_budget_usd=0.01, hard_budget_usd=1.0, fallback_model="fast", keep_turns=2)
+        under, over = _request(6), _request(6)
+        await _before_model(plugin, 0.005, under)
+        await _before_model(plugin, 0.02, over)
+
+        assert under.model == "primary"
+        assert over.model == "fast"
+        assert len(over.contents) == 12  # not compacted below the hard budget
+        assert plugin.get_stats()["fallback_calls"] == 1
+        assert plugin.get_stats()["compacted_calls"] == 0
+
+    asyncio.run(run())
+
+
+def test_hard_budget_compacts_the_prompt():
+    async def run():
+        plugin = UsagePlugin(PRICES, soft_budget_usd=0.01, hard_budget_usd=1.0, fallback_model="fast", keep_turns=2)
+        request = _request(6)
+        await _before_model(plugin, 1.5, request)
+
+        assert request.model == "fast"
+        assert [content.parts[0].text for content in request.contents] == [
+            "[8 earlier messages were left out to keep this session within its budget]",
+            "question 4", "answer 4", "question 5", "answer 5",
+        ]
+        assert plugin._pending[("inv", "nurse_agent")] == ("fast", ["fallback", "compacted"])
+        assert plugin.get_stats()["compacted_calls"] == 1
+
+    asyncio.run(run())
+
+
+def test_usage_of_an_unknown_stage_is_kept():
+    async def run():
+        plugin = UsagePlugin(PRICES)
+        state = build_initial_state("s1")
+        state["states"]["current_stage"] = 99
+        plugin.charge("s1", "nurse_agent", "primary", _metadata(1000))
+
+        usage = await _next_event(plugin, SimpleNamespace(id="s1", state=state))
+
+        assert usage["by_stage"] == {"99": usage["totals"]}
+
+    asyncio.run(run())
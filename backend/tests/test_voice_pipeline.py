@@ -0,0 +1,213 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pyaudio")
+pytest.importorskip("google.cloud.speech")
+
+from google.adk.events import Event
+from google.genai import types
+
+from emergency_room_agent.voice_pipeline import Packet, Stage, Utterance, VoicePipeline
+
+
+class _STT:
+    """Recognizes each audio chunk as one utterance: its bytes are the words"""
+
+    echo_gate = None
+    sample_rate = 16000
+
+    async def recognize_stream(self, audio_chunks, on_transcript, on_final, sample_rate, on_speech_start):
+        async for chunk in audio_chunks:
+            await on_speech_start()
+            on_transcript(chunk.decode())
+            await on_final(chunk.decode())
+
+    def stop_listening(self):
+        pass
+
+
+class _Runner:
+    """Replies "<message>. Done." after delays[message] seconds"""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+
+    async def run_async(self, user_id, session_id, new_message):
+        message = new_message.parts[0].text
+        await asyncio.sleep(self.delays.get(message, 0))
+        yield Event(author="nurse_agent", content=types.Content(
+            role="model", parts=[types.Part(text=f"{message}. Done.")]))
+
+
+class _TTS:
+    """Synthesis is the text; playback takes play_s and is logged"""
+
+    def __init__(self, play_s=0.01, stubborn=False):
+        self.play_s = play_s
+        self.stubborn = stubborn
+        self.played = []
+
+    async def synthesize_audio(self, text, encoding):
+        await asyncio.sleep(0)
+        return text
+
+    async def play_audio(self, audio):
+        try:
+            await asyncio.sleep(self.play_s)
+        except asyncio.CancelledError:
+            if self.stubborn:
+                await asyncio.sleep(0.2)  # e.g. a device write that has to finish
+            raise
+        self.played.append(audio)
+
+
+async def _source(*chunks, gap=0.0):
+    for chunk in chunks:
+        await asyncio.sleep(gap)
+        yield chunk.encode()
+
+
+def _pipeline(source, runner=None, tts=None, **kwargs):
+    return VoicePipeline(runner or _Runner(), "u", "s1", _STT(), tts or _TTS(), source=source, **kwargs)
+
+
+def _packet(value, utterance_id=1):
+    return Packet(Utterance(utterance_id, "hi", 0.0), value)
+
+
+def test_outputs_keep_input_order_under_concurrency():
+    async def run():
+        received = []
+
+        async def slow_first(packet):
+            await asyncio.sleep(0.05 - packet.value * 0.01)
+            yield packet.value
+
+        async def sink(packet):
+            received.append(packet.value)
+            yield None
+
+        stage = Stage("work", slow_first, queue_size=10, concurrency=3)
+        stage.downstream = Stage("sink", sink, queue_size=10)
+        tasks = [asyncio.create_task(stage.run()), asyncio.create_task(stage.downstream.run())]
+        for value in range(5):
+            await stage.put(_packet(value))
+        await stage.close()
+        await asyncio.gather(*tasks)
+
+        assert received == [0, 1, 2, 3, 4]
+        assert stage.get_stats()["processed"] == 5
+
+    asyncio.run(run())
+
+
+def test_full_downstream_queue_holds_back_the_stage():
+    async def run():
+        release = asyncio.Event()
+        received = []
+
+        async def passthrough(packet):
+            yield packet.value
+
+        async def blocked_sink(packet):
+            await release.wait()
+            received.append(packet.value)
+            yield None
+
+        stage = Stage("work", passthrough, queue_size=20, concurrency=2)
+        stage.downstream = Stage("sink", blocked_sink, queue_size=1)
+        tasks = [asyncio.create_task(stage.run()), asyncio.create_task(stage.downstream.run())]
+        for value in range(10):
+            await stage.put(_packet(value))
+        await asyncio.sleep(0.05)
+
+        # One in the sink, one in its queue, two holding this stage's slots
+        assert stage.stats.processed == 4
+        assert stage.inbox.qsize() == 6
+        assert stage.downstream.get_stats()["max_queue_depth"] == 1
+
+        release.set()
+        await stage.close()
+        await asyncio.gather(*tasks)
+        assert received == list(range(10))
+
+    asyncio.run(run())
+
+
+def test_agent_stage_runs_one_turn_at_a_time():
+    with pytest.raises(ValueError, match="Agent stage concurrency must be 1"):
+        _pipeline(_source(), concurrency={"agent": 2})
+    pipeline = _pipeline(_source(), concurrency={"synthesis": 3})
+    assert [stage.concurrency for stage in pipeline.stages] == [1, 3, 1]
+
+
+def test_replies_are_played_sentence_by_sentence_with_latency_stats():
+    async def run():
+        tts = _TTS()
+        pipeline = _pipeline(_source("Give aspirin", "Order an ECG", gap=0.05), tts=tts)
+        await pipeline.run()
+
+        assert tts.played == ["Give aspirin.", "Done.", "Order an ECG.", "Done."]
+        stats = pipeline.get_stats()
+        assert stats["utterances"] == 2 and stats["interruptions"] == 0
+        assert stats["stages"]["playback"]["processed"] == 4
+        assert len(pipeline.mouth_to_ear_ms) == 2
+        assert stats["mouth_to_ear_ms_p50"] > 0
+        assert set(stats["breakdown_ms_p50"]) == {"recognition", "agent", "synthesis", "playback"}
+        # The stages' shares add up to the mouth-to-ear latency
+        assert sum(samples[-1] for samples in pipeline.breakdown_ms.values()) == \
+            pytest.approx(pipeline.mouth_to_ear_ms[-1])
+
+    asyncio.run(run())
+
+
+def test_barge_in_cancels_the_turn_in_progress():
+    async def run():
+        tts = _TTS()
+        runner = _Runner({"Give aspirin": 1.0})
+        pipeline = _pipeline(_source("Give aspirin", "Actually wait", gap=0.05), runner=runner, tts=tts)
+        await asyncio.wait_for(pipeline.run(), timeout=0.5)
+
+        assert tts.played == ["Actually wait.", "Done."]
+        stats = pipeline.get_stats()
+        assert stats["interruptions"] == 1
+        assert stats["cancelled_tasks"] == 1 and stats["slow_cancellations"] == 0
+        assert stats["stages"]["agent"]["dropped"] == 1
+
+    asyncio.run(run())
+
+
+def test_no_barge_in_keeps_replies():
+    async def run():
+        tts = _TTS()
+        runner = _Runner({"Give aspirin": 0.1})
+        pipeline = _pipeline(_source("Give aspirin", "Actually wait", gap=0.05), runner=runner, tts=tts,
+                             barge_in=False)
+        await pipeline.run()
+
+        assert tts.played == ["Give aspirin.", "Done.", "Actually wait.", "Done."]
+        assert pipeline.get_stats()["interruptions"] == 0
+
+    asyncio.run(run())
+
+
+def test_interrupt_counts_slow_cancellations():
+    async def run():
+        tts = _TTS(play_s=1.0, stubborn=True)
+        pipeline = _pipeline(_source("Give aspirin"), tts=tts, barge_in=False, cancel_timeout=0.05)
+        running = asyncio.create_task(pipeline.run())
+        while not pipeline.stages[2]._work:
+            await asyncio.sleep(0.005)
+
+        assert await pipeline.interrupt() == 1
+        assert await pipeline.interrupt() == 0  # nothing new since
+        stats = pipeline.get_stats()
+        assert stats["cancelled_tasks"] == 1 and stats["slow_cancellations"] == 1
+        assert stats["cancel_ms_p95"] >= 50
+
+        await running
+        assert tts.played == []
+        assert pipeline.get_stats()["stages"]["playback"]["dropped"] >= 1
+
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+import asyncio
+
+from google.adk.events import Event
+from google.genai import types
+
+from emergency_room_agent.state import build_initial_state
+from worker import Worker
+
+
+class _Runner:
+    """Turns of session "busy" take a while, the others answer at once"""
+
+    app_name = "app"
+    session_service = None
+
+    async def run_async(self, user_id, session_id, new_message):
+        await asyncio.sleep(0.05 if session_id == "busy" else 0)
+        yield Event(author="nurse_agent", content=types.Content(role="model", parts=[types.Part(text="ok")]))
+
+
+def test_busy_session_does_not_hold_the_slots():
+    async def run():
+        worker = Worker(_Runner(), build_initial_state, max_concurrency=2)
+        replies = []
+
+        async def send(message):
+            replies.append((message["id"], message["type"]))
+
+        burst = [worker.submit({"id": f"busy{i}", "op": "run", "session_id": "busy", "message": "hi"}, send)
+                 for i in range(4)]
+        await asyncio.sleep(0)
+        other = worker.submit({"id": "other", "op": "run", "session_id": "other", "message": "hi"}, send)
+
+        await asyncio.wait_for(other, timeout=0.04)
+        assert ("other", "done") in replies
+        assert worker.get_stats()["busy_sessions"] == 1
+
+        await asyncio.gather(*burst)
+        assert [request_id for request_id, kind in replies if kind == "done"] == \
+            ["other", "busy0", "busy1", "busy2", "busy3"]
+        assert worker.get_stats()["max_in_flight"] == 2
+
+    asyncio.run(run())
@@ -8,6 +8,8 @@ from io import StringIO
 
 from google.genai import types
 
+from emergency_room_agent.admission import AdmissionRejected
+
 # Suppress ADK warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 os.environ["PYTHONWARNINGS"] = "ignore"
@@ -242,10 +244,19 @@ async def call_agent_async_json(runner, user_id, session_id, query):
                     final_response = response_data
                     
         except Exception as e:
-            final_response = {
-                "author": "system",
-                "message": f"Error during agent call: {e}"
-            }
+            # ADK wraps exceptions raised in plugins in a RuntimeError
+            error = e.__cause__ if isinstance(e.__cause__, AdmissionRejected) else e
+            if isinstance(error, AdmissionRejected):
+                final_response = {
+                    "author": "system",
+                    "message": f"The simulation is busy right now, please try again in {error.retry_after} seconds.",
+                    "retry_after": error.retry_after
+                }
+            else:
+                final_response = {
+                    "author": "system",
+                    "message": f"Error during agent call: {e.__cause__ or e}"
+                }
     
     # Print ONLY the final JSON response - nothing else
     if final_response:
@@ -0,0 +1,356 @@
+"""
+Multiplexed JSON-lines worker: one process serving many sessions.
+
+    python main.py --worker                          # stdin / stdout
+    python main.py --worker --socket /tmp/er.sock    # Unix socket
+
+Requests are one JSON object per line, each with a client-chosen "id":
+
+    {"id": "1", "op": "create_session", "user_id": "u1", "state": {"cohort": "A"}}
+    {"id": "2", "op": "run", "user_id": "u1", "session_id": "...", "message": "Check his vitals"}
+    {"id": "3", "op": "get_state", "user_id": "u1", "session_id": "...", "since": 12}
+    {"id": "4", "op": "stats"}
+    {"id": "5", "op": "drain"}
+
+Requests run concurrently on one event loop with the shared Runner; turns of
+the same session run one at a time, in arrival order, and wait for their
+session's turn before taking one of the max_concurrency slots, so a burst on
+one session does not hold slots the others could use. Responses are tagged
+with the request and session id and may come back out of order. A run
+streams an "event" line per agent reply before its "done" line; failures
+end with an "error" line instead:
+
+    {"id": "2", "session_id": "...", "type": "event", "author": "nurse_agent", "message": "..."}
+    {"id": "2", "session_id": "...", "type": "done", "response": {"author": "nurse_agent", "message": "..."}}
+    {"id": "2", "session_id": "...", "type": "error", "error": "...", "retry_after": 4.0}
+
+get_state with "since" (a state_version) replies with just the changes,
+{"version": 14, "delta": {...}}, when they are still known, else with the
+full state as without it.
+
+On a drain request, end of stdin, SIGTERM or SIGINT the worker stops taking
+requests, lets the in-flight ones finish (up to drain_timeout) and exits.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import sys
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from google.adk.runners import Runner
+from google.genai import types
+
+from emergency_room_agent.admission import AdmissionRejected
+from emergency_room_agent.state import build_initial_state
+from emergency_room_agent.state_sync import VERSION_KEY
+from utils import process_agent_response_json
+
+# Longest request line accepted
+MAX_LINE = 1 << 20
+
+Send = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class WorkerStats:
+    requests: int = 0
+    completed: int = 0
+    errors: int = 0
+    rejected: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    connections: int = 0
+
+
+class Worker:
+    def __init__(self,
+                 runner: Runner,
+                 initial_state: Callable[..., dict] = build_initial_state,
+                 max_concurrency: int = 64,
+                 drain_timeout: float = 30.0,
+                 default_user_id: str = "trainee",
+                 reports: Dict[str, Callable[[], dict]] = None):
+        """
+        Serve create_session / run / get_state requests for many sessions
+
+        Args:
+            runner: Shared runner; its app name and session service are used
+            initial_state: Builds a new session's state from its id and the
+                request's "state" fields
+            max_concurrency: Requests executed at once (others wait)
+            drain_timeout: Seconds in-flight requests get to finish on drain
+            default_user_id: User id for requests that don't name one
+            reports: Extra stats included in the "stats" reply, by name
+                (e.g. {"hedging": hedger.get_stats})
+        """
+        self.runner = runner
+        self.session_service = runner.session_service
+        self.app_name = runner.app_name
+        self.initial_state = initial_state
+        self.max_concurrency = max_concurrency
+        self.drain_timeout = drain_timeout
+        self.default_user_id = default_user_id
+        self.reports = reports or {}
+        self.stats = WorkerStats()
+        self.draining = False
+        self.drained = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        # Drain requests, which wait for the others rather than being waited for
+        self._drain_requests: Set[asyncio.Task] = set()
+        # One lock per session with queued or running turns
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._drain_task: Optional[asyncio.Task] = None
+        # Open connections: serving task -> writer
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._started = time.monotonic()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Read requests from one connection until it closes or the worker drains"""
+        self.stats.connections += 1
+        self._connections[asyncio.current_task()] = writer
+        write_lock = asyncio.Lock()
+
+        async def send(message: dict):
+            line = json.dumps(message, default=str) + "\n"
+            try:
+                async with write_lock:
+                    writer.write(line.encode())
+                    await writer.drain()
+            except (ConnectionError, RuntimeError) as e:
+                print(f"Error sending worker response: {e}", file=sys.stderr)
+
+        try:
+            while not self.draining:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await send({"id": None, "type": "error", "error": f"Request longer than {MAX_LINE} bytes"})
+                    continue
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    await send({"id": None, "type": "error", "error": f"Invalid request: {e}"})
+                    continue
+                self.submit(request, send)
+        finally:
+            self.stats.connections -= 1
+            self._connections.pop(asyncio.current_task(), None)
+
+    def submit(self, request: dict, send: Send) -> asyncio.Task:
+        """Start handling a request; responses go to send"""
+        self.stats.requests += 1
+        task = asyncio.create_task(self._handle(request, send))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _handle(self, request: dict, send: Send):
+        request_id = request.get("id")
+        session_id = request.get("session_id")
+
+        async def reply(kind: str, **fields):
+            await send({"id": request_id, "session_id": session_id, "type": kind, **fields})
+
+        op = request.get("op")
+        if op == "drain":
+            self._drain_requests.add(asyncio.current_task())
+            self.request_drain()
+            await asyncio.shield(self._drain_task)
+            await reply("done", stats=self.get_stats())
+            return
+        handler = {
+            "create_session": self._create_session,
+            "run": self._run,
+            "get_state": self._get_state,
+            "stats": self._stats,
+        }.get(op)
+        if handler is None:
+            self.stats.errors += 1
+            await reply("error", error=f"Unknown op: {op}")
+            return
+        if self.draining:
+            self.stats.rejected += 1
+            await reply("error", error="Worker is draining")
+            return
+
+        # Session first, so queued turns of a busy session don't hold slots
+        session_lock = self._session_lock(session_id) if op == "run" and session_id else contextlib.nullcontext()
+        async with session_lock, self._slots:
+            self.stats.in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+            try:
+                await handler(request, reply)
+                self.stats.completed += 1
+            except asyncio.CancelledError:
+                self.stats.errors += 1
+                await reply("error", error="Cancelled while draining")
+            except KeyError as e:
+                self.stats.errors += 1
+                await reply("error", error=f"Missing field: {e}")
+            except Exception as e:
+                self.stats.errors += 1
+                # ADK wraps exceptions raised in plugins in a RuntimeError
+                error = e.__cause__ if isinstance(e.__cause__, AdmissionRejected) else e
+                if isinstance(error, AdmissionRejected):
+                    await reply("error", error="The simulation is busy right now", retry_after=error.retry_after)
+                else:
+                    await reply("error", error=str(e.__cause__ or e))
+            finally:
+                self.stats.in_flight -= 1
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def _create_session(self, request: dict, reply):
+        session_id = request.get("session_id") or str(uuid.uuid4())
+        session = await self.session_service.create_session(
+            app_name=self.app_name,
+            user_id=request.get("user_id", self.default_user_id),
+            session_id=session_id,
+            state=self.initial_state(session_id, **request.get("state", {})),
+        )
+        await reply("done", session_id=session.id)
+
+    async def _run(self, request: dict, reply):
+        session_id = request["session_id"]
+        content = types.Content(role="user", parts=[types.Part(text=request["message"])])
+
+        # Holds the session's lock (see _handle)
+        final_response = None
+        async for event in self.runner.run_async(
+            user_id=request.get("user_id", self.default_user_id),
+            session_id=session_id,
+            new_message=content,
+        ):
+            response = await process_agent_response_json(event)
+            if response:
+                final_response = response
+                await reply("event", **response)
+        await reply("done", response=final_response)
+
+    async def _get_state(self, request: dict, reply):
+        state_log = getattr(self.session_service, "state_log", None)
+        if request.get("since") is not None and state_log is not None:
+            key = (self.app_name, request.get("user_id", self.default_user_id), request["session_id"])
+            version, delta = state_log.changes_since(key, request["since"])
+            if delta is not None:
+                await reply("done", version=version, delta=delta)
+                return
+        session = await self.session_service.get_session(
+            app_name=self.app_name,
+            user_id=request.get("user_id", self.default_user_id),
+            session_id=request["session_id"],
+        )
+        if session is None:
+            raise ValueError(f"Session not found: {request['session_id']}")
+        await reply("done", state=session.state, version=session.state.get(VERSION_KEY, 0))
+
+    async def _stats(self, request: dict, reply):
+        await reply("done", stats=self.get_stats())
+
+    def request_drain(self):
+        """Start draining (e.g. from a signal handler)"""
+        # Set right away, so requests read in the meantime are refused
+        self.draining = True
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self.drain())
+
+    async def drain(self):
+        """Stop taking requests and wait for the in-flight ones"""
+        self.draining = True
+        pending = self._tasks - self._drain_requests
+        if pending:
+            print(f"Draining {len(pending)} request(s)...", file=sys.stderr)
+            _, unfinished = await asyncio.wait(pending, timeout=self.drain_timeout)
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.wait(unfinished, timeout=1.0)
+        self.drained.set()
+
+    async def wait_drained(self):
+        """Wait until drained and drain requests have been answered"""
+        await self.drained.wait()
+        await asyncio.gather(*self._drain_requests, return_exceptions=True)
+
+    async def close_connections(self):
+        """Close the open connections, so their serve() calls return"""
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            **asdict(self.stats),
+            "draining": self.draining,
+            # Sessions with turns queued or running
+            "busy_sessions": len(self._session_locks),
+            "uptime_s": round(time.monotonic() - self._started, 1),
+            **{name: report() for name, report in self.reports.items()},
+        }
+
+
+async def stdio_streams():
+    """
+    Reader on stdin and writer on stdout (pipes, as spawned by Node)
+
+    print() output from the agents and plugins goes to stderr from here on,
+    so stdout carries only protocol lines.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_LINE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+    sys.stdout = sys.stderr
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, out)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return reader, writer
+
+
+async def run_worker(worker: Worker, socket_path: str = None):
+    """Serve stdin / stdout, or a Unix socket, until drained"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.request_drain)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(worker.serve, path=socket_path, limit=MAX_LINE)
+        print(f"Worker listening on {socket_path}", file=sys.stderr)
+        try:
+            await worker.wait_drained()
+        finally:
+            server.close()
+            await worker.close_connections()
+            await server.wait_closed()
+            os.unlink(socket_path)
+    else:
+        reader, writer = await stdio_streams()
+        serving = asyncio.create_task(worker.serve(reader, writer))
+        drained = asyncio.create_task(worker.drained.wait())
+        # End of input drains too: requests already read still complete
+        await asyncio.wait({serving, drained}, return_when=asyncio.FIRST_COMPLETED)
+        worker.request_drain()
+        await worker.wait_drained()
+        serving.cancel()
+        drained.cancel()
+        writer.close()
+    print(json.dumps(worker.get_stats()), file=sys.stderr)